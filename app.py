@@ -1,18 +1,160 @@
 import flet as ft
-from models.template_models import TemplateBuilder
-from utils.persistence import TemplateStorage
-from utils.template_initializer import initialize_templates
+from models.template_models import (
+    PLATFORM_ADDED, PLATFORM_REMOVED, TEMPLATE_CHANGED, TYPE_ADDED, TYPE_REMOVED
+)
+from utils.template_repository import get_repository
+from utils.message_renderer import render_segments
+from utils.template_engine import template_engine
+from utils.preview_scheduler import PreviewScheduler, DEFAULT_DEBOUNCE_SECONDS
+from utils.field_detector import FieldDetector
+from utils.field_history import get_field_history
+from utils.metrics import METRICS_ENABLED, install_exporters, timed, timed_handlers
+from utils.leak_diagnostics import LEAK_DIAGNOSTICS_ENABLED, LeakTracker
 
+# Número máximo de resultados que muestra el buscador de mensajes
+SEARCH_RESULTS_LIMIT = 10
+
+# Filas que se cargan de una vez en las listas de configuración
+LIST_PAGE_SIZE = 50
+
+# Valores usados antes que se sugieren al escribir en un campo
+FIELD_SUGGESTIONS_LIMIT = 5
+
+def dropdown_options(keys):
+    return [ft.dropdown.Option(key=key, text=key) for key in keys]
+
+def add_dropdown_option(dropdown, key):
+    # Agregar una sola opción sin regenerar las demás
+    if all(option.key != key for option in dropdown.options):
+        dropdown.options.append(ft.dropdown.Option(key=key, text=key))
+
+def remove_dropdown_option(dropdown, key):
+    # Quitar una sola opción y la selección si era esa
+    dropdown.options = [option for option in dropdown.options if option.key != key]
+    if dropdown.value == key:
+        dropdown.value = None
+
+class PagedListView:
+    """
+    Lista que solo construye las filas visibles y aplica altas y bajas en su sitio.
+    
+    ``set_items``, ``add_item`` y ``remove_item`` no envían nada a la interfaz:
+    quien los llama actualiza la página una sola vez al terminar la acción.
+    """
+    
+    def __init__(self, create_row, empty_text, page_size=LIST_PAGE_SIZE, **list_view_options):
+        self.create_row = create_row
+        self.empty_text = empty_text
+        self.page_size = page_size
+        
+        # Claves de todos los elementos y filas ya construidas
+        self.keys = []
+        self.rows = {}
+        
+        self.load_more_button = ft.TextButton("Cargar más", on_click=lambda e: self.load_more())
+        self.list_view = ft.ListView(on_scroll=self.handle_scroll, **list_view_options)
+    
+    def set_items(self, keys, empty_text=None):
+        # Reiniciar la lista (por ejemplo, al cambiar de plataforma seleccionada)
+        if empty_text is not None:
+            self.empty_text = empty_text
+        self.keys = list(keys)
+        self.rows = {}
+        self.list_view.controls = []
+        self._render_until(self.page_size)
+    
+    def add_item(self, key):
+        if key in self.rows or key in self.keys:
+            return
+        self.keys.append(key)
+        
+        # Solo se construye la fila si el final de la lista ya está cargado
+        if len(self.rows) == len(self.keys) - 1:
+            self._clear_placeholders()
+            row = self.create_row(key)
+            self.rows[key] = row
+            self.list_view.controls.append(row)
+        self._sync_load_more_button()
+    
+    def remove_item(self, key):
+        if key not in self.keys:
+            return
+        self.keys.remove(key)
+        
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.list_view.controls.remove(row)
+        
+        # Mantener la ventana llena con el siguiente elemento sin cargar
+        if len(self.rows) < len(self.keys) and len(self.rows) < self.page_size:
+            self._render_until(len(self.rows) + 1)
+        self._sync_load_more_button()
+        self._show_empty_text()
+    
+    def load_more(self):
+        if len(self.rows) < len(self.keys):
+            self._render_until(len(self.rows) + self.page_size)
+            self.update()
+    
+    def handle_scroll(self, e):
+        # Cargar la siguiente página al acercarse al final de la lista
+        if e.max_scroll_extent is not None and e.pixels >= e.max_scroll_extent - 100:
+            self.load_more()
+    
+    def update(self):
+        # Actualizar solo la lista; si todavía no está en la página no hace falta
+        if self.list_view.page:
+            self.list_view.update()
+    
+    def _render_until(self, count):
+        self._clear_placeholders()
+        for key in self.keys[len(self.rows):count]:
+            row = self.create_row(key)
+            self.rows[key] = row
+            self.list_view.controls.append(row)
+        self._sync_load_more_button()
+        self._show_empty_text()
+    
+    def _clear_placeholders(self):
+        self.list_view.controls = [
+            control for control in self.list_view.controls
+            if control is not self.load_more_button and not getattr(control, "data", None) == "empty"
+        ]
+    
+    def _sync_load_more_button(self):
+        has_button = self.load_more_button in self.list_view.controls
+        if len(self.rows) < len(self.keys) and not has_button:
+            self.list_view.controls.append(self.load_more_button)
+        elif len(self.rows) >= len(self.keys) and has_button:
+            self.list_view.controls.remove(self.load_more_button)
+    
+    def _show_empty_text(self):
+        if not self.keys and not self.list_view.controls:
+            self.list_view.controls.append(ft.Text(self.empty_text, italic=True, data="empty"))
+
+@timed_handlers(extra=("delete_platform", "delete_message_type"))
 class ConfigScreen:
     def __init__(self, page, on_close_callback):
         self.page = page
         self.on_close_callback = on_close_callback
-        self.storage = TemplateStorage()
-        self.template_builder = initialize_templates()
+        # Repositorio compartido: las plantillas se cargan una sola vez por proceso
+        self.repository = get_repository()
+        self.template_builder = self.repository.get_builder()
+        
+        # Detección de campos mientras se edita la plantilla
+        self.field_detector = FieldDetector()
+        self.fields_scheduler = PreviewScheduler(
+            collect=lambda: self.template_text_field.value or "",
+            render=self.detect_template_fields,
+            apply=self.show_template_fields
+        )
         
         # Crear controles
         self.create_ui()
         
+        # Los cambios del builder se aplican a los controles según ocurren
+        self.template_builder.subscribe(self.handle_library_event)
+        
     def create_ui(self):
         # Título
         self.title = ft.Text("Configuración del Gestor de Mensajes", size=24, weight=ft.FontWeight.BOLD)
@@ -23,24 +165,23 @@ class ConfigScreen:
             on_click=self.close_config
         )
         
-        # Tabs para la configuración
+        # Tabs para la configuración; el contenido de cada una se construye
+        # la primera vez que se selecciona
+        self.tab_builders = [
+            self.create_platforms_tab,
+            self.create_message_types_tab,
+            self.create_templates_tab
+        ]
         self.tabs = ft.Tabs(
             selected_index=0,
             tabs=[
-                ft.Tab(
-                    text="Plataformas",
-                    content=self.create_platforms_tab()
-                ),
-                ft.Tab(
-                    text="Tipos de Mensaje",
-                    content=self.create_message_types_tab()
-                ),
-                ft.Tab(
-                    text="Plantillas",
-                    content=self.create_templates_tab()
-                )
-            ]
+                ft.Tab(text="Plataformas"),
+                ft.Tab(text="Tipos de Mensaje"),
+                ft.Tab(text="Plantillas")
+            ],
+            on_change=self.handle_tab_change
         )
+        self.build_tab(0)
         
         # Contenedor principal
         self.content = ft.Column([
@@ -52,13 +193,111 @@ class ConfigScreen:
             self.tabs
         ], expand=True)
     
+    def build_tab(self, index):
+        tab = self.tabs.tabs[index]
+        if tab.content is None:
+            tab.content = self.tab_builders[index]()
+    
+    def handle_tab_change(self, e):
+        self.build_tab(self.tabs.selected_index)
+        self.tabs.update()
+    
+    def show(self):
+        # Los eventos del builder mantienen los controles al día aunque la
+        # pantalla no se vea; solo hay que reconstruirlos si cambió el builder
+        self.sync_library()
+    
+    def close(self):
+        self.template_builder.unsubscribe(self.handle_library_event)
+    
+    def sync_library(self):
+        builder = self.repository.get_builder()
+        if builder is not self.template_builder:
+            self.template_builder.unsubscribe(self.handle_library_event)
+            self.template_builder = builder
+            builder.subscribe(self.handle_library_event)
+            self.rebuild_library_controls()
+    
+    def rebuild_library_controls(self):
+        # Volver a construir las pestañas ya construidas a partir del builder nuevo
+        platforms = self.template_builder.get_platforms()
+        if hasattr(self, 'platforms_view'):
+            self.update_platforms_list()
+        
+        if hasattr(self, 'config_platform_dropdown'):
+            self.config_platform_dropdown.options = dropdown_options(platforms)
+            if self.config_platform_dropdown.value not in platforms:
+                self.config_platform_dropdown.value = None
+            self.show_config_message_types(self.config_platform_dropdown.value)
+        
+        if hasattr(self, 'template_platform_dropdown'):
+            self.template_platform_dropdown.options = dropdown_options(platforms)
+            platform = self.template_platform_dropdown.value
+            message_type = self.template_message_type_dropdown.value
+            if platform not in platforms:
+                self.template_platform_dropdown.value = None
+                self.select_template_platform(None)
+            elif message_type not in self.template_builder.get_message_types(platform):
+                self.select_template_platform(platform)
+            else:
+                self.template_message_type_dropdown.options = dropdown_options(
+                    self.template_builder.get_message_types(platform)
+                )
+    
+    def handle_library_event(self, event):
+        # Aplicar solo el cambio a los controles de las pestañas ya construidas;
+        # la interfaz se actualiza una sola vez al terminar la acción
+        platform = event.platform
+        message_type = event.message_type
+        config_platform = self.config_platform_dropdown.value if hasattr(self, 'config_platform_dropdown') else None
+        template_platform = self.template_platform_dropdown.value if hasattr(self, 'template_platform_dropdown') else None
+        
+        if event.kind == PLATFORM_ADDED:
+            if hasattr(self, 'platforms_view'):
+                self.platforms_view.add_item(platform)
+            for dropdown in self.platform_dropdowns():
+                add_dropdown_option(dropdown, platform)
+        elif event.kind == PLATFORM_REMOVED:
+            if hasattr(self, 'platforms_view'):
+                self.platforms_view.remove_item(platform)
+            for dropdown in self.platform_dropdowns():
+                remove_dropdown_option(dropdown, platform)
+            if config_platform == platform:
+                self.show_config_message_types(None)
+            if template_platform == platform:
+                self.select_template_platform(None)
+        elif event.kind == TYPE_ADDED:
+            if config_platform == platform:
+                self.message_types_view.add_item(message_type)
+            if template_platform == platform:
+                add_dropdown_option(self.template_message_type_dropdown, message_type)
+        elif event.kind == TYPE_REMOVED:
+            if config_platform == platform:
+                self.message_types_view.remove_item(message_type)
+            if template_platform == platform:
+                if self.template_message_type_dropdown.value == message_type:
+                    self.template_text_field.value = ""
+                    self.fields_scheduler.run_now()
+                remove_dropdown_option(self.template_message_type_dropdown, message_type)
+        # TEMPLATE_CHANGED no afecta a esta pantalla: el editor conserva lo que se está escribiendo
+    
+    def platform_dropdowns(self):
+        # Dropdowns de plataformas de las pestañas ya construidas
+        return [
+            getattr(self, name) for name in ('config_platform_dropdown', 'template_platform_dropdown')
+            if hasattr(self, name)
+        ]
+    
     def create_platforms_tab(self):
-        # Lista de plataformas
-        self.platforms_list = ft.ListView(
+        # Lista de plataformas (solo se construyen las filas visibles)
+        self.platforms_view = PagedListView(
+            create_row=self.create_platform_row,
+            empty_text="No hay plataformas configuradas",
             spacing=10,
             padding=20,
             height=300
         )
+        self.platforms_list = self.platforms_view.list_view
         
         # Actualizar lista de plataformas
         self.update_platforms_list()
@@ -87,26 +326,17 @@ class ConfigScreen:
         ], spacing=10)
     
     def update_platforms_list(self):
-        self.platforms_list.controls.clear()
-        
-        for platform in self.template_builder.get_platforms():
-            self.platforms_list.controls.append(
-                ft.Row([
-                    ft.Text(platform, size=16),
-                    ft.IconButton(
-                        icon=ft.Icons.DELETE,
-                        tooltip="Eliminar plataforma",
-                        on_click=lambda e, p=platform: self.delete_platform(p)
-                    )
-                ])
-            )
-        
-        if not self.platforms_list.controls:
-            self.platforms_list.controls.append(
-                ft.Text("No hay plataformas configuradas", italic=True)
+        self.platforms_view.set_items(self.template_builder.get_platforms())
+    
+    def create_platform_row(self, platform):
+        return ft.Row([
+            ft.Text(platform, size=16),
+            ft.IconButton(
+                icon=ft.Icons.DELETE,
+                tooltip="Eliminar plataforma",
+                on_click=lambda e, p=platform: self.delete_platform(p)
             )
-        
-        self.page.update()
+        ])
     
     def add_new_platform(self, e):
         platform_name = self.new_platform_field.value
@@ -115,17 +345,13 @@ class ConfigScreen:
             self.show_snackbar("El nombre de la plataforma no puede estar vacío")
             return
         
-        # Agregar plataforma
+        # Agregar plataforma (el evento agrega la fila y las opciones de los dropdowns)
         self.template_builder.add_platform(platform_name)
         
-        # Guardar cambios
-        self.storage.save_templates(self.template_builder.to_dict())
-        
-        # Actualizar lista de plataformas
-        self.update_platforms_list()
-        
-        # Actualizar dropdown de plataformas en la pestaña de tipos de mensaje
-        self.update_platform_dropdown()
+        # Guardar cambios (el campo conserva el nombre para reintentar)
+        if not self.repository.save(("add_platform", platform_name)):
+            self.show_snackbar(f"No se pudo guardar la plataforma '{platform_name}'")
+            return
         
         # Limpiar campo
         self.new_platform_field.value = ""
@@ -133,54 +359,35 @@ class ConfigScreen:
         self.show_snackbar(f"Plataforma '{platform_name}' agregada correctamente")
     
     def delete_platform(self, platform_name):
-        # Eliminar plataforma
-        if platform_name in self.template_builder.platforms:
-            del self.template_builder.platforms[platform_name]
+        # Eliminar plataforma (el evento quita la fila y las opciones de los dropdowns)
+        if self.template_builder.remove_platform(platform_name):
+            template_engine.invalidate(platform_name)
             
             # Guardar cambios
-            self.storage.save_templates(self.template_builder.to_dict())
-            
-            # Actualizar lista de plataformas
-            self.update_platforms_list()
-            
-            # Actualizar dropdown de plataformas en la pestaña de tipos de mensaje
-            self.update_platform_dropdown()
+            if not self.repository.save(("delete_platform", platform_name)):
+                self.show_snackbar(f"No se pudo guardar la eliminación de la plataforma '{platform_name}'")
+                return
             
             self.show_snackbar(f"Plataforma '{platform_name}' eliminada correctamente")
     
-    def update_platform_dropdown(self):
-        # Actualizar opciones del dropdown de plataformas en la pestaña de tipos de mensaje
-        if hasattr(self, 'config_platform_dropdown'):
-            self.config_platform_dropdown.options = [
-                ft.dropdown.Option(key=platform, text=platform) 
-                for platform in self.template_builder.get_platforms()
-            ]
-        
-        # Actualizar opciones del dropdown de plataformas en la pestaña de plantillas
-        if hasattr(self, 'template_platform_dropdown'):
-            self.template_platform_dropdown.options = [
-                ft.dropdown.Option(key=platform, text=platform) 
-                for platform in self.template_builder.get_platforms()
-            ]
-        
-        self.page.update()
-    
     def create_message_types_tab(self):
         # Dropdown para seleccionar plataforma
         self.config_platform_dropdown = ft.Dropdown(
             label="Selecciona la plataforma",
             width=300,
-            options=[ft.dropdown.Option(key=platform, text=platform) 
-                    for platform in self.template_builder.get_platforms()],
+            options=dropdown_options(self.template_builder.get_platforms()),
             on_change=self.update_message_types_list
         )
         
-        # Lista de tipos de mensaje
-        self.message_types_list = ft.ListView(
+        # Lista de tipos de mensaje (solo se construyen las filas visibles)
+        self.message_types_view = PagedListView(
+            create_row=self.create_message_type_row,
+            empty_text="Selecciona una plataforma para ver sus tipos de mensaje",
             spacing=10,
             padding=20,
             height=300
         )
+        self.message_types_list = self.message_types_view.list_view
         
         # Campo para nuevo tipo de mensaje
         self.new_message_type_field = ft.TextField(
@@ -209,32 +416,31 @@ class ConfigScreen:
         ], spacing=10)
     
     def update_message_types_list(self, e):
-        platform = e.control.value
-        self.message_types_list.controls.clear()
-        
+        self.show_config_message_types(e.control.value)
+        self.message_types_view.update()
+    
+    def show_config_message_types(self, platform):
         if platform:
-            for message_type in self.template_builder.get_message_types(platform):
-                self.message_types_list.controls.append(
-                    ft.Row([
-                        ft.Text(message_type, size=16),
-                        ft.IconButton(
-                            icon=ft.Icons.DELETE,
-                            tooltip="Eliminar tipo de mensaje",
-                            on_click=lambda e, p=platform, mt=message_type: self.delete_message_type(p, mt)
-                        )
-                    ])
-                )
-            
-            if not self.message_types_list.controls:
-                self.message_types_list.controls.append(
-                    ft.Text("No hay tipos de mensaje configurados para esta plataforma", italic=True)
-                )
+            self.message_types_view.set_items(
+                self.template_builder.get_message_types(platform),
+                empty_text="No hay tipos de mensaje configurados para esta plataforma"
+            )
         else:
-            self.message_types_list.controls.append(
-                ft.Text("Selecciona una plataforma para ver sus tipos de mensaje", italic=True)
+            self.message_types_view.set_items(
+                [],
+                empty_text="Selecciona una plataforma para ver sus tipos de mensaje"
             )
-        
-        self.page.update()
+    
+    def create_message_type_row(self, message_type):
+        platform = self.config_platform_dropdown.value
+        return ft.Row([
+            ft.Text(message_type, size=16),
+            ft.IconButton(
+                icon=ft.Icons.DELETE,
+                tooltip="Eliminar tipo de mensaje",
+                on_click=lambda e, p=platform, mt=message_type: self.delete_message_type(p, mt)
+            )
+        ])
     
     def add_new_message_type(self, e):
         platform = self.config_platform_dropdown.value
@@ -248,64 +454,42 @@ class ConfigScreen:
             self.show_snackbar("El nombre del tipo de mensaje no puede estar vacío")
             return
         
-        # Agregar tipo de mensaje con una plantilla vacía
-        self.template_builder.add_template(
-            platform_name=platform,
-            message_type=message_type,
-            template_text="",
-            fields=[]
-        )
-        
-        # Guardar cambios
-        self.storage.save_templates(self.template_builder.to_dict())
-        
-        # Actualizar lista de tipos de mensaje
-        # Crear un evento con los parámetros requeridos
-        self.update_message_types_list(ft.ControlEvent(
-            name="change",  # Nombre del evento
-            data="",       # Datos adicionales (vacío en este caso)
-            page=self.page,  # Referencia a la página
-            target=self.config_platform_dropdown,
-            control=self.config_platform_dropdown
-        ))
+        # Agregar tipo de mensaje con una plantilla vacía (el evento agrega la
+        # fila y la opción del dropdown de la pestaña de plantillas). La
+        # comprobación y el alta se hacen juntas para no vaciar la plantilla
+        # de un tipo que otro manejador acabe de crear
+        with self.template_builder.transaction():
+            exists = message_type in self.template_builder.get_message_types(platform)
+            added = not exists and self.template_builder.add_template(
+                platform_name=platform,
+                message_type=message_type,
+                template_text="",
+                fields=[]
+            )
+        if exists:
+            self.show_snackbar(f"El tipo de mensaje '{message_type}' ya existe")
+            return
         
-        # Actualizar dropdown de tipos de mensaje en la pestaña de plantillas
-        self.update_message_type_dropdowns(platform)
+        # Guardar cambios; los builders de SQLite y del formato indexado
+        # escriben al agregar, y ahí es donde pueden fallar
+        if not added or not self.repository.save(("save_template", platform, message_type, "", [])):
+            self.show_snackbar(f"No se pudo guardar el tipo de mensaje '{message_type}'")
+            return
         
         # Limpiar campo
         self.new_message_type_field.value = ""
         
         self.show_snackbar(f"Tipo de mensaje '{message_type}' agregado correctamente")
     
-    def update_message_type_dropdowns(self, platform):
-        # Actualizar dropdown de tipos de mensaje en la pestaña de plantillas si está seleccionada la misma plataforma
-        if hasattr(self, 'template_platform_dropdown') and self.template_platform_dropdown.value == platform:
-            self.template_message_type_dropdown.options.clear()
-            self.template_message_type_dropdown.options.extend([
-                ft.dropdown.Option(key=msg_type, text=msg_type) 
-                for msg_type in self.template_builder.get_message_types(platform)
-            ])
-            self.page.update()
-    
     def delete_message_type(self, platform, message_type):
-        # Eliminar tipo de mensaje
-        if platform in self.template_builder.platforms and message_type in self.template_builder.platforms[platform]:
-            del self.template_builder.platforms[platform][message_type]
+        # Eliminar tipo de mensaje (el evento quita la fila y la opción del dropdown)
+        if self.template_builder.remove_message_type(platform, message_type):
+            template_engine.invalidate(platform, message_type)
             
             # Guardar cambios
-            self.storage.save_templates(self.template_builder.to_dict())
-            
-            # Actualizar lista de tipos de mensaje
-            self.update_message_types_list(ft.ControlEvent(
-                name="change",
-                data="",
-                page=self.page,
-                target=self.config_platform_dropdown,
-                control=self.config_platform_dropdown
-            ))
-            
-            # Actualizar dropdown de tipos de mensaje en la pestaña de plantillas
-            self.update_message_type_dropdowns(platform)
+            if not self.repository.save(("delete_message_type", platform, message_type)):
+                self.show_snackbar(f"No se pudo guardar la eliminación del tipo de mensaje '{message_type}'")
+                return
             
             self.show_snackbar(f"Tipo de mensaje '{message_type}' eliminado correctamente")
     
@@ -314,8 +498,7 @@ class ConfigScreen:
         self.template_platform_dropdown = ft.Dropdown(
             label="Selecciona la plataforma",
             width=300,
-            options=[ft.dropdown.Option(key=platform, text=platform) 
-                    for platform in self.template_builder.get_platforms()],
+            options=dropdown_options(self.template_builder.get_platforms()),
             on_change=self.update_template_message_types
         )
         
@@ -332,14 +515,16 @@ class ConfigScreen:
             multiline=True,
             min_lines=8,
             max_lines=12,
-            width=750
+            width=750,
+            on_change=lambda e: self.fields_scheduler.schedule()
         )
         
         # Contenedor para mostrar los campos detectados (no editable)
         self.template_fields_container = ft.Container(
             content=ft.Column([
                 ft.Text("Campos detectados en la plantilla:", size=14, weight=ft.FontWeight.BOLD),
-                ft.Text("", size=14, color=ft.Colors.BLUE_700, selectable=True)
+                ft.Text("", size=14, color=ft.Colors.BLUE_700, selectable=True),
+                ft.Text("", size=13, color=ft.Colors.RED_700, visible=False)
             ]),
             padding=10,
             border=ft.border.all(1, ft.Colors.GREY_400),
@@ -381,22 +566,20 @@ class ConfigScreen:
         ], spacing=10)
     
     def update_template_message_types(self, e):
-        platform = e.control.value
-        
+        self.select_template_platform(e.control.value)
+        self.page.update()
+    
+    def select_template_platform(self, platform):
         # Limpiar y actualizar dropdown de tipos
-        self.template_message_type_dropdown.options.clear()
-        self.template_message_type_dropdown.options.extend([
-            ft.dropdown.Option(key=msg_type, text=msg_type) 
-            for msg_type in self.template_builder.get_message_types(platform)
-        ])
-        self.template_message_type_dropdown.disabled = False
+        self.template_message_type_dropdown.options = dropdown_options(
+            self.template_builder.get_message_types(platform) if platform else []
+        )
+        self.template_message_type_dropdown.disabled = not platform
         self.template_message_type_dropdown.value = None
         
         # Limpiar campos
         self.template_text_field.value = ""
-        self.template_fields_container.content.controls[1].value = ""
-        
-        self.page.update()
+        self.fields_scheduler.run_now()
     
     def load_template(self, e):
         platform = self.template_platform_dropdown.value
@@ -406,8 +589,8 @@ class ConfigScreen:
             template_data = self.template_builder.get_template(platform, message_type)
             
             if template_data:
-                self.template_text_field.value = template_data["template"]
-                self.template_fields_container.content.controls[1].value = ", ".join(template_data["fields"])
+                self.template_text_field.value = template_data.template
+                self.fields_scheduler.run_now()
                 self.page.update()
     
     def save_template(self, e):
@@ -423,38 +606,64 @@ class ConfigScreen:
             self.show_snackbar("La plantilla no puede estar vacía")
             return
         
-        # Extraer variables del texto de la plantilla (formato {variable})
-        import re
-        # Encontrar todas las variables en la plantilla
-        all_variables = re.findall(r'\{([^\}]+)\}', template_text)
-        
-        # Eliminar duplicados manteniendo el orden de aparición
-        template_variables = []
-        for var in all_variables:
-            if var not in template_variables:
-                template_variables.append(var)
-        
-        # Si no hay variables, permitir guardar la plantilla sin campos
-        # El mensaje se mostrará tal cual está escrito
+        # Completar la detección pendiente; solo se analizan las líneas editadas
+        self.fields_scheduler.run_now()
+        if self.field_detector.errors:
+            self.show_snackbar("Corrige los errores de la plantilla antes de guardarla")
+            return
         
-        # Actualizar el contenedor de campos con las variables detectadas
-        self.template_fields_container.content.controls[1].value = ", ".join(template_variables)
+        # Variables sin duplicados en orden de aparición
+        # Si no hay variables, el mensaje se mostrará tal cual está escrito
+        template_variables = self.field_detector.fields
         
-        # Guardar plantilla con las variables detectadas
-        self.template_builder.add_template(
+        # Guardar plantilla con las variables detectadas (los builders de
+        # SQLite y del formato indexado la escriben ya aquí y pueden fallar)
+        if not self.template_builder.add_template(
             platform_name=platform,
             message_type=message_type,
             template_text=template_text,
             fields=template_variables
-        )
+        ):
+            self.show_snackbar("No se pudo guardar la plantilla")
+            return
+        
+        # Descartar el plan compilado anterior de esta plantilla
+        template_engine.invalidate(platform, message_type)
         
         # Guardar cambios
-        self.storage.save_templates(self.template_builder.to_dict())
+        if not self.repository.save(("save_template", platform, message_type, template_text, template_variables)):
+            self.show_snackbar("No se pudo guardar la plantilla")
+            return
         
-        self.page.update()
         self.show_snackbar("Plantilla guardada correctamente con los campos detectados automáticamente")
     
+    def refresh_library(self, changed):
+        # Otra instancia modificó las plantillas: los eventos del builder ya
+        # aplicaron el cambio a los controles; solo falta enviarlo a la interfaz
+        self.sync_library()
+        self.page.update()
+    
+    def detect_template_fields(self, template_text):
+        self.field_detector.update(template_text)
+        return (
+            tuple(self.field_detector.field_counts().items()),
+            tuple(self.field_detector.error_messages())
+        )
+    
+    def show_template_fields(self, detection):
+        field_counts, errors = detection
+        fields_text, errors_text = self.template_fields_container.content.controls[1:]
+        fields_text.value = ", ".join(
+            f"{field} ({count})" if count > 1 else field
+            for field, count in field_counts
+        )
+        errors_text.value = "\n".join(errors)
+        errors_text.visible = bool(errors)
+        if self.template_fields_container.page:
+            self.template_fields_container.update()
+    
     def show_snackbar(self, message):
+        # La notificación envía de una vez todos los cambios de la acción
         self.page.snack_bar = ft.SnackBar(
             content=ft.Text(message),
             action="OK"
@@ -465,19 +674,139 @@ class ConfigScreen:
     def close_config(self, e):
         self.on_close_callback()
 
+@timed_handlers(extra=("handle_field_change", "show_suggestions", "apply_suggestion", "select_template"))
 class MessageGeneratorScreen:
-    def __init__(self, page, on_config_callback):
+    def __init__(self, page, on_config_callback, preview_delay=DEFAULT_DEBOUNCE_SECONDS):
         self.page = page
         self.on_config_callback = on_config_callback
-        self.storage = TemplateStorage()
-        self.template_builder = initialize_templates()
+        # Repositorio compartido: las plantillas se cargan una sola vez por proceso
+        self.repository = get_repository()
+        self.template_builder = self.repository.get_builder()
+        
+        # Valores usados antes en cada campo, para sugerirlos al escribir
+        self.field_history = get_field_history()
         
         # Variables para almacenar selecciones
         self.selected_platform = None
         self.selected_type = None
+        self.selected_template = None
+        
+        # Fragmentos del último mensaje renderizado y de los que muestra la salida
+        self.output_renderer = None
+        self.shown_renderer = None
+        
+        # Planificador que agrupa las pulsaciones antes de actualizar la vista previa
+        self.preview_scheduler = PreviewScheduler(
+            collect=self.collect_preview_values,
+            render=self.render_preview,
+            apply=self.apply_preview,
+            delay=preview_delay
+        )
+        
+        # Planificador de la búsqueda: agrupa las pulsaciones del buscador y
+        # vuelve a buscar si cambia la biblioteca
+        self.search_scheduler = PreviewScheduler(
+            collect=lambda: (self.template_builder.version, (self.search_field.value or "").strip()),
+            render=self.render_search_results,
+            apply=self.apply_search_results,
+            delay=preview_delay
+        )
         
         # Crear controles
         self.create_ui()
+        
+        # Los cambios del builder se aplican a los controles según ocurren
+        self.template_builder.subscribe(self.handle_library_event)
+    
+    def show(self):
+        # Los eventos del builder mantienen los controles al día aunque la
+        # pantalla no se vea; solo hay que reconstruirlos si cambió el builder
+        self.sync_library()
+    
+    def close(self):
+        self.template_builder.unsubscribe(self.handle_library_event)
+    
+    def sync_library(self):
+        builder = self.repository.get_builder()
+        if builder is not self.template_builder:
+            self.template_builder.unsubscribe(self.handle_library_event)
+            self.template_builder = builder
+            builder.subscribe(self.handle_library_event)
+            self.rebuild_library_controls()
+        
+        # Repetir la búsqueda solo si la biblioteca cambió desde la última
+        if self.search_field.value:
+            self.search_scheduler.run_now()
+    
+    def rebuild_library_controls(self):
+        # Volver a construir las selecciones a partir del builder nuevo
+        platforms = self.template_builder.get_platforms()
+        self.platform_dropdown.options = dropdown_options(platforms)
+        
+        platform = self.selected_platform
+        if not platform:
+            return
+        if platform not in platforms:
+            self.clear_selected_platform()
+            return
+        
+        message_types = self.template_builder.get_message_types(platform)
+        self.message_type_dropdown.options = dropdown_options(message_types)
+        if self.selected_type not in message_types:
+            self.clear_selected_type()
+        elif self.template_builder.get_template(platform, self.selected_type) != self.selected_template:
+            self.refresh_fields()
+    
+    def handle_library_event(self, event):
+        # Aplicar solo el cambio a los dropdowns y campos afectados; la
+        # interfaz se actualiza una sola vez al terminar la acción
+        platform = event.platform
+        message_type = event.message_type
+        
+        if event.kind == PLATFORM_ADDED:
+            add_dropdown_option(self.platform_dropdown, platform)
+        elif event.kind == PLATFORM_REMOVED:
+            remove_dropdown_option(self.platform_dropdown, platform)
+            if platform == self.selected_platform:
+                self.clear_selected_platform()
+        elif platform != self.selected_platform:
+            return
+        elif event.kind == TYPE_ADDED:
+            add_dropdown_option(self.message_type_dropdown, message_type)
+        elif event.kind == TYPE_REMOVED:
+            remove_dropdown_option(self.message_type_dropdown, message_type)
+            if message_type == self.selected_type:
+                self.clear_selected_type()
+        elif event.kind == TEMPLATE_CHANGED and message_type == self.selected_type:
+            self.refresh_fields()
+    
+    def clear_selected_platform(self):
+        # La plataforma seleccionada ya no existe
+        self.platform_dropdown.value = None
+        self.selected_platform = None
+        self.message_type_dropdown.options = []
+        self.message_type_dropdown.disabled = True
+        self.clear_selected_type()
+    
+    def clear_selected_type(self):
+        # El tipo de mensaje seleccionado ya no existe
+        self.message_type_dropdown.value = None
+        self.selected_type = None
+        self.selected_template = None
+        self.fields_container.controls.clear()
+        self.preview_scheduler.reset()
+        self.clear_output()
+    
+    def refresh_fields(self):
+        # La plantilla mostrada cambió: rehacer sus campos conservando lo escrito
+        fields = self.selected_template.fields if self.selected_template else ()
+        values = dict(zip(fields, (
+            control.value for control in self.fields_container.controls
+            if isinstance(control, ft.TextField)
+        )))
+        self.show_fields(values)
+        self.preview_scheduler.reset()
+        self.preview_scheduler.schedule()
     
     def create_ui(self):
         # Título de la aplicación
@@ -489,12 +818,22 @@ class MessageGeneratorScreen:
             on_click=self.open_config
         )
         
+        # Buscador de mensajes por texto, nombre o campos
+        self.search_field = ft.TextField(
+            label="Buscar mensaje",
+            width=400,
+            prefix_icon=ft.Icons.SEARCH,
+            on_change=lambda _: self.search_scheduler.schedule()
+        )
+        
+        # Resultados de la búsqueda
+        self.search_results = ft.Column(spacing=0)
+        
         # Dropdown para seleccionar plataforma
         self.platform_dropdown = ft.Dropdown(
             label="Selecciona la plataforma",
             width=400,
-            options=[ft.dropdown.Option(key=platform, text=platform) 
-                    for platform in self.template_builder.get_platforms()],
+            options=dropdown_options(self.template_builder.get_platforms()),
             on_change=self.update_message_types
         )
         
@@ -509,21 +848,28 @@ class MessageGeneratorScreen:
         # Contenedor para campos dinámicos
         self.fields_container = ft.Column(spacing=10)
         
-        # Campo para mostrar el mensaje generado
-        self.message_output = ft.TextField(
-            label="Mensaje generado",
-            multiline=True,
-            min_lines=10,
-            max_lines=20,
-            read_only=True,
-            width=750
+        # Sugerencias del historial para el campo que se está escribiendo
+        self.suggestions_row = ft.Row(spacing=5, wrap=True)
+        # Campo y valores de los botones mostrados, para no rehacerlos si no cambian
+        self.shown_suggestions = (None, [])
+        
+        # Mensaje generado, con un fragmento por literal o hueco de la plantilla:
+        # al escribir en un campo solo se envían los fragmentos de ese campo
+        self.message_output = ft.Text(spans=[], selectable=True, size=14)
+        self.message_output_container = ft.Container(
+            content=ft.Column([self.message_output], scroll=ft.ScrollMode.AUTO),
+            height=300,
+            width=750,
+            padding=10,
+            border=ft.border.all(1, ft.Colors.GREY_400),
+            border_radius=5
         )
         
         # Botón para copiar al portapapeles
         self.copy_button = ft.ElevatedButton(
             "Copiar al portapapeles",
             disabled=True,
-            on_click=lambda e: self.page.set_clipboard(self.message_output.value)
+            on_click=lambda e: self.page.set_clipboard(self.output_text())
         )
         
         # Contenedor principal
@@ -533,6 +879,8 @@ class MessageGeneratorScreen:
                 self.config_button
             ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             ft.Divider(),
+            self.search_field,
+            self.search_results,
             ft.Text("Selecciona la plataforma y el tipo de mensaje:", size=16),
             self.platform_dropdown,
             self.message_type_dropdown,
@@ -544,139 +892,206 @@ class MessageGeneratorScreen:
                 ft.Text("Mensaje generado:", size=16),
                 self.copy_button
             ]),
-            self.message_output
+            self.message_output_container
         ], spacing=10, expand=True)
     
     def update_message_types(self, e):
         self.selected_platform = e.control.value
         
         # Limpiar y actualizar dropdown de tipos
-        self.message_type_dropdown.options.clear()
-        self.message_type_dropdown.options.extend([
-            ft.dropdown.Option(key=msg_type, text=msg_type) 
-            for msg_type in self.template_builder.get_message_types(self.selected_platform)
-        ])
+        self.message_type_dropdown.options = dropdown_options(
+            self.template_builder.get_message_types(self.selected_platform)
+        )
         self.message_type_dropdown.disabled = False
         self.message_type_dropdown.value = None
         
         # Limpiar campos
         self.fields_container.controls.clear()
-        self.message_output.value = ""
-        self.copy_button.disabled = True
+        self.preview_scheduler.reset()
+        self.clear_output()
         
         self.page.update()
     
     def generate_fields(self, e):
         self.selected_type = e.control.value
+        self.show_fields()
+        self.page.update()
         
+        # Actualizar la vista previa automáticamente cuando se selecciona un tipo de mensaje
+        self.preview_scheduler.reset()
+        if self.fields_container.controls:
+            self.update_preview()
+    
+    def show_fields(self, values=None):
         # Limpiar campos anteriores
         self.fields_container.controls.clear()
         
+        # Plantilla mostrada, para detectar si otra instancia la modifica
+        self.selected_template = None
         if self.selected_platform and self.selected_type:
-            # Obtener plantilla
-            template_data = self.template_builder.get_template(
+            self.selected_template = self.template_builder.get_template(
                 self.selected_platform, self.selected_type
             )
-            
-            if template_data:
-                # Obtener campos requeridos para este tipo de mensaje
-                required_fields = template_data["fields"]
-                
-                # Crear campos de entrada para cada campo requerido
-                for field in required_fields:
-                    self.fields_container.controls.append(
-                        ft.TextField(
-                            label=f"Valor para '{field}'",
-                            width=400,
-                            on_change=lambda _: self.update_preview()
-                        )
-                    )
-                
-                # Agregar botón para generar mensaje
+        
+        template_data = self.selected_template
+        if template_data:
+            # Crear campos de entrada para cada campo requerido, con el valor
+            # que ya tuviera si se están rehaciendo
+            values = values or {}
+            for field in template_data.fields:
                 self.fields_container.controls.append(
-                    ft.ElevatedButton(
-                        "Generar mensaje",
-                        on_click=self.generate_message
+                    ft.TextField(
+                        label=f"Valor para '{field}'",
+                        value=values.get(field, ""),
+                        width=400,
+                        on_change=lambda e, f=field: self.handle_field_change(e.control, f),
+                        on_focus=lambda e, f=field: self.show_suggestions(e.control, f)
                     )
                 )
-                
-                # Actualizar la vista previa automáticamente cuando se selecciona un tipo de mensaje
-                self.update_preview()
-        
-        self.page.update()
+            
+            self.suggestions_row.controls.clear()
+            self.shown_suggestions = (None, [])
+            self.fields_container.controls.append(self.suggestions_row)
+            
+            # Agregar botón para generar mensaje
+            self.fields_container.controls.append(
+                ft.ElevatedButton(
+                    "Generar mensaje",
+                    on_click=self.generate_message
+                )
+            )
+    
+    def handle_field_change(self, control, field):
+        self.preview_scheduler.schedule()
+        self.show_suggestions(control, field)
+    
+    def show_suggestions(self, control, field):
+        # Valores usados antes en este campo que empiezan por lo escrito
+        typed = control.value or ""
+        suggestions = [
+            value for value in self.field_history.suggest(field, typed, FIELD_SUGGESTIONS_LIMIT)
+            if value != typed
+        ]
+        # La mayoría de las pulsaciones no cambian las sugerencias: sin cambios
+        # no se crean botones ni se envía nada
+        shown = (control, suggestions) if suggestions else (None, [])
+        if shown[0] is self.shown_suggestions[0] and shown[1] == self.shown_suggestions[1]:
+            return
+        self.shown_suggestions = shown
+        self.suggestions_row.controls = [
+            ft.TextButton(value, on_click=lambda e, c=control, v=value: self.apply_suggestion(c, v))
+            for value in suggestions
+        ]
+        self.suggestions_row.update()
+    
+    def apply_suggestion(self, control, value):
+        control.value = value
+        self.suggestions_row.controls = []
+        self.shown_suggestions = (None, [])
+        control.update()
+        self.suggestions_row.update()
+        self.update_preview()
     
     def update_preview(self):
+        # Actualizar la vista previa de inmediato, sin esperar la ventana de agrupación
+        self.preview_scheduler.run_now()
+    
+    def collect_preview_values(self):
+        # Valores actuales de los campos y versión de la biblioteca; si no
+        # cambian no se vuelve a renderizar
+        return (
+            self.template_builder.version,
+            self.selected_platform,
+            self.selected_type,
+            tuple(control.value for control in self.fields_container.controls
+                  if isinstance(control, ft.TextField))
+        )
+    
+    def render_preview(self, preview_values):
         if self.selected_platform and self.selected_type:
             try:
-                # Obtener plantilla
-                template_data = self.template_builder.get_template(
-                    self.selected_platform, self.selected_type
+                # Generar mensaje con los valores actuales; los campos vacíos se muestran como {campo}.
+                # Se renderiza desde una instantánea porque esto corre en el hilo del
+                # planificador mientras la configuración puede estar editando la biblioteca
+                library = self.template_builder.snapshot()
+                result = render_segments(
+                    self.output_renderer, library, self.selected_platform, self.selected_type,
+                    self.field_values(preview_values[3], library), preview=True
                 )
-                
-                if template_data:
-                    template = template_data["template"]
-                    
-                    # Si no hay campos (variables) en la plantilla, mostrar directamente el mensaje
-                    if not template_data["fields"]:
-                        preview = template
-                        self.message_output.value = preview
-                        self.copy_button.disabled = False
-                        self.page.update()
-                        return
-                    
-                    # Recopilar valores de los campos
-                    field_values = {}
-                    for i, field in enumerate(template_data["fields"]):
-                        field_values[field] = self.fields_container.controls[i].value or f"{{{field}}}"
-                    
-                    # Generar mensaje con los valores actuales
-                    preview = template.format(**field_values)
-                    
-                    # Actualizar campo de salida
-                    self.message_output.value = preview
-                    self.copy_button.disabled = False
-                    self.page.update()
+                if result is None:
+                    return None
+                self.output_renderer, changed = result
+                if changed:
+                    # La revisión distingue dos cambios seguidos de los mismos fragmentos
+                    return (self.output_renderer, self.output_renderer.revision, tuple(changed))
             except Exception as e:
                 print(f"Error al actualizar vista previa: {e}")
+        return None
+    
+    def field_values(self, values, library=None):
+        # Asociar los valores de los campos de texto con los campos de la plantilla
+        template_data = (library or self.template_builder).get_template(
+            self.selected_platform, self.selected_type
+        )
+        fields = template_data.fields if template_data else ()
+        return dict(zip(fields, values))
+    
+    def apply_preview(self, preview):
+        # Actualizar solo la salida y el botón de copiar, no toda la página
+        renderer, _, changed = preview
+        self.show_output(renderer, changed)
+        self.copy_button.disabled = False
+        self.message_output.update()
+        self.copy_button.update()
+    
+    def show_output(self, renderer, changed):
+        # Cambiar solo el texto de los fragmentos que cambiaron; con otra
+        # plantilla se vuelven a crear todos
+        if renderer is not self.shown_renderer:
+            self.shown_renderer = renderer
+            self.message_output.spans = [ft.TextSpan(segment) for segment in renderer.segments]
+        else:
+            for position in changed:
+                self.message_output.spans[position].text = renderer.segments[position]
+    
+    def clear_output(self):
+        self.output_renderer = None
+        self.shown_renderer = None
+        self.message_output.spans = []
+        self.copy_button.disabled = True
+    
+    def output_text(self):
+        # El texto completo solo se une al copiarlo
+        return self.shown_renderer.text if self.shown_renderer else ""
     
     def generate_message(self, e):
         if self.selected_platform and self.selected_type:
             try:
-                # Obtener plantilla
-                template_data = self.template_builder.get_template(
-                    self.selected_platform, self.selected_type
-                )
-                
-                if template_data:
-                    template = template_data["template"]
-                    
-                    # Si no hay campos (variables) en la plantilla, mostrar directamente el mensaje
-                    if not template_data["fields"]:
-                        final_message = template
-                        self.message_output.value = final_message
+                # La vista previa usa los mismos fragmentos y la misma salida:
+                # mientras se genera el mensaje no puede ejecutarse (se espera a
+                # la que esté en curso) y una pendiente no debe pisarlo después.
+                # Con la próxima pulsación vuelve a renderizarse
+                with self.preview_scheduler.exclusive():
+                    # Generar el mensaje con los valores de los campos
+                    # (cada variable se reemplaza en todas sus apariciones)
+                    library = self.template_builder.snapshot()
+                    values = self.field_values(
+                        (control.value for control in self.fields_container.controls
+                         if isinstance(control, ft.TextField)),
+                        library
+                    )
+                    result = render_segments(
+                        self.output_renderer, library, self.selected_platform, self.selected_type, values
+                    )
+                    if result is not None:
+                        # Actualizar solo los fragmentos que difieren de la vista previa
+                        self.output_renderer, changed = result
+                        self.show_output(self.output_renderer, changed)
                         self.copy_button.disabled = False
-                        
-                        # Mostrar notificación
-                        self.page.snack_bar = ft.SnackBar(
-                            content=ft.Text("Mensaje generado correctamente"),
-                            action="OK"
-                        )
-                        self.page.snack_bar.open = True
-                        self.page.update()
-                        return
-                    
-                    # Recopilar valores de los campos
-                    field_values = {}
-                    for i, field in enumerate(template_data["fields"]):
-                        field_values[field] = self.fields_container.controls[i].value or ""
-                    
-                    # Usar format() para reemplazar todas las instancias de cada variable
-                    # Esto maneja correctamente cuando la misma variable aparece múltiples veces
-                    final_message = template.format(**field_values)
-                    
-                    # Actualizar campo de salida
-                    self.message_output.value = final_message
-                    self.copy_button.disabled = False
+                
+                if result is not None:
+                    # Recordar los valores para sugerirlos la próxima vez
+                    self.field_history.record(values)
                     
                     # Mostrar notificación
                     self.page.snack_bar = ft.SnackBar(
@@ -719,9 +1134,133 @@ class MessageGeneratorScreen:
                 self.page.snack_bar.open = True
                 self.page.update()
     
+    def render_search_results(self, search):
+        _, query = search
+        if not query:
+            return []
+        return self.repository.get_search_index().search(query, limit=SEARCH_RESULTS_LIMIT)
+    
+    def apply_search_results(self, results):
+        self.search_results.controls = [
+            ft.TextButton(
+                f"{platform} › {message_type}",
+                on_click=lambda e, p=platform, mt=message_type: self.select_template(p, mt)
+            )
+            for platform, message_type, _ in results
+        ]
+        
+        if not results and self.search_field.value:
+            self.search_results.controls.append(
+                ft.Text("No se encontraron mensajes", italic=True)
+            )
+        
+        self.search_results.update()
+    
+    def select_template(self, platform, message_type):
+        # Seleccionar la plataforma y el tipo de mensaje elegidos en la búsqueda
+        self.platform_dropdown.value = platform
+        self.update_message_types(ft.ControlEvent(
+            name="change",
+            data="",
+            page=self.page,
+            target=self.platform_dropdown,
+            control=self.platform_dropdown
+        ))
+        
+        self.message_type_dropdown.value = message_type
+        self.generate_fields(ft.ControlEvent(
+            name="change",
+            data="",
+            page=self.page,
+            target=self.message_type_dropdown,
+            control=self.message_type_dropdown
+        ))
+    
+    def refresh_library(self, changed):
+        # Otra instancia modificó las plantillas: los eventos del builder ya
+        # aplicaron el cambio a los controles; solo falta enviarlo a la interfaz
+        self.sync_library()
+        self.page.update()
+    
     def open_config(self, e):
         self.on_config_callback()
 
+class ScreenNavigator:
+    """
+    Pantallas de una sesión y cambio entre ellas.
+    
+    Las pantallas se crean la primera vez que se muestran y se conservan:
+    cambiar de pantalla solo cambia cuál es visible.
+    """
+    
+    def __init__(self, page, leak_tracker=None):
+        self.page = page
+        self.repository = get_repository()
+        self.screens = {}
+        self.current_screen = None
+        # Punto de control en cada cambio de pantalla (solo con MESSAGE_MANAGER_LEAK_DIAGNOSTICS=1)
+        self.leak_tracker = leak_tracker
+    
+    def open(self):
+        # Refrescar la pantalla visible cuando otra instancia modifica las plantillas
+        self.repository.add_listener(self.refresh_current_screen)
+        self.repository.start_watching()
+        
+        # Iniciar con la pantalla del generador
+        self.switch_to_generator()
+    
+    def close(self):
+        # Escribir los cambios pendientes antes de que se cierre la sesión y
+        # dejar de recibir los eventos del builder compartido
+        self.repository.remove_listener(self.refresh_current_screen)
+        for screen in self.screens.values():
+            screen.close()
+        self.repository.flush()
+    
+    def refresh_current_screen(self, changed):
+        if self.current_screen is not None:
+            self.current_screen.refresh_library(changed)
+    
+    def show_screen(self, name, create_screen):
+        screen = self.screens.get(name)
+        if screen is None:
+            screen = self.screens[name] = create_screen()
+            self.page.add(screen.content)
+        else:
+            screen.show()
+        for other in self.screens.values():
+            other.content.visible = other is screen
+        self.current_screen = screen
+        self.page.update()
+        
+        if self.leak_tracker is not None:
+            self.leak_tracker.checkpoint(f"switch_to_{name}")
+    
+    # Funciones para cambiar entre pantallas
+    def switch_to_generator(self):
+        self.show_screen("generator", lambda: MessageGeneratorScreen(self.page, self.switch_to_config))
+    
+    def switch_to_config(self):
+        self.show_screen("config", lambda: ConfigScreen(self.page, self.switch_to_generator))
+
+def create_leak_tracker(**options):
+    # Objetos que no deberían multiplicarse al cambiar de pantalla: las
+    # pantallas, sus listas y controles, y los oyentes que registran
+    repository = get_repository()
+    return LeakTracker(
+        tracked={
+            "ConfigScreen": ConfigScreen,
+            "MessageGeneratorScreen": MessageGeneratorScreen,
+            "PagedListView": PagedListView,
+            "ft.Control": ft.Control
+        },
+        gauges={
+            "builder.subscribers": lambda: repository.get_builder().subscriber_count,
+            "repository.listeners": lambda: repository.listener_count
+        },
+        **options
+    )
+
 def main(page: ft.Page):
     # Configuración de la página
     page.title = "Gestor de Mensajes"
@@ -732,22 +1271,19 @@ def main(page: ft.Page):
     page.window_resizable = True
     page.scroll = ft.ScrollMode.AUTO
     
-    # Función para cambiar entre pantallas
-    def switch_to_generator():
-        page.controls.clear()
-        generator_screen = MessageGeneratorScreen(page, switch_to_config)
-        page.add(generator_screen.content)
-        page.update()
-    
-    def switch_to_config():
-        page.controls.clear()
-        config_screen = ConfigScreen(page, switch_to_generator)
-        page.add(config_screen.content)
-        page.update()
-    
-    # Iniciar con la pantalla del generador
-    switch_to_generator()
+    # Diagnóstico de fugas (solo con MESSAGE_MANAGER_LEAK_DIAGNOSTICS=1)
+    navigator = ScreenNavigator(page, create_leak_tracker() if LEAK_DIAGNOSTICS_ENABLED else None)
+    page.on_disconnect = lambda e: navigator.close()
+    
+    # Métricas de tiempo (solo con MESSAGE_MANAGER_METRICS=1)
+    if METRICS_ENABLED:
+        page.update = timed("ui.page_update")(page.update)
+    
+    navigator.open()
 
 # Ejecutar la aplicación
 if __name__ == "__main__":
+    # Flet ejecuta main en otro hilo por cada sesión: la exportación de las
+    # métricas (y su señal) se registra una sola vez, desde el hilo principal
+    install_exporters()
     ft.app(target=main)
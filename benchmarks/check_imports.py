@@ -0,0 +1,114 @@
+"""
+Comprobación del grafo de importación del núcleo.
+
+Falla si al importar el núcleo (modelos, almacenamiento, renderizado y línea de
+comandos) se carga Flet o algún módulo pesado que solo necesitan otras partes
+de la aplicación, o si el arranque de ``python -m cli`` supera el presupuesto
+de tiempo respecto a un intérprete vacío.
+
+Uso:
+    python -m benchmarks.check_imports
+    python -m benchmarks.check_imports --budget-ms 60 --runs 9
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+# Módulos que forman el núcleo y deben poder importarse sin la interfaz
+CORE_MODULES = (
+    "models.template_models",
+    "utils.persistence",
+    "utils.template_engine",
+    "utils.template_initializer",
+    "utils.template_repository",
+    "utils.message_renderer",
+    "cli",
+)
+
+# Paquetes que no deben aparecer en el grafo de importación del núcleo
+FORBIDDEN_MODULES = (
+    "flet",
+    "asyncio",
+    "sqlite3",
+    "mmap",
+    "concurrent",
+    "multiprocessing",
+    "http",
+    "csv",
+)
+
+# Tiempo máximo de arranque de la línea de comandos, descontando el del
+# intérprete; la mayor parte corresponde a typing, re, json y argparse
+DEFAULT_BUDGET_MS = 100.0
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(module: str) -> List[str]:
+    """Obtiene los módulos cargados al importar un módulo en un proceso nuevo."""
+    code = (
+        "import importlib, json, sys\n"
+        "before = set(sys.modules)\n"
+        f"importlib.import_module({module!r})\n"
+        "print(json.dumps(sorted(set(sys.modules) - before)))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def forbidden_imports(module: str) -> List[str]:
+    """Obtiene los módulos prohibidos que carga un módulo del núcleo."""
+    return [
+        name for name in imported_modules(module)
+        if name.split(".")[0] in FORBIDDEN_MODULES
+    ]
+
+
+def startup_time_ms(args: List[str], runs: int) -> float:
+    """Mediana del tiempo de ejecución de un proceso de Python, en milisegundos."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Comprueba el grafo de importación del núcleo")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Tiempo máximo de arranque de la línea de comandos sobre el del intérprete")
+    parser.add_argument("--runs", type=int, default=7, help="Ejecuciones para medir el arranque")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in CORE_MODULES:
+        forbidden = forbidden_imports(module)
+        if forbidden:
+            failed = True
+            print(f"ERROR: {module} importa {', '.join(forbidden)}")
+        else:
+            print(f"ok: {module}")
+
+    interpreter = startup_time_ms(["-c", "pass"], args.runs)
+    # "--help" recorre todas las importaciones sin leer las plantillas
+    cli = startup_time_ms(["-m", "cli", "--help"], args.runs)
+    overhead = cli - interpreter
+    print(f"Arranque: intérprete {interpreter:.1f} ms, cli {cli:.1f} ms "
+          f"(+{overhead:.1f} ms, presupuesto {args.budget_ms:.1f} ms)")
+    if overhead > args.budget_ms:
+        failed = True
+        print("ERROR: el arranque de la línea de comandos supera el presupuesto")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Comprobación de fugas de memoria y de controles al cambiar de pantalla.
+
+Abre una sesión de la aplicación sobre una página sin cliente, cambia varias
+veces entre el generador y la configuración haciendo en cada vuelta las
+acciones que crean filas, opciones y campos (alta y baja de una plataforma,
+selección de plataforma y tipo de mensaje) y toma un punto de control del
+diagnóstico de fugas en cada cambio. Falla si después del calentamiento crece
+el número de pantallas, listas, controles u oyentes, si la memoria retenida
+supera el presupuesto o si, al cerrar varias sesiones, queda alguna pantalla
+viva u oyente registrado.
+
+Se ejecuta en un directorio temporal, con su propio archivo de plantillas, y
+necesita Flet; sin Flet se omite.
+
+Por defecto la comprobación es corta para poder ejecutarla siempre; con
+``--long`` se hacen muchas más vueltas y sesiones.
+
+Uso:
+    python -m benchmarks.check_leaks
+    python -m benchmarks.check_leaks --long
+    python -m benchmarks.check_leaks --switches 200 --sessions 20 --budget-kib 128
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+# Vueltas de calentamiento: la primera crea las pantallas, las pestañas y las cachés
+WARMUP_ROUNDS = 2
+
+# Vueltas y sesiones de la comprobación normal y de la larga (--long)
+DEFAULT_SWITCHES = 10
+DEFAULT_SESSIONS = 2
+LONG_SWITCHES = 50
+LONG_SESSIONS = 10
+
+# Contadores que no pueden cambiar entre vueltas (los controles admiten tolerancia)
+EXACT_COUNTERS = (
+    "ConfigScreen",
+    "MessageGeneratorScreen",
+    "PagedListView",
+    "builder.subscribers",
+    "repository.listeners",
+)
+
+
+class HeadlessPage:
+    """Página sin cliente: guarda los controles y no envía nada."""
+
+    def __init__(self):
+        self.controls = []
+        self.snack_bar = None
+        self.on_disconnect = None
+
+    def add(self, *controls) -> None:
+        self.controls.extend(controls)
+
+    def update(self, *controls) -> None:
+        pass
+
+    def set_clipboard(self, value: str) -> None:
+        pass
+
+
+def exercise_config(config, round_number: int) -> None:
+    # Todas las pestañas y una plataforma que se crea y se elimina (su fila,
+    # su botón y sus opciones en los desplegables)
+    for index in range(len(config.tabs.tabs)):
+        config.build_tab(index)
+    platform = f"Plataforma de prueba {round_number}"
+    config.new_platform_field.value = platform
+    config.add_new_platform(None)
+    config.delete_platform(platform)
+
+
+def exercise_generator(generator, round_number: int) -> None:
+    # Elegir plataforma y tipo crea las opciones y los campos con sus funciones
+    platforms = generator.template_builder.get_platforms()
+    if not platforms:
+        return
+    generator.platform_dropdown.value = platforms[0]
+    generator.update_message_types(SimpleNamespace(control=generator.platform_dropdown))
+    message_types = generator.template_builder.get_message_types(platforms[0])
+    if message_types:
+        generator.selected_type = message_types[0]
+        generator.show_fields()
+
+
+def run(switches: int, sessions: int, control_tolerance: int, budget_kib: float) -> List[str]:
+    """
+    Ejecuta la comprobación en el directorio actual.
+
+    Returns:
+        List[str]: Errores encontrados (vacía si todo fue bien).
+    """
+    import app
+
+    errors: List[str] = []
+    tracker = app.create_leak_tracker(report_file=None, echo=False)
+
+    page = HeadlessPage()
+    navigator = app.ScreenNavigator(page, tracker)
+    navigator.open()
+
+    # Informe de referencia de cada cambio, tomado al terminar el calentamiento
+    reference: Dict[str, object] = {}
+    for round_number in range(WARMUP_ROUNDS + switches):
+        for switch, name, exercise in ((navigator.switch_to_config, "config", exercise_config),
+                                       (navigator.switch_to_generator, "generator", exercise_generator)):
+            switch()
+            report = tracker.last_report
+            if round_number < WARMUP_ROUNDS:
+                reference[report.label] = report
+            else:
+                errors.extend(compare(reference[report.label], report, round_number,
+                                      control_tolerance))
+            exercise(navigator.screens[name], round_number)
+
+    last = tracker.last_report
+    growth = last.traced_bytes - reference[last.label].traced_bytes
+    if growth > budget_kib * 1024:
+        errors.append(f"la memoria retenida creció {growth / 1024:.1f} KiB en {switches} vueltas "
+                      f"(presupuesto {budget_kib:.0f} KiB)")
+        errors.extend(f"  {size_diff / 1024:+.1f} KiB: {site}"
+                      for site, size_diff, _ in last.top_sites)
+
+    # Las sesiones cerradas no deben dejar pantallas vivas ni oyentes registrados.
+    # La variable del bucle es un método del navegador y lo mantendría vivo
+    navigator.close()
+    del navigator, page, switch, exercise
+    open_sessions(app, sessions)
+    closed = tracker.checkpoint("sesiones cerradas")
+    for name in EXACT_COUNTERS:
+        if closed.counts[name]:
+            errors.append(f"tras cerrar {sessions + 1} sesiones quedan {closed.counts[name]} {name}")
+    return errors
+
+
+def open_sessions(app, sessions: int) -> None:
+    """Abre y cierra sesiones que pasan por las dos pantallas."""
+    for _ in range(sessions):
+        navigator = app.ScreenNavigator(HeadlessPage())
+        navigator.open()
+        navigator.switch_to_config()
+        navigator.close()
+
+
+def compare(reference, report, round_number: int, control_tolerance: int) -> List[str]:
+    """Diferencias de un cambio de pantalla respecto al mismo cambio en el calentamiento."""
+    errors = []
+    for name in EXACT_COUNTERS:
+        if report.counts[name] != reference.counts[name]:
+            errors.append(f"vuelta {round_number}, {report.label}: {name} pasó de "
+                          f"{reference.counts[name]} a {report.counts[name]}")
+    controls = report.counts["ft.Control"] - reference.counts["ft.Control"]
+    if controls > control_tolerance:
+        errors.append(f"vuelta {round_number}, {report.label}: {controls} controles más "
+                      f"que en el calentamiento")
+    return errors
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Comprobación de fugas al cambiar de pantalla")
+    parser.add_argument("--switches", type=int, default=None,
+                        help=f"Vueltas generador → configuración (por defecto {DEFAULT_SWITCHES})")
+    parser.add_argument("--sessions", type=int, default=None,
+                        help=f"Sesiones que se abren y se cierran (por defecto {DEFAULT_SESSIONS})")
+    parser.add_argument("--long", action="store_true",
+                        help=f"Comprobación larga: {LONG_SWITCHES} vueltas y {LONG_SESSIONS} sesiones")
+    parser.add_argument("--control-tolerance", type=int, default=0,
+                        help="Controles de más admitidos en un cambio respecto al calentamiento")
+    parser.add_argument("--budget-kib", type=float, default=256,
+                        help="Crecimiento máximo de la memoria retenida en todas las vueltas")
+    args = parser.parse_args(argv)
+    if args.switches is None:
+        args.switches = LONG_SWITCHES if args.long else DEFAULT_SWITCHES
+    if args.sessions is None:
+        args.sessions = LONG_SESSIONS if args.long else DEFAULT_SESSIONS
+
+    if importlib.util.find_spec("flet") is None:
+        print("Flet no está instalado: se omite la comprobación de fugas")
+        return 0
+
+    # La aplicación se importa ya desde el directorio temporal, donde las
+    # plantillas y el historial de la prueba no tocan los del usuario
+    sys.path.insert(0, os.getcwd())
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        previous = os.getcwd()
+        os.chdir(directory)
+        try:
+            errors = run(args.switches, args.sessions, args.control_tolerance, args.budget_kib)
+        finally:
+            # Sin la vigilancia, nada vuelve a cargar ni a crear las plantillas
+            # de la prueba fuera del directorio temporal
+            from utils.template_repository import get_repository
+            get_repository().stop_watching()
+            os.chdir(previous)
+    elapsed = time.perf_counter() - started
+
+    for error in errors:
+        print(f"ERROR: {error}")
+    print(f"{args.switches} vueltas y {args.sessions} sesiones en {elapsed:.2f} s: "
+          f"{'fallo' if errors else 'ok'}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""
+Pruebas de rendimiento de las rutas críticas del gestor de mensajes.
+
+Mide, sobre una biblioteca sintética, la lectura y escritura del almacenamiento,
+``initialize_templates``, las consultas del ``TemplateBuilder`` y el renderizado
+de mensajes (``str.format`` y plantillas compiladas) y las sugerencias del
+historial de campos. Para cada caso informa los
+percentiles p50/p95/p99 por operación y el pico de memoria medido con
+tracemalloc. No necesita Flet.
+
+Uso:
+    python -m benchmarks.run_benchmarks --platforms 20 --types 50 --fields 8 \\
+        --output resultados.json --compare resultados_anteriores.json
+"""
+import argparse
+import json
+import os
+import platform as platform_info
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.synthetic_library import generate_library, generate_values
+from models.template_models import TemplateBuilder
+from utils.field_history import FieldHistory
+from utils.persistence import TemplateStorage
+from utils.template_engine import CompiledTemplate, SegmentRenderer, TemplateEngine
+from utils.template_initializer import initialize_templates
+from utils.template_repository import create_storage
+
+STORAGE_BACKENDS = ("json", "journal", "sqlite", "indexed")
+
+# Consultas y renderizados por muestra en los casos muy rápidos
+LOOKUPS_PER_SAMPLE = 1000
+
+PERCENTILES = (50, 95, 99)
+
+# Tamaño de la plantilla grande (texto legal con pocos campos) y pulsaciones por muestra
+LARGE_TEMPLATE_CHARS = 500_000
+KEYSTROKES_PER_SAMPLE = 100
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_samples))) - 1, 0)
+    return sorted_samples[min(rank, len(sorted_samples) - 1)]
+
+
+def measure(func: Callable[[], Any], repeat: int, operations: int = 1) -> Dict[str, float]:
+    """
+    Mide un caso de prueba.
+
+    Los tiempos se toman sin tracemalloc activo; el pico de memoria se mide
+    aparte en una ejecución adicional.
+
+    Args:
+        func: Función a medir.
+        repeat: Número de muestras.
+        operations: Operaciones que realiza cada llamada a ``func``; los tiempos
+            se informan por operación.
+
+    Returns:
+        Dict: Percentiles, media, mínimo y máximo en milisegundos y pico de memoria en KiB.
+    """
+    # Calentamiento
+    func()
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000 / operations)
+    samples.sort()
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {f"p{pct}_ms": percentile(samples, pct) for pct in PERCENTILES}
+    result.update({
+        "mean_ms": sum(samples) / len(samples),
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+        "samples": len(samples),
+        "operations": operations,
+        "peak_memory_kb": peak / 1024,
+    })
+    return result
+
+
+def storage_cases(library: Dict[str, Any], directory: str, backend: str,
+                  repeat: int) -> Dict[str, Dict[str, float]]:
+    """Mide la lectura y escritura de la biblioteca con un tipo de almacenamiento."""
+    json_path = os.path.join(directory, f"{backend}.json")
+    TemplateStorage(json_path).save_templates(library)
+    storage = create_storage(backend, json_path, write_behind=False)
+    try:
+        return {
+            f"storage.save_templates[{backend}]": measure(
+                lambda: storage.save_templates(library), repeat
+            ),
+            f"storage.load_templates[{backend}]": measure(
+                storage.load_templates, repeat
+            ),
+        }
+    finally:
+        if hasattr(storage, "close"):
+            storage.close()
+
+
+def initialization_case(library: Dict[str, Any], directory: str,
+                        repeat: int) -> Dict[str, Dict[str, float]]:
+    """Mide ``initialize_templates`` con una biblioteca ya guardada."""
+    storage = TemplateStorage(os.path.join(directory, "initialize.json"))
+    storage.save_templates(library)
+    return {"initialize_templates": measure(lambda: initialize_templates(storage), repeat)}
+
+
+def lookup_cases(library: Dict[str, Any], keys: List, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Mide las consultas del builder que hacen las pantallas."""
+    builder = TemplateBuilder.from_dict(library)
+
+    def get_templates():
+        for platform, message_type in keys:
+            builder.get_template(platform, message_type)
+
+    def get_message_types():
+        for platform, _ in keys:
+            builder.get_message_types(platform)
+
+    # Recarga en la que otra instancia añadió un tipo a una sola plataforma:
+    # se alterna entre las dos versiones, emitiendo los eventos a un oyente
+    reloading = TemplateBuilder.from_dict(library)
+    original = reloading.platforms
+    reloaded = dict(original)
+    if reloaded:
+        platform = next(iter(reloaded))
+        reloaded[platform] = {**reloaded[platform], "nuevo_tipo": None}
+    events = []
+    reloading.subscribe(events.append)
+
+    def replace_platforms():
+        reloading.replace_platforms(reloaded)
+        reloading.replace_platforms(original)
+        events.clear()
+
+    return {
+        # El pico de memoria de este caso es lo que ocupa la biblioteca en el builder
+        "builder.from_dict": measure(lambda: TemplateBuilder.from_dict(library), repeat),
+        "builder.get_platforms": measure(builder.get_platforms, repeat),
+        "builder.get_message_types": measure(get_message_types, repeat, len(keys)),
+        "builder.get_template": measure(get_templates, repeat, len(keys)),
+        "builder.replace_platforms": measure(replace_platforms, repeat, 2),
+    }
+
+
+def render_cases(library: Dict[str, Any], keys: List, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Mide el renderizado de la vista previa y de la generación de mensajes."""
+    templates = [(p, t, library[p][t]) for p, t in keys]
+    values = [generate_values(data["fields"]) for _, _, data in templates]
+    engine = TemplateEngine()
+
+    def render_format():
+        for (_, _, data), field_values in zip(templates, values):
+            data["template"].format(**field_values)
+
+    def render_compiled():
+        for (p, t, data), field_values in zip(templates, values):
+            engine.compile(p, t, data["template"]).render(field_values)
+
+    return {
+        "render.str_format": measure(render_format, repeat, len(templates)),
+        "render.compiled": measure(render_compiled, repeat, len(templates)),
+    }
+
+
+def large_template_cases(repeat: int) -> Dict[str, Dict[str, float]]:
+    """Mide una pulsación en un campo de una plantilla de cientos de KB."""
+    fields = ("nombre", "cedula", "fecha", "monto")
+    chunk = "Lorem ipsum dolor sit amet. " * (LARGE_TEMPLATE_CHARS // (28 * (len(fields) * 2 + 1)))
+    text = chunk + "".join("{" + field + "}" + chunk for field in fields * 2)
+    template = CompiledTemplate(text)
+    values = {field: field.upper() for field in fields}
+    # Lo que se va escribiendo en la cédula
+    typed = ["1234567890"[:length] for length in range(1, 11)] * (KEYSTROKES_PER_SAMPLE // 10)
+    renderer = SegmentRenderer(template)
+    renderer.update(values)
+
+    def render_full():
+        for cedula in typed:
+            values["cedula"] = cedula
+            template.render(values)
+
+    def render_segments():
+        for cedula in typed:
+            values["cedula"] = cedula
+            renderer.update(values)
+
+    return {
+        "render.large_full": measure(render_full, repeat, len(typed)),
+        "render.large_segments": measure(render_segments, repeat, len(typed)),
+    }
+
+
+def history_cases(directory: str, values: int, seed: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Mide las sugerencias del historial de campos con ``values`` valores distintos."""
+    rng = random.Random(seed)
+    names = ("ana", "andrés", "beatriz", "carlos", "lucía", "maría", "pedro", "sofía")
+    history = FieldHistory(os.path.join(directory, "field_history.jsonl"), max_values=values)
+    for i in range(values):
+        history.record({"remitente": f"{rng.choice(names)} {rng.choice(names)} {i}"})
+    # Lo que se escribe letra a letra en el campo
+    prefixes = [name[:length] for name in names for length in range(len(name) + 1)]
+
+    def suggest():
+        for prefix in prefixes:
+            history.suggest("remitente", prefix)
+
+    return {"history.suggest": measure(suggest, repeat, len(prefixes))}
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Ejecuta todos los casos y devuelve el informe."""
+    library = generate_library(args.platforms, args.types, args.fields, args.body_size, args.seed)
+    rng = random.Random(args.seed)
+    all_keys = [(p, t) for p, types in library.items() for t in types]
+    keys = [rng.choice(all_keys) for _ in range(LOOKUPS_PER_SAMPLE)]
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in args.backends:
+            results.update(storage_cases(library, directory, backend, args.repeat))
+        results.update(initialization_case(library, directory, args.repeat))
+        results.update(history_cases(directory, len(all_keys), args.seed, args.repeat))
+    results.update(lookup_cases(library, keys, args.repeat))
+    results.update(render_cases(library, keys, args.repeat))
+    results.update(large_template_cases(args.repeat))
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform_info.platform(),
+            "library": {
+                "platforms": args.platforms,
+                "types": args.types,
+                "fields": args.fields,
+                "body_size": args.body_size,
+                "seed": args.seed,
+                "templates": len(all_keys),
+            },
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    """Muestra los resultados en una tabla, comparándolos con otra ejecución si se indica."""
+    previous = baseline["results"] if baseline else {}
+    header = f"{'caso':<36}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'pico KiB':>12}"
+    if baseline:
+        header += f"{'p50 ant.':>12}{'cambio':>9}"
+    print(header)
+    for name, result in report["results"].items():
+        line = (f"{name:<36}{result['p50_ms']:>12.4f}{result['p95_ms']:>12.4f}"
+                f"{result['p99_ms']:>12.4f}{result['peak_memory_kb']:>12.1f}")
+        old = previous.get(name, {}).get("p50_ms")
+        if baseline and old:
+            line += f"{old:>12.4f}{(result['p50_ms'] / old - 1) * 100:>+8.1f}%"
+        print(line)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento del gestor de mensajes")
+    parser.add_argument("--platforms", type=int, default=10, help="Número de plataformas")
+    parser.add_argument("--types", type=int, default=50, help="Tipos de mensaje por plataforma")
+    parser.add_argument("--fields", type=int, default=6, help="Campos por plantilla")
+    parser.add_argument("--body-size", type=int, default=400,
+                        help="Tamaño aproximado de cada plantilla en caracteres")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de la biblioteca sintética")
+    parser.add_argument("--repeat", type=int, default=30, help="Muestras por caso")
+    parser.add_argument("--backends", default="json",
+                        help=f"Almacenamientos a medir, separados por comas ({', '.join(STORAGE_BACKENDS)})")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--compare", help="Resultados JSON de otra ejecución para comparar")
+    args = parser.parse_args(argv)
+
+    args.backends = [backend.strip() for backend in args.backends.split(",") if backend.strip()]
+    unknown = [backend for backend in args.backends if backend not in STORAGE_BACKENDS]
+    if unknown:
+        parser.error(f"Almacenamiento desconocido: {', '.join(unknown)}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    report = run(args)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f"Resultados guardados en '{args.output}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Prueba de carga del builder de plantillas desde muchos hilos.
+
+Varios hilos escriben a la vez sobre las mismas plataformas (altas de tipos,
+plantillas y bajas) mientras otros leen la biblioteca sin parar, como hacen
+los manejadores de Flet en su grupo de hilos. Falla si alguna lectura ve un
+diccionario a medio modificar, si se pierde alguna escritura o si los eventos
+no llegan en el orden de las versiones.
+
+Uso:
+    python -m benchmarks.stress_builder
+    python -m benchmarks.stress_builder --writers 16 --readers 16 --operations 2000
+"""
+import argparse
+import sys
+import threading
+import time
+from typing import List, Optional
+
+from models.template_models import TemplateBuilder
+
+# Plataformas que comparten todos los escritores
+SHARED_PLATFORMS = ("Correo", "Chat", "SMS")
+
+
+def run(writers: int, readers: int, operations: int) -> List[str]:
+    """
+    Ejecuta la prueba de carga.
+
+    Returns:
+        List[str]: Errores encontrados (vacía si todo fue bien).
+    """
+    builder = TemplateBuilder()
+    errors: List[str] = []
+    events = []
+    builder.subscribe(events.append)
+    start = threading.Barrier(writers + readers)
+    done = threading.Event()
+
+    def write(writer: int) -> None:
+        start.wait()
+        try:
+            for i in range(operations):
+                platform = SHARED_PLATFORMS[i % len(SHARED_PLATFORMS)]
+                message_type = f"tipo_{writer}_{i}"
+                builder.add_message_type(platform, message_type)
+                builder.add_template(platform, message_type, f"Hola {{nombre}} {i}", ["nombre"])
+                # Uno de cada cuatro tipos se elimina después de crearlo
+                if i % 4 == 3:
+                    builder.remove_message_type(platform, message_type)
+                # Alta condicional atómica: solo un escritor crea el tipo común
+                with builder.transaction():
+                    if "comun" not in builder.get_message_types(platform):
+                        builder.add_template(platform, "comun", f"de {writer}", [])
+        except Exception as e:
+            errors.append(f"escritor {writer}: {e!r}")
+
+    def read(reader: int) -> None:
+        start.wait()
+        try:
+            while not done.is_set():
+                library = builder.snapshot()
+                for platform in library.get_platforms():
+                    for message_type in library.get_message_types(platform):
+                        template = library.get_template(platform, message_type)
+                        if template is not None and not template.template:
+                            raise AssertionError(f"plantilla vacía en {platform}/{message_type}")
+                library.to_dict()
+        except Exception as e:
+            errors.append(f"lector {reader}: {e!r}")
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=read, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads[:writers]:
+        thread.join()
+    done.set()
+    for thread in threads[writers:]:
+        thread.join()
+
+    # Cada escritor deja 3 de cada 4 tipos y el tipo común existe una vez por plataforma
+    expected = {
+        f"tipo_{writer}_{i}"
+        for writer in range(writers) for i in range(operations) if i % 4 != 3
+    }
+    found = {
+        message_type
+        for platform in SHARED_PLATFORMS for message_type in builder.get_message_types(platform)
+        if message_type != "comun"
+    }
+    if found != expected:
+        errors.append(f"se perdieron {len(expected - found)} tipos y sobran {len(found - expected)}")
+    for platform in SHARED_PLATFORMS:
+        if builder.get_template(platform, "comun") is None:
+            errors.append(f"falta el tipo común en {platform}")
+    common_added = sum(1 for event in events if event.message_type == "comun")
+    if common_added != len(SHARED_PLATFORMS):
+        errors.append(f"el tipo común se creó {common_added} veces")
+
+    versions = [event.version for event in events]
+    if any(later < earlier for earlier, later in zip(versions, versions[1:])):
+        errors.append("los eventos no llegaron en el orden de las versiones")
+    return errors
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga del builder desde muchos hilos")
+    parser.add_argument("--writers", type=int, default=8, help="Hilos que modifican el builder")
+    parser.add_argument("--readers", type=int, default=8, help="Hilos que leen la biblioteca")
+    parser.add_argument("--operations", type=int, default=500, help="Tipos que crea cada escritor")
+    args = parser.parse_args(argv)
+
+    # Cambiar de hilo mucho más a menudo para provocar las carreras
+    sys.setswitchinterval(1e-6)
+    started = time.perf_counter()
+    errors = run(args.writers, args.readers, args.operations)
+    elapsed = time.perf_counter() - started
+
+    for error in errors:
+        print(f"ERROR: {error}")
+    print(f"{args.writers} escritores, {args.readers} lectores, "
+          f"{args.writers * args.operations} tipos en {elapsed:.2f} s: "
+          f"{'fallo' if errors else 'ok'}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
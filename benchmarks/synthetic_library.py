@@ -0,0 +1,91 @@
+"""
+Generador de bibliotecas de plantillas sintéticas para las pruebas de rendimiento.
+
+Produce diccionarios con el mismo formato que ``templates_data.json``:
+N plataformas × M tipos de mensaje × K campos, con cuerpos del tamaño indicado.
+"""
+import random
+from typing import Any, Dict, List
+
+# Palabras de relleno para los cuerpos de las plantillas
+_WORDS = (
+    "estimado cliente le informamos que su solicitud ha sido procesada "
+    "correctamente quedamos atentos a cualquier consulta adicional saludos "
+    "cordiales equipo de soporte ticket referencia pago factura envío"
+).split()
+
+
+def generate_fields(count: int) -> List[str]:
+    """
+    Genera nombres de campos únicos.
+
+    Args:
+        count: Número de campos.
+
+    Returns:
+        List[str]: Nombres de los campos.
+    """
+    return [f"campo_{i}" for i in range(count)]
+
+
+def generate_body(rng: random.Random, fields: List[str], body_size: int) -> str:
+    """
+    Genera el texto de una plantilla con los campos repartidos por el cuerpo.
+
+    Args:
+        rng: Generador de números aleatorios.
+        fields: Campos que deben aparecer en la plantilla.
+        body_size: Tamaño aproximado del cuerpo en caracteres.
+
+    Returns:
+        str: Texto de la plantilla.
+    """
+    placeholders = [f"{{{field}}}" for field in fields]
+    # Caracteres de texto fijo que quedan después de los huecos
+    filler_size = max(body_size - sum(len(p) for p in placeholders), 0)
+    chunks = len(placeholders) + 1
+    parts = []
+    for i in range(chunks):
+        words = []
+        length = 0
+        while length < filler_size // chunks:
+            word = rng.choice(_WORDS)
+            words.append(word)
+            length += len(word) + 1
+        parts.append(" ".join(words))
+        if i < len(placeholders):
+            parts.append(placeholders[i])
+    return " ".join(part for part in parts if part)
+
+
+def generate_library(platforms: int, message_types: int, fields: int,
+                     body_size: int = 400, seed: int = 0) -> Dict[str, Any]:
+    """
+    Genera una biblioteca de plantillas sintética.
+
+    Args:
+        platforms: Número de plataformas.
+        message_types: Tipos de mensaje por plataforma.
+        fields: Campos por plantilla.
+        body_size: Tamaño aproximado de cada plantilla en caracteres.
+        seed: Semilla para obtener siempre la misma biblioteca.
+
+    Returns:
+        Dict: Datos de las plantillas en el formato de persistencia.
+    """
+    rng = random.Random(seed)
+    field_names = generate_fields(fields)
+    library: Dict[str, Any] = {}
+    for p in range(platforms):
+        platform = library[f"Plataforma {p}"] = {}
+        for t in range(message_types):
+            platform[f"Tipo de mensaje {t}"] = {
+                "template": generate_body(rng, field_names, body_size),
+                "fields": list(field_names)
+            }
+    return library
+
+
+def generate_values(fields: List[str]) -> Dict[str, str]:
+    """Genera valores de ejemplo para los campos de una plantilla."""
+    return {field: f"valor de {field}" for field in fields}
@@ -0,0 +1,107 @@
+"""
+Línea de comandos del gestor de mensajes.
+
+Usa solo el núcleo (modelos, almacenamiento y renderizado), sin importar Flet,
+por lo que arranca en unos pocos milisegundos.
+
+Uso:
+    python -m cli list
+    python -m cli list --platform Tickets
+    python -m cli show --platform Tickets --type Anulación
+    python -m cli render --platform Tickets --type Anulación remitente=Ana firma="Equipo"
+"""
+import argparse
+import sys
+from typing import Dict, List, Optional
+
+from utils.message_renderer import render_message
+from utils.template_initializer import initialize_templates
+from utils.template_repository import STORAGE_BACKEND, create_storage
+
+
+def parse_values(assignments: List[str]) -> Dict[str, str]:
+    """
+    Convierte argumentos ``campo=valor`` en un diccionario.
+
+    Raises:
+        ValueError: Si algún argumento no tiene el formato campo=valor.
+    """
+    values = {}
+    for assignment in assignments:
+        field, separator, value = assignment.partition("=")
+        if not separator or not field:
+            raise ValueError(f"Valor inválido '{assignment}': usa campo=valor")
+        values[field] = value
+    return values
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Gestor de mensajes")
+    parser.add_argument("--data", default="templates_data.json",
+                        help="Archivo de persistencia de las plantillas")
+    parser.add_argument("--storage", default=STORAGE_BACKEND,
+                        help="Tipo de almacenamiento (json, journal, sqlite o indexed)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="Lista las plataformas o los tipos de una plataforma")
+    list_parser.add_argument("--platform", help="Plataforma cuyos tipos de mensaje listar")
+
+    show_parser = commands.add_parser("show", help="Muestra una plantilla y sus campos")
+    show_parser.add_argument("--platform", required=True, help="Plataforma")
+    show_parser.add_argument("--type", required=True, help="Tipo de mensaje")
+
+    render_parser = commands.add_parser("render", help="Genera un mensaje")
+    render_parser.add_argument("--platform", required=True, help="Plataforma")
+    render_parser.add_argument("--type", required=True, help="Tipo de mensaje")
+    render_parser.add_argument("--preview", action="store_true",
+                               help="Muestra los campos sin valor como {campo} en lugar de fallar")
+    render_parser.add_argument("values", nargs="*", metavar="campo=valor",
+                               help="Valores de los campos")
+
+    args = parser.parse_args(argv)
+    # Las mismas plantillas que ve la aplicación (las predeterminadas si aún no hay ninguna)
+    builder = initialize_templates(create_storage(args.storage, args.data, write_behind=False))
+
+    if args.command == "list":
+        if args.platform is None:
+            items = builder.get_platforms()
+        elif args.platform in builder.get_platforms():
+            items = builder.get_message_types(args.platform)
+        else:
+            print(f"Plataforma desconocida: {args.platform}", file=sys.stderr)
+            return 2
+        for item in items:
+            print(item)
+        return 0
+
+    template_data = builder.get_template(args.platform, args.type)
+    if not template_data:
+        print(f"No hay plantilla para {args.platform} / {args.type}", file=sys.stderr)
+        return 2
+
+    if args.command == "show":
+        print(template_data.template)
+        print()
+        print("Campos: " + ", ".join(template_data.fields))
+        return 0
+
+    try:
+        values = parse_values(args.values)
+    except ValueError as e:
+        parser.error(str(e))
+
+    missing = [field for field in template_data.fields if not values.get(field)]
+    if missing and not args.preview:
+        print("Faltan campos: " + ", ".join(missing), file=sys.stderr)
+        return 1
+
+    try:
+        print(render_message(builder, args.platform, args.type, values, preview=args.preview))
+    except (KeyError, ValueError) as e:
+        print(f"Error al generar mensaje: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
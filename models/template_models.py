@@ -1,82 +1,355 @@
 """
 Modelos para el gestor de mensajes utilizando el patrón Builder.
 """
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+import threading
+from itertools import count
+from sys import intern
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional, Set, Tuple
+
+# Plataforma → tipo de mensaje → plantilla (None si el tipo aún no tiene)
+Platforms = Dict[str, Dict[str, Optional["MessageTemplate"]]]
+
+# Números de versión únicos en todo el proceso, aunque se cree otro builder
+_versions = count(1)
+
+
+# Tipos de evento que emite el builder al modificarse
+PLATFORM_ADDED = "platform_added"
+PLATFORM_REMOVED = "platform_removed"
+TYPE_ADDED = "type_added"
+TYPE_REMOVED = "type_removed"
+TEMPLATE_CHANGED = "template_changed"
+EVENT_KINDS = (PLATFORM_ADDED, PLATFORM_REMOVED, TYPE_ADDED, TYPE_REMOVED, TEMPLATE_CHANGED)
+
+
+def next_version() -> int:
+    """Obtiene un número de versión nuevo, único en el proceso."""
+    return next(_versions)
+
+
+class TemplateEvent:
+    """Cambio concreto de la biblioteca emitido por el builder."""
+
+    __slots__ = ("kind", "platform", "message_type", "version")
+
+    def __init__(self, kind: str, platform: str, message_type: Optional[str] = None,
+                 version: int = 0):
+        # Uno de EVENT_KINDS; message_type es None en los eventos de plataforma
+        self.kind = kind
+        self.platform = platform
+        self.message_type = message_type
+        # Versión de la biblioteca que ya incluye el cambio
+        self.version = version
+
+    def __repr__(self) -> str:
+        return (f"TemplateEvent({self.kind!r}, {self.platform!r}, "
+                f"{self.message_type!r}, version={self.version})")
+
+
+# Función que recibe los eventos de un builder
+TemplateListener = Callable[[TemplateEvent], None]
+
+
+class TemplateEventSource:
+    """
+    Oyentes de los eventos de un builder (compartido por el builder y sus fachadas).
+
+    Los oyentes se llaman en el hilo que hace el cambio, una vez publicada la
+    nueva versión, y no deben volver a modificar el builder.
+    """
+
+    __slots__ = ()
+
+    # Lista que se reemplaza al suscribir, para emitir sin copiarla ni bloquear
+    _listeners: List[TemplateListener]
+
+    def subscribe(self, listener: TemplateListener) -> None:
+        """Registra una función a la que avisar de cada cambio."""
+        if listener not in self._listeners:
+            self._listeners = self._listeners + [listener]
+
+    @property
+    def subscriber_count(self) -> int:
+        """Número de funciones registradas (una pantalla que no se dio de baja sigue contando)."""
+        return len(self._listeners)
+
+    def unsubscribe(self, listener: TemplateListener) -> None:
+        """Deja de avisar a una función registrada con ``subscribe``."""
+        self._listeners = [registered for registered in self._listeners if registered != listener]
+
+    def _emit(self, kind: str, platform: str, message_type: Optional[str] = None) -> None:
+        listeners = self._listeners
+        if not listeners:
+            return
+        event = TemplateEvent(kind, platform, message_type, self.version)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Error al procesar el evento {event!r}: {e}")
 
 
-@dataclass
 class MessageTemplate:
-    """Clase que representa una plantilla de mensaje."""
-    template: str
-    fields: List[str]
-
-
-@dataclass
-class MessageType:
-    """Clase que representa un tipo de mensaje dentro de una plataforma."""
-    name: str
-    templates: Dict[str, MessageTemplate] = field(default_factory=dict)
-    
-    def add_template(self, template_name: str, template_text: str, fields: List[str]) -> None:
-        """Añade una nueva plantilla al tipo de mensaje."""
-        self.templates[template_name] = MessageTemplate(template=template_text, fields=fields)
-    
-    def get_template(self, template_name: str) -> Optional[MessageTemplate]:
-        """Obtiene una plantilla por su nombre."""
-        return self.templates.get(template_name)
-
-
-@dataclass
-class TemplateBuilder:
+    """Clase que representa una plantilla de mensaje (no se modifica una vez creada)."""
+
+    __slots__ = ("template", "fields")
+
+    def __init__(self, template: str, fields: Iterable[str]):
+        self.template = template
+        self.fields: Tuple[str, ...] = tuple(map(intern, fields))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, MessageTemplate):
+            return NotImplemented
+        return self.template == other.template and self.fields == other.fields
+
+    def __repr__(self) -> str:
+        return f"MessageTemplate(template={self.template!r}, fields={self.fields!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convierte la plantilla al formato de serialización."""
+        return {"template": self.template, "fields": list(self.fields)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["MessageTemplate"]:
+        """
+        Crea una plantilla a partir de su formato de serialización.
+
+        Returns:
+            Optional[MessageTemplate]: Plantilla, o None si el tipo de mensaje
+            todavía no tiene plantilla (diccionario vacío).
+        """
+        if not data:
+            return None
+        return cls(data["template"], data["fields"])
+
+
+class TemplateSnapshot:
+    """Versión inmutable de la biblioteca de plantillas."""
+
+    __slots__ = ("platforms", "version")
+
+    def __init__(self, platforms: Platforms, version: int):
+        # Compartido con otras versiones: no se debe modificar
+        self.platforms = platforms
+        self.version = version
+
+    def snapshot(self) -> "TemplateSnapshot":
+        """Una instantánea ya es inmutable: devuelve la misma."""
+        return self
+
+    def get_template(self, platform_name: str, message_type: str) -> Optional[MessageTemplate]:
+        """Obtiene una plantilla por su plataforma y tipo de mensaje (None si no tiene)."""
+        message_types = self.platforms.get(platform_name)
+        if message_types is None:
+            return None
+        return message_types.get(message_type)
+
+    def get_platforms(self) -> List[str]:
+        """Obtiene la lista de plataformas disponibles."""
+        return list(self.platforms.keys())
+
+    def get_message_types(self, platform_name: str) -> List[str]:
+        """Obtiene la lista de tipos de mensaje para una plataforma."""
+        if platform_name in self.platforms:
+            return list(self.platforms[platform_name].keys())
+        return []
+
+    def to_dict(self) -> Dict:
+        """Convierte la biblioteca a un diccionario para serialización."""
+        return {
+            platform: {
+                message_type: template.to_dict() if template is not None else {}
+                for message_type, template in message_types.items()
+            }
+            for platform, message_types in self.platforms.items()
+        }
+
+
+class TemplateBuilder(TemplateEventSource):
     """Builder para construir plantillas de mensajes."""
-    platforms: Dict[str, Dict[str, MessageTemplate]] = field(default_factory=dict)
-    
+
+    __slots__ = ("_snapshot", "_listeners", "_write_lock")
+
+    def __init__(self, platforms: Optional[Platforms] = None):
+        self._snapshot = TemplateSnapshot(platforms if platforms is not None else {}, next_version())
+        self._listeners = []
+        # Solo lo toman las modificaciones; las lecturas usan la instantánea actual
+        self._write_lock = threading.RLock()
+
+    @property
+    def platforms(self) -> Platforms:
+        """Plataformas de la versión actual (solo lectura: usar los métodos del builder)."""
+        return self._snapshot.platforms
+
+    @platforms.setter
+    def platforms(self, platforms: Platforms) -> None:
+        # Reemplazar la biblioteca completa también crea una versión nueva
+        # (sin eventos: para avisar de los cambios usar replace_platforms)
+        self._snapshot = TemplateSnapshot(platforms, next_version())
+
+    @property
+    def version(self) -> int:
+        """Número de la versión actual; cambia con cada modificación."""
+        return self._snapshot.version
+
+    def snapshot(self) -> TemplateSnapshot:
+        """
+        Obtiene la versión actual de la biblioteca.
+
+        Returns:
+            TemplateSnapshot: Instantánea que no cambia aunque se siga editando el builder.
+        """
+        return self._snapshot
+
+    def transaction(self) -> ContextManager:
+        """
+        Bloquea el builder para hacer varias operaciones como una sola.
+
+        Mientras se mantiene, ningún otro hilo puede modificar el builder; las
+        lecturas siguen sin bloquearse. Es reentrante, así que dentro se pueden
+        usar los métodos del builder::
+
+            with builder.transaction():
+                if message_type not in builder.get_message_types(platform_name):
+                    builder.add_template(platform_name, message_type, texto, campos)
+
+        Returns:
+            ContextManager: Bloqueo de escritura del builder.
+        """
+        return self._write_lock
+
+    def replace_platforms(self, platforms: Platforms) -> Set[str]:
+        """
+        Reemplaza la biblioteca completa emitiendo los eventos de lo que cambió.
+
+        Una plataforma nueva o eliminada emite solo su evento de plataforma,
+        no uno por cada uno de sus tipos.
+
+        Args:
+            platforms: Nueva biblioteca (por ejemplo, recargada del almacenamiento).
+
+        Returns:
+            Set[str]: Plataformas que cambiaron.
+        """
+        with self._write_lock:
+            old_platforms = self._snapshot.platforms
+            self.platforms = platforms
+            changed = set()
+            for platform_name in old_platforms:
+                if platform_name not in platforms:
+                    changed.add(platform_name)
+                    self._emit(PLATFORM_REMOVED, platform_name)
+            for platform_name, message_types in platforms.items():
+                old_types = old_platforms.get(platform_name)
+                if old_types is None:
+                    changed.add(platform_name)
+                    self._emit(PLATFORM_ADDED, platform_name)
+                elif old_types is not message_types and old_types != message_types:
+                    changed.add(platform_name)
+                    for message_type in old_types:
+                        if message_type not in message_types:
+                            self._emit(TYPE_REMOVED, platform_name, message_type)
+                    for message_type, template in message_types.items():
+                        if message_type not in old_types:
+                            self._emit(TYPE_ADDED, platform_name, message_type)
+                        elif old_types[message_type] != template:
+                            self._emit(TEMPLATE_CHANGED, platform_name, message_type)
+            return changed
+
+    def _replace_platform(self, platform_name: str,
+                          message_types: Optional[Dict[str, Optional[MessageTemplate]]]) -> None:
+        # Se llama con el bloqueo de escritura tomado, entre leer la versión
+        # actual y publicar la nueva. Copia superficial del primer nivel: las
+        # demás plataformas se comparten
+        platforms = dict(self._snapshot.platforms)
+        if message_types is None:
+            del platforms[platform_name]
+        else:
+            platforms[platform_name] = message_types
+        self.platforms = platforms
+
     def add_platform(self, platform_name: str) -> None:
         """Añade una nueva plataforma."""
-        if platform_name not in self.platforms:
-            self.platforms[platform_name] = {}
-    
+        with self._write_lock:
+            if platform_name not in self.platforms:
+                self._replace_platform(platform_name, {})
+                self._emit(PLATFORM_ADDED, platform_name)
+
     def add_message_type(self, platform_name: str, message_type: str) -> None:
         """Añade un nuevo tipo de mensaje a una plataforma."""
-        if platform_name not in self.platforms:
-            self.add_platform(platform_name)
-        
-        if message_type not in self.platforms[platform_name]:
-            self.platforms[platform_name][message_type] = {}
-    
-    def add_template(self, platform_name: str, message_type: str, 
-                    template_text: str, fields: List[str]) -> None:
-        """Añade una nueva plantilla a un tipo de mensaje."""
-        self.add_message_type(platform_name, message_type)
-        self.platforms[platform_name][message_type] = {
-            "template": template_text,
-            "fields": fields
-        }
-    
-    def get_template(self, platform_name: str, message_type: str) -> Optional[Dict]:
-        """Obtiene una plantilla por su plataforma y tipo de mensaje."""
-        if platform_name in self.platforms and message_type in self.platforms[platform_name]:
-            return self.platforms[platform_name][message_type]
-        return None
-    
+        with self._write_lock:
+            message_types = self.platforms.get(platform_name)
+            if message_types is None or message_type not in message_types:
+                message_types = dict(message_types or {})
+                message_types[intern(message_type)] = None
+                new_platform = platform_name not in self.platforms
+                self._replace_platform(platform_name, message_types)
+                if new_platform:
+                    self._emit(PLATFORM_ADDED, platform_name)
+                self._emit(TYPE_ADDED, platform_name, message_type)
+
+    def add_template(self, platform_name: str, message_type: str,
+                    template_text: str, fields: List[str]) -> bool:
+        """Añade una nueva plantilla a un tipo de mensaje; devuelve True si se guardó."""
+        with self._write_lock:
+            old_types = self.platforms.get(platform_name)
+            template = MessageTemplate(template_text, fields)
+            message_types = dict(old_types or {})
+            message_types[intern(message_type)] = template
+            self._replace_platform(platform_name, message_types)
+            if old_types is None:
+                self._emit(PLATFORM_ADDED, platform_name)
+            if old_types is None or message_type not in old_types:
+                self._emit(TYPE_ADDED, platform_name, message_type)
+            elif old_types[message_type] != template:
+                self._emit(TEMPLATE_CHANGED, platform_name, message_type)
+            return True
+
+    def remove_platform(self, platform_name: str) -> bool:
+        """Elimina una plataforma con todos sus tipos de mensaje."""
+        with self._write_lock:
+            if platform_name in self.platforms:
+                self._replace_platform(platform_name, None)
+                self._emit(PLATFORM_REMOVED, platform_name)
+                return True
+            return False
+
+    def remove_message_type(self, platform_name: str, message_type: str) -> bool:
+        """Elimina un tipo de mensaje de una plataforma."""
+        with self._write_lock:
+            if platform_name in self.platforms and message_type in self.platforms[platform_name]:
+                message_types = dict(self.platforms[platform_name])
+                del message_types[message_type]
+                self._replace_platform(platform_name, message_types)
+                self._emit(TYPE_REMOVED, platform_name, message_type)
+                return True
+            return False
+
+    def get_template(self, platform_name: str, message_type: str) -> Optional[MessageTemplate]:
+        """Obtiene una plantilla por su plataforma y tipo de mensaje (None si no tiene)."""
+        return self._snapshot.get_template(platform_name, message_type)
+
     def get_platforms(self) -> List[str]:
         """Obtiene la lista de plataformas disponibles."""
-        return list(self.platforms.keys())
-    
+        return self._snapshot.get_platforms()
+
     def get_message_types(self, platform_name: str) -> List[str]:
         """Obtiene la lista de tipos de mensaje para una plataforma."""
-        if platform_name in self.platforms:
-            return list(self.platforms[platform_name].keys())
-        return []
-    
+        return self._snapshot.get_message_types(platform_name)
+
     def to_dict(self) -> Dict:
         """Convierte el builder a un diccionario para serialización."""
-        return self.platforms
-    
+        return self._snapshot.to_dict()
+
     @classmethod
     def from_dict(cls, data: Dict) -> 'TemplateBuilder':
         """Crea un builder a partir de un diccionario deserializado."""
-        builder = cls()
-        builder.platforms = data
-        return builder
+        from_dict = MessageTemplate.from_dict
+        return cls({
+            platform: {
+                intern(message_type): from_dict(template_data)
+                for message_type, template_data in message_types.items()
+            }
+            for platform, message_types in data.items()
+        })
@@ -0,0 +1,307 @@
+"""
+Generación masiva de mensajes (combinación de correspondencia) sin interfaz gráfica.
+
+Lee registros desde CSV o JSONL como flujo, los renderiza contra una plantilla
+del ``TemplateBuilder`` en un ``ProcessPoolExecutor`` por bloques y escribe los
+resultados en el mismo orden de entrada. Solo se mantiene en memoria un número
+acotado de bloques, por lo que el tamaño del archivo de entrada no importa.
+
+Uso:
+    python -m utils.batch_renderer --platform Tickets --type Anulación \\
+        --input registros.csv --output mensajes.jsonl
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from utils.template_engine import CompiledTemplate
+from utils.template_repository import STORAGE_BACKEND, create_storage
+
+INPUT_FORMATS = ("csv", "jsonl")
+OUTPUT_FORMATS = ("jsonl", "text")
+
+# Separador entre mensajes en la salida de texto plano
+TEXT_SEPARATOR = "\n" + "-" * 40 + "\n"
+
+
+class RenderResult(NamedTuple):
+    """Resultado del renderizado de un registro."""
+    row: int
+    message: Optional[str]
+    error: Optional[str] = None
+    missing: Tuple[str, ...] = ()
+
+
+def iter_records(stream: TextIO, input_format: str) -> Iterator[Dict[str, object]]:
+    """
+    Lee los registros de entrada de forma perezosa.
+
+    Args:
+        stream: Flujo de texto de entrada.
+        input_format: Formato de entrada ("csv" o "jsonl").
+
+    Yields:
+        Dict: Un registro con los valores de los campos.
+    """
+    if input_format == "csv":
+        yield from csv.DictReader(stream)
+    elif input_format == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                # Una línea corrupta no debe detener todo el lote
+                record = {"__error__": f"JSON inválido en la línea {line_number}: {e}"}
+            if not isinstance(record, dict):
+                record = {"__error__": f"La línea {line_number} no es un objeto JSON"}
+            yield record
+    else:
+        raise ValueError(f"Formato de entrada no soportado: {input_format}")
+
+
+def render_record(compiled: CompiledTemplate, row: int,
+                  record: Dict[str, object]) -> RenderResult:
+    """
+    Renderiza un registro informando de los campos que faltan en lugar de abortar.
+
+    Args:
+        compiled: Plantilla compilada.
+        row: Número de fila (empezando en 1).
+        record: Valores de los campos.
+
+    Returns:
+        RenderResult: Mensaje generado o error de la fila.
+    """
+    if "__error__" in record:
+        return RenderResult(row, None, str(record["__error__"]))
+
+    # Las columnas ausentes en una fila CSV corta llegan como None
+    missing = tuple(f for f in compiled.fields if record.get(f) is None)
+    if missing:
+        return RenderResult(
+            row, None, "Faltan campos: " + ", ".join(missing), missing
+        )
+
+    try:
+        return RenderResult(row, compiled.render(record))
+    except Exception as e:
+        return RenderResult(row, None, f"Error al generar mensaje: {e}")
+
+
+# Plantilla compilada de cada proceso de trabajo
+_worker_template: Optional[CompiledTemplate] = None
+
+
+def _init_worker(template_text: str) -> None:
+    global _worker_template
+    _worker_template = CompiledTemplate(template_text)
+
+
+def _render_chunk(first_row: int, records: List[Dict[str, object]]) -> List[RenderResult]:
+    return [
+        render_record(_worker_template, first_row + i, record)
+        for i, record in enumerate(records)
+    ]
+
+
+def _chunks(records: Iterable[Dict[str, object]],
+            chunk_size: int) -> Iterator[Tuple[int, List[Dict[str, object]]]]:
+    iterator = iter(records)
+    row = 1
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield row, chunk
+        row += len(chunk)
+
+
+def render_records(template_text: str, records: Iterable[Dict[str, object]],
+                   workers: Optional[int] = None, chunk_size: int = 500,
+                   max_pending: Optional[int] = None) -> Iterator[RenderResult]:
+    """
+    Renderiza registros en paralelo manteniendo el orden de entrada.
+
+    Args:
+        template_text: Texto de la plantilla.
+        records: Registros a renderizar (puede ser un iterador perezoso).
+        workers: Número de procesos; con 0 o 1 se renderiza en el proceso actual.
+        chunk_size: Registros por bloque enviado a cada proceso.
+        max_pending: Bloques en vuelo como máximo; por defecto el doble de procesos.
+
+    Yields:
+        RenderResult: Resultado de cada registro, en el orden de entrada.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size debe ser mayor que cero")
+
+    compiled = CompiledTemplate(template_text)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        for row, record in enumerate(records, start=1):
+            yield render_record(compiled, row, record)
+        return
+
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(template_text,)) as executor:
+        pending = deque()
+        for first_row, chunk in _chunks(records, chunk_size):
+            pending.append(executor.submit(_render_chunk, first_row, chunk))
+            # Limitar los bloques en vuelo mantiene la memoria acotada
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def write_results(results: Iterable[RenderResult], output: TextIO,
+                  output_format: str = "jsonl",
+                  errors: Optional[TextIO] = None) -> Tuple[int, int]:
+    """
+    Escribe los resultados en el flujo de salida.
+
+    En formato JSONL los errores se escriben en línea con su número de fila;
+    en texto plano se escriben en ``errors``.
+
+    Returns:
+        Tuple[int, int]: Mensajes generados y filas con errores.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Formato de salida no soportado: {output_format}")
+
+    generated = failed = 0
+    for result in results:
+        if result.error is None:
+            generated += 1
+        else:
+            failed += 1
+
+        if output_format == "jsonl":
+            if result.error is None:
+                entry = {"row": result.row, "message": result.message}
+            else:
+                entry = {"row": result.row, "error": result.error}
+                if result.missing:
+                    entry["missing"] = list(result.missing)
+            output.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        elif result.error is None:
+            if generated > 1:
+                output.write(TEXT_SEPARATOR)
+            output.write(result.message)
+        elif errors is not None:
+            errors.write(f"Fila {result.row}: {result.error}\n")
+
+    return generated, failed
+
+
+def load_template_text(platform_name: str, message_type: str,
+                       data_file: str = "templates_data.json",
+                       backend: str = STORAGE_BACKEND) -> Optional[str]:
+    """Obtiene el texto de una plantilla del mismo almacenamiento que usa la aplicación."""
+    builder = create_storage(backend, data_file, write_behind=False).load_builder()
+    template_data = builder.get_template(platform_name, message_type)
+    if not template_data:
+        return None
+    return template_data.template
+
+
+def _detect_format(path: str) -> str:
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Punto de entrada de la línea de comandos."""
+    parser = argparse.ArgumentParser(
+        description="Genera mensajes en lote a partir de registros CSV o JSONL."
+    )
+    parser.add_argument("--platform", required=True, help="Plataforma de la plantilla")
+    parser.add_argument("--type", required=True, dest="message_type",
+                        help="Tipo de mensaje de la plantilla")
+    parser.add_argument("--input", default="-", help="Archivo de entrada (- para stdin)")
+    parser.add_argument("--output", default="-", help="Archivo de salida (- para stdout)")
+    parser.add_argument("--input-format", choices=INPUT_FORMATS,
+                        help="Formato de entrada (por defecto según la extensión)")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="jsonl",
+                        help="Formato de salida")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Número de procesos (0 o 1 para no usar procesos)")
+    parser.add_argument("--chunk-size", type=int, default=500,
+                        help="Registros por bloque")
+    parser.add_argument("--data", default="templates_data.json",
+                        help="Archivo de persistencia de plantillas")
+    parser.add_argument("--storage", default=STORAGE_BACKEND,
+                        help="Tipo de almacenamiento (json, journal, sqlite o indexed)")
+    args = parser.parse_args(argv)
+
+    template_text = load_template_text(args.platform, args.message_type, args.data,
+                                       args.storage)
+    if template_text is None:
+        print(f"No existe la plantilla '{args.platform}' / '{args.message_type}'",
+              file=sys.stderr)
+        return 2
+
+    # Una plantilla mal formada se informa antes de abrir (y vaciar) la salida
+    try:
+        CompiledTemplate(template_text)
+    except ValueError as e:
+        print(f"La plantilla '{args.platform}' / '{args.message_type}' no es válida: {e}",
+              file=sys.stderr)
+        return 2
+
+    input_format = args.input_format or _detect_format(args.input)
+
+    try:
+        if args.input == "-":
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+        else:
+            source = open(args.input, "r", encoding="utf-8-sig", newline="")
+    except OSError as e:
+        print(f"No se puede abrir la entrada: {e}", file=sys.stderr)
+        return 2
+
+    try:
+        if args.output == "-":
+            target = sys.stdout
+        else:
+            target = open(args.output, "w", encoding="utf-8", newline="")
+    except OSError as e:
+        print(f"No se puede abrir la salida: {e}", file=sys.stderr)
+        if args.input != "-":
+            source.close()
+        return 2
+
+    try:
+        results = render_records(
+            template_text, iter_records(source, input_format),
+            workers=args.workers, chunk_size=args.chunk_size
+        )
+        generated, failed = write_results(results, target, args.output_format, sys.stderr)
+    except (OSError, ValueError) as e:
+        # Por ejemplo, una entrada que no es UTF-8 o un disco lleno
+        print(f"Error al generar los mensajes: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.input != "-":
+            source.close()
+        if args.output != "-":
+            target.close()
+
+    print(f"{generated} mensajes generados, {failed} filas con errores", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Detección incremental de los campos de una plantilla mientras se edita.
+
+En cada edición solo se vuelven a analizar las líneas modificadas: el resto de
+variables detectadas se desplazan sin volver a leer el texto. Además de los
+campos (en orden de aparición y con su número de apariciones), se informan las
+llaves mal formadas y las especificaciones de formato que fallarían al generar
+el mensaje.
+"""
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, NamedTuple, Tuple
+
+from utils.template_engine import field_base_name
+
+# Tamaño de bloque para comparar prefijos y sufijos sin recorrer carácter a carácter
+_BLOCK = 4096
+
+
+class Placeholder(NamedTuple):
+    """Variable {campo} encontrada en la plantilla."""
+    start: int
+    end: int
+    name: str
+
+
+class FieldError(NamedTuple):
+    """Error de sintaxis encontrado en la plantilla."""
+    start: int
+    message: str
+
+
+def _common_prefix(a: str, b: str) -> int:
+    limit = min(len(a), len(b))
+    position = 0
+    while position < limit:
+        step = min(_BLOCK, limit - position)
+        if a[position:position + step] == b[position:position + step]:
+            position += step
+            continue
+        for i in range(position, position + step):
+            if a[i] != b[i]:
+                return i
+    return limit
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    length = 0
+    while length < limit:
+        step = min(_BLOCK, limit - length)
+        if a[len(a) - length - step:len(a) - length] == b[len(b) - length - step:len(b) - length]:
+            length += step
+            continue
+        for i in range(step):
+            if a[len(a) - length - 1 - i] != b[len(b) - length - 1 - i]:
+                return length + i
+    return limit
+
+
+def _validate_spec(format_spec: str) -> bool:
+    # Los valores de los campos siempre son textos
+    if "{" in format_spec:
+        return True
+    try:
+        format("", format_spec)
+        return True
+    except ValueError:
+        return False
+
+
+def scan(text: str, start: int, end: int) -> Tuple[List[Placeholder], List[FieldError]]:
+    """
+    Analiza un fragmento de la plantilla que empieza y termina en límites de línea.
+
+    Args:
+        text: Texto completo de la plantilla.
+        start: Posición inicial del fragmento.
+        end: Posición final del fragmento.
+
+    Returns:
+        Tuple: Variables encontradas y errores de sintaxis.
+    """
+    placeholders: List[Placeholder] = []
+    errors: List[FieldError] = []
+    position = start
+
+    while position < end:
+        open_brace = text.find("{", position, end)
+        close_brace = text.find("}", position, end)
+        if open_brace == -1 and close_brace == -1:
+            break
+
+        if close_brace != -1 and (open_brace == -1 or close_brace < open_brace):
+            # Llave de cierre fuera de una variable: solo vale escapada como }}
+            if text.startswith("}}", close_brace):
+                position = close_brace + 2
+            else:
+                errors.append(FieldError(close_brace, "Llave '}' sin abrir"))
+                position = close_brace + 1
+            continue
+
+        if text.startswith("{{", open_brace):
+            position = open_brace + 2
+            continue
+
+        # Buscar la llave de cierre en la misma línea, admitiendo llaves anidadas
+        # en la especificación de formato (por ejemplo {campo:{ancho}})
+        line_end = text.find("\n", open_brace, end)
+        if line_end == -1:
+            line_end = end
+        depth = 0
+        closing = -1
+        for i in range(open_brace + 1, line_end):
+            char = text[i]
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                if depth == 0:
+                    closing = i
+                    break
+                depth -= 1
+        if closing == -1:
+            errors.append(FieldError(open_brace, "Llave '{' sin cerrar"))
+            position = line_end
+            continue
+
+        content = text[open_brace + 1:closing]
+        position = closing + 1
+
+        field_name, _, format_spec = content.partition(":")
+        field_name, bang, conversion = field_name.partition("!")
+        name = field_base_name(field_name)
+
+        if not name.strip():
+            errors.append(FieldError(open_brace, "Variable sin nombre '{}'"))
+            continue
+        if name.isdigit():
+            errors.append(FieldError(open_brace, f"Variable posicional '{{{name}}}': usa un nombre"))
+            continue
+        if bang and conversion not in ("r", "s", "a"):
+            errors.append(FieldError(open_brace, f"Conversión no válida en '{{{content}}}'"))
+            continue
+        if format_spec and not _validate_spec(format_spec):
+            errors.append(FieldError(open_brace, f"Formato no válido en '{{{content}}}'"))
+            continue
+
+        placeholders.append(Placeholder(open_brace, closing + 1, name))
+
+    return placeholders, errors
+
+
+class FieldDetector:
+    """Mantiene los campos detectados de una plantilla que se va editando."""
+
+    def __init__(self, text: str = ""):
+        """
+        Inicializa el detector analizando el texto completo.
+
+        Args:
+            text: Texto inicial de la plantilla.
+        """
+        self.reset(text)
+
+    def reset(self, text: str) -> None:
+        """Analiza desde cero un texto nuevo."""
+        self.text = text
+        self.placeholders, self.errors = scan(text, 0, len(text))
+        self.counts = Counter(placeholder.name for placeholder in self.placeholders)
+
+    def update(self, text: str) -> None:
+        """
+        Actualiza la detección tras una edición, analizando solo las líneas cambiadas.
+
+        Args:
+            text: Texto completo de la plantilla después de la edición.
+        """
+        old = self.text
+        if text == old:
+            return
+
+        prefix = _common_prefix(old, text)
+        suffix = _common_suffix(old, text, min(len(old), len(text)) - prefix)
+
+        # Ampliar la región modificada a líneas completas
+        start = old.rfind("\n", 0, prefix) + 1
+        old_end = old.find("\n", len(old) - suffix)
+        old_end = len(old) if old_end == -1 else old_end
+        delta = len(text) - len(old)
+        new_end = old_end + delta
+
+        # Quitar lo detectado en la región vieja y desplazar lo posterior
+        starts = [placeholder.start for placeholder in self.placeholders]
+        first = bisect_left(starts, start)
+        last = bisect_left(starts, old_end)
+        for placeholder in self.placeholders[first:last]:
+            self.counts[placeholder.name] -= 1
+            if not self.counts[placeholder.name]:
+                del self.counts[placeholder.name]
+
+        placeholders, errors = scan(text, start, new_end)
+        for placeholder in placeholders:
+            self.counts[placeholder.name] += 1
+
+        tail = [
+            Placeholder(p.start + delta, p.end + delta, p.name)
+            for p in self.placeholders[last:]
+        ] if delta else self.placeholders[last:]
+        self.placeholders = self.placeholders[:first] + placeholders + tail
+
+        self.errors = (
+            [error for error in self.errors if error.start < start]
+            + errors
+            + [FieldError(error.start + delta, error.message)
+               for error in self.errors if error.start >= old_end]
+        )
+        self.text = text
+
+    @property
+    def fields(self) -> List[str]:
+        """Campos detectados en orden de primera aparición, sin duplicados."""
+        return list(dict.fromkeys(placeholder.name for placeholder in self.placeholders))
+
+    def field_counts(self) -> Dict[str, int]:
+        """Número de apariciones de cada campo, en orden de primera aparición."""
+        return {field: self.counts[field] for field in self.fields}
+
+    def error_messages(self) -> List[str]:
+        """Errores de sintaxis con su número de línea."""
+        return [
+            f"Línea {self.text.count(chr(10), 0, error.start) + 1}: {error.message}"
+            for error in self.errors
+        ]
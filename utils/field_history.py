@@ -0,0 +1,299 @@
+"""
+Historial de valores de los campos con autocompletado por prefijo.
+
+Guarda, para cada campo (``remitente``, ``firma``...), los valores usados al
+generar mensajes con su número de usos y la fecha del último uso. Las
+sugerencias se buscan por prefijo con ``bisect`` sobre una lista ordenada de
+valores normalizados (minúsculas y sin tildes) y se ordenan por frecuencia,
+con más peso para los usos recientes. Los mejores valores de cada prefijo
+consultado se guardan en una caché que se actualiza con cada uso, de modo que
+incluso los prefijos de una letra responden en microsegundos.
+
+El historial se persiste en un archivo de solo anexado (una línea JSON por
+mensaje generado) que se compacta cuando acumula demasiadas líneas repetidas.
+El número de valores por campo está acotado: al superarlo se descartan los
+de menor puntuación.
+"""
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from heapq import nlargest
+from operator import attrgetter
+from typing import Dict, List, Optional
+
+from utils.file_lock import FileLock
+from utils.search_index import fold
+
+# Valores que se guardan como máximo por campo
+DEFAULT_MAX_VALUES = 5000
+
+# Al superar el máximo se descarta este porcentaje extra, para no hacerlo en cada uso
+EVICTION_SLACK = 0.1
+
+# Los usos pierden la mitad de su peso cada este número de segundos (una semana)
+HALF_LIFE_SECONDS = 7 * 24 * 3600
+
+# Se compacta el archivo cuando tiene más líneas que este factor por valor guardado
+COMPACT_FACTOR = 4
+
+# Líneas mínimas antes de plantearse compactar
+MIN_COMPACT_LINES = 1000
+
+# Los valores más largos no se guardan (no son valores que se repitan)
+MAX_VALUE_LENGTH = 200
+
+# Sugerencias que se guardan por prefijo y prefijos en caché por campo
+CACHED_SUGGESTIONS = 10
+MAX_CACHED_PREFIXES = 256
+
+_rank = attrgetter("rank")
+
+
+class _Entry:
+    """Uso acumulado de un valor."""
+
+    __slots__ = ("value", "folded", "uses", "last_used", "rank")
+
+    def __init__(self, value: str):
+        self.value = value
+        self.folded = fold(value)
+        self.uses = 0
+        self.last_used = 0.0
+        self.rank = 0.0
+
+    def use(self, uses: int, last_used: float) -> None:
+        self.uses += uses
+        self.last_used = max(self.last_used, last_used)
+        # La puntuación es usos × 0.5^(antigüedad / vida media); su logaritmo
+        # desplazado por el instante actual ordena igual y no cambia con el
+        # tiempo, así que se calcula una sola vez por uso
+        self.rank = math.log2(self.uses) + self.last_used / HALF_LIFE_SECONDS
+
+
+class _FieldValues:
+    """Valores de un campo con un índice ordenado por prefijo."""
+
+    __slots__ = ("entries", "keys", "ordered", "cache")
+
+    def __init__(self):
+        # valor → uso
+        self.entries: Dict[str, _Entry] = {}
+        # Valores normalizados ordenados, para buscar por prefijo, y sus usos
+        # en el mismo orden
+        self.keys: List[str] = []
+        self.ordered: List[_Entry] = []
+        # prefijo normalizado → mejores valores, de más a menos relevante
+        self.cache: Dict[str, List[_Entry]] = {}
+
+    def add(self, value: str, uses: int, last_used: float, index: bool = True) -> None:
+        entry = self.entries.get(value)
+        if entry is None:
+            entry = self.entries[value] = _Entry(value)
+            if index:
+                position = bisect_right(self.keys, entry.folded)
+                self.keys.insert(position, entry.folded)
+                self.ordered.insert(position, entry)
+        entry.use(uses, last_used)
+
+        # Solo cambió la puntuación de este valor: basta con recolocarlo en
+        # las listas de los prefijos que lo incluyen
+        for prefix, best in self.cache.items():
+            if not entry.folded.startswith(prefix):
+                continue
+            if entry not in best:
+                if len(best) == CACHED_SUGGESTIONS and entry.rank <= best[-1].rank:
+                    continue
+                best.append(entry)
+            best.sort(key=_rank, reverse=True)
+            del best[CACHED_SUGGESTIONS:]
+
+    def best(self, prefix: str, limit: int) -> List[_Entry]:
+        cached = self.cache.pop(prefix, None) if limit <= CACHED_SUGGESTIONS else None
+        if cached is None:
+            start = bisect_left(self.keys, prefix)
+            # Las claves con el prefijo quedan antes de prefijo + el carácter máximo
+            end = bisect_left(self.keys, prefix + "\U0010ffff", start)
+            cached = nlargest(max(limit, CACHED_SUGGESTIONS), self.ordered[start:end], key=_rank)
+            if limit > CACHED_SUGGESTIONS:
+                return cached
+            if len(self.cache) >= MAX_CACHED_PREFIXES:
+                # Descartar el prefijo usado hace más tiempo
+                del self.cache[next(iter(self.cache))]
+        self.cache[prefix] = cached
+        return cached[:limit]
+
+    def evict(self, max_values: int) -> None:
+        if len(self.entries) <= max_values:
+            return
+        keep = int(max_values * (1 - EVICTION_SLACK))
+        kept = nlargest(keep, self.entries.values(), key=_rank)
+        self.entries = {entry.value: entry for entry in kept}
+        self.reindex()
+
+    def reindex(self) -> None:
+        """Reconstruye el índice por prefijo de una vez (tras cargar o descartar)."""
+        self.ordered = sorted(self.entries.values(), key=attrgetter("folded"))
+        self.keys = [entry.folded for entry in self.ordered]
+        self.cache.clear()
+
+
+class FieldHistory:
+    """Historial persistente de los valores usados en cada campo."""
+
+    def __init__(self, file_path: str = "field_history.jsonl",
+                 max_values: int = DEFAULT_MAX_VALUES):
+        """
+        Inicializa el historial y carga el archivo si existe.
+
+        Args:
+            file_path: Archivo de solo anexado con el historial.
+            max_values: Valores que se guardan como máximo por campo.
+        """
+        self.file_path = file_path
+        self.max_values = max_values
+        self._lock = threading.RLock()
+        # Compartido con otras instancias que anexen al mismo archivo
+        self._file_lock = FileLock(file_path + ".lock")
+        self._fields: Dict[str, _FieldValues] = {}
+        self._lines = 0
+        self.load()
+
+    def __len__(self) -> int:
+        return sum(len(values.entries) for values in self._fields.values())
+
+    def load(self) -> None:
+        """Vuelve a cargar el historial desde el archivo."""
+        with self._lock:
+            self._fields = {}
+            self._lines = 0
+            try:
+                with open(self.file_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        self._lines += 1
+                        try:
+                            record = json.loads(line)
+                            self._apply(record["v"], record.get("n", 1), record["t"], index=False)
+                        except (ValueError, KeyError, TypeError):
+                            # Línea incompleta (por ejemplo, un cierre a mitad de escritura)
+                            continue
+            except FileNotFoundError:
+                return
+            except Exception as e:
+                print(f"Error al cargar el historial de campos: {e}")
+            for values in self._fields.values():
+                values.evict(self.max_values)
+                values.reindex()
+
+    def record(self, values: Dict[str, str]) -> None:
+        """
+        Registra los valores usados al generar un mensaje.
+
+        Args:
+            values: Campo → valor; los vacíos o demasiado largos se ignoran.
+        """
+        values = {
+            field: value.strip() for field, value in values.items()
+            if value and value.strip() and len(value) <= MAX_VALUE_LENGTH
+        }
+        if not values:
+            return
+        # Misma precisión en memoria que en el archivo, para que al recargar
+        # las sugerencias salgan en el mismo orden
+        now = round(time.time(), 3)
+        line = json.dumps({"t": now, "v": values}, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._apply(values, 1, now)
+            for field in values:
+                self._fields[field].evict(self.max_values)
+            try:
+                with self._file_lock:
+                    with open(self.file_path, "a", encoding="utf-8") as f:
+                        f.write(line)
+                self._lines += 1
+            except Exception as e:
+                print(f"Error al guardar el historial de campos: {e}")
+                return
+            if self._lines >= max(MIN_COMPACT_LINES, COMPACT_FACTOR * len(self)):
+                self.compact()
+
+    def suggest(self, field: str, prefix: str = "", limit: int = 5) -> List[str]:
+        """
+        Obtiene los valores usados en un campo que empiezan por un prefijo.
+
+        La comparación no distingue mayúsculas ni tildes. La primera consulta
+        de un prefijo recorre todos los valores que coinciden; las siguientes
+        salen de la caché, que se mantiene al día con cada uso.
+
+        Args:
+            field: Nombre del campo.
+            prefix: Texto escrito hasta ahora.
+            limit: Número máximo de sugerencias.
+
+        Returns:
+            List[str]: Valores ordenados de más a menos relevante.
+        """
+        with self._lock:
+            values = self._fields.get(field)
+            if values is None:
+                return []
+            return [entry.value for entry in values.best(fold(prefix.strip()), limit)]
+
+    def compact(self) -> bool:
+        """
+        Reescribe el archivo con una línea por valor guardado.
+
+        Returns:
+            bool: True si se compactó correctamente.
+        """
+        with self._lock:
+            tmp_path = self.file_path + ".tmp"
+            try:
+                # Otras instancias no deben anexar mientras se reemplaza el archivo
+                with self._file_lock:
+                    # Incorporar lo que hayan anexado otras instancias
+                    self.load()
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        for field, values in self._fields.items():
+                            for entry in values.entries.values():
+                                f.write(json.dumps({
+                                    "t": round(entry.last_used, 3),
+                                    "n": entry.uses,
+                                    "v": {field: entry.value}
+                                }, ensure_ascii=False) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.file_path)
+                self._lines = len(self)
+                return True
+            except Exception as e:
+                print(f"Error al compactar el historial de campos: {e}")
+                return False
+
+    def _apply(self, values: Dict[str, str], uses: int, last_used: float,
+               index: bool = True) -> None:
+        for field, value in values.items():
+            field_values = self._fields.get(field)
+            if field_values is None:
+                field_values = self._fields[field] = _FieldValues()
+            field_values.add(value, uses, last_used, index)
+
+
+_history: Optional[FieldHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_field_history() -> FieldHistory:
+    """
+    Obtiene el historial de campos compartido por el proceso.
+
+    Returns:
+        FieldHistory: Historial único de la aplicación.
+    """
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = FieldHistory()
+        return _history
@@ -0,0 +1,109 @@
+"""
+Bloqueo consultivo entre procesos sobre un archivo de bloqueo.
+
+Permite que varias instancias de la aplicación que comparten el mismo archivo
+de plantillas no se pisen al leer, modificar y escribir. Usa ``fcntl.flock``
+en POSIX y ``msvcrt.locking`` en Windows (donde todos los bloqueos son
+exclusivos). Dentro de un mismo proceso el bloqueo es reentrante.
+"""
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Bloqueo entre procesos, reentrante dentro del proceso."""
+
+    def __init__(self, lock_path: str):
+        """
+        Inicializa el bloqueo sin adquirirlo.
+
+        Args:
+            lock_path: Ruta del archivo de bloqueo (se crea si no existe).
+        """
+        self.lock_path = lock_path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        # Modo del nivel exterior, que es el que tiene el proceso
+        self._shared = False
+
+    def acquire(self, shared: bool = False) -> None:
+        """
+        Adquiere el bloqueo, esperando a que otros procesos lo liberen.
+
+        Args:
+            shared: Si es True (y el sistema lo permite) varios procesos pueden
+                tener el bloqueo compartido a la vez para leer.
+
+        Raises:
+            RuntimeError: Si se pide exclusivo dentro de un bloqueo compartido
+                del mismo proceso: no se puede ampliar sin soltarlo antes.
+        """
+        self._thread_lock.acquire()
+        if self._depth > 0 and self._shared and not shared:
+            self._thread_lock.release()
+            raise RuntimeError(f"No se puede pasar a exclusivo un bloqueo compartido: {self.lock_path}")
+        if self._depth == 0:
+            try:
+                self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+            except BaseException:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                self._thread_lock.release()
+                raise
+            self._shared = shared
+        # Un bloqueo anidado reutiliza el del nivel exterior
+        self._depth += 1
+
+    def release(self) -> None:
+        """Libera el bloqueo."""
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._thread_lock.release()
+
+    def __call__(self, shared: bool = False) -> "_HeldLock":
+        return _HeldLock(self, shared)
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class _HeldLock:
+    """Gestor de contexto para ``with lock(shared=True):``."""
+
+    __slots__ = ("lock", "shared")
+
+    def __init__(self, lock: FileLock, shared: bool):
+        self.lock = lock
+        self.shared = shared
+
+    def __enter__(self) -> FileLock:
+        self.lock.acquire(self.shared)
+        return self.lock
+
+    def __exit__(self, *exc_info) -> None:
+        self.lock.release()
@@ -0,0 +1,162 @@
+"""
+Vigilancia de cambios en los archivos de persistencia.
+
+En Linux usa inotify (mediante ctypes, sin dependencias) sobre los directorios
+de los archivos vigilados, lo que también detecta los reemplazos atómicos. En
+otros sistemas, o si inotify no está disponible, compara periódicamente la
+fecha de modificación y el tamaño de los archivos.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# Segundos entre comprobaciones cuando no hay inotify
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Eventos de inotify que indican que un archivo cambió o fue reemplazado
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class FileWatcher:
+    """Hilo que avisa cuando cambia alguno de los archivos vigilados."""
+
+    def __init__(self, paths: List[str], on_change: Callable[[], None],
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
+        """
+        Inicializa el vigilante sin arrancarlo.
+
+        Args:
+            paths: Archivos a vigilar (pueden no existir todavía).
+            on_change: Función a la que se llama, desde el hilo del vigilante,
+                cuando cambia alguno de los archivos.
+            poll_interval: Segundos entre comprobaciones en el modo de sondeo.
+        """
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.mode: Optional[str] = None
+
+    def start(self) -> None:
+        """Arranca el hilo de vigilancia."""
+        if self._thread is not None:
+            return
+        inotify = _Inotify.create(self.paths)
+        self.mode = "inotify" if inotify is not None else "polling"
+        target = (lambda: self._watch_inotify(inotify)) if inotify is not None else self._watch_polling
+        self._thread = threading.Thread(target=target, name="template-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Detiene el hilo de vigilancia."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2 * self.poll_interval)
+            self._thread = None
+
+    def _notify(self) -> None:
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"Error al procesar el cambio de las plantillas: {e}")
+
+    def _watch_inotify(self, inotify: "_Inotify") -> None:
+        try:
+            while not self._stop.is_set():
+                if inotify.wait(self.poll_interval):
+                    self._notify()
+        finally:
+            inotify.close()
+
+    def _watch_polling(self) -> None:
+        signature = self._signature()
+        while not self._stop.wait(self.poll_interval):
+            current = self._signature()
+            if current != signature:
+                signature = current
+                self._notify()
+
+    def _signature(self) -> Tuple:
+        signatures = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                signatures.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signatures.append(None)
+        return tuple(signatures)
+
+
+class _Inotify:
+    """Descriptor de inotify que vigila los directorios de unos archivos."""
+
+    def __init__(self, fd: int, names: Dict[int, Set[str]]):
+        self.fd = fd
+        # Descriptor de vigilancia → nombres de archivo de interés en ese directorio
+        self.names = names
+
+    @classmethod
+    def create(cls, paths: List[str]) -> Optional["_Inotify"]:
+        """Crea el descriptor o devuelve None si inotify no está disponible."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(_IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+
+        names: Dict[int, Set[str]] = {}
+        directories: Dict[str, int] = {}
+        for path in paths:
+            directory, name = os.path.split(path)
+            if directory not in directories:
+                wd = libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK)
+                if wd < 0:
+                    os.close(fd)
+                    return None
+                directories[directory] = wd
+                names[wd] = set()
+            names[directories[directory]].add(name)
+        return cls(fd, names)
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Espera eventos durante como mucho ``timeout`` segundos.
+
+        Returns:
+            bool: True si alguno de los eventos afecta a un archivo vigilado.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        buffer = os.read(self.fd, 64 * 1024)
+        changed = False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            wd, _, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            if name in self.names.get(wd, ()):
+                changed = True
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
@@ -0,0 +1,471 @@
+"""
+Almacenamiento de plantillas con índice de desplazamientos y carga perezosa.
+
+El archivo tiene una cabecera pequeña con el índice (plataforma → tipo →
+desplazamiento, longitud y campos) y, a continuación, los textos de las
+plantillas. Al arrancar solo se lee el índice; cada texto se lee bajo demanda
+mediante ``mmap`` la primera vez que se pide con ``get_template`` y se guarda
+en una caché LRU acotada.
+
+Formato:
+    MMTIDX1\\n | longitud de la cabecera (8 bytes) | cabecera JSON | textos UTF-8
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, ContextManager, Dict, List, Optional, Tuple
+
+from models.template_models import (
+    PLATFORM_ADDED, PLATFORM_REMOVED, TEMPLATE_CHANGED, TYPE_ADDED, TYPE_REMOVED,
+    MessageTemplate, TemplateEventSource, next_version
+)
+from utils.metrics import timed
+from utils.persistence import TemplateStorage
+
+MAGIC = b"MMTIDX1\n"
+_HEADER_LENGTH = struct.Struct(">Q")
+
+# Número máximo de textos de plantilla decodificados que se mantienen en memoria
+DEFAULT_BODY_CACHE_SIZE = 128
+
+# Entrada del índice: (desplazamiento, longitud, campos) o None si el tipo
+# de mensaje todavía no tiene plantilla
+IndexEntry = Optional[Tuple[int, int, Tuple[str, ...]]]
+
+
+class IndexedTemplateStorage(TemplateStorage):
+    """Almacenamiento con índice en cabecera y textos leídos bajo demanda."""
+
+    def __init__(self, file_path: str = "templates_data.idx",
+                 cache_size: int = DEFAULT_BODY_CACHE_SIZE):
+        """
+        Inicializa el almacenamiento indexado.
+
+        Args:
+            file_path: Ruta del archivo indexado.
+            cache_size: Textos decodificados que se mantienen en la caché LRU.
+        """
+        super().__init__(file_path)
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._body_start = 0
+        # Cambia cada vez que se cierra o se vuelve a mapear el archivo: las
+        # entradas de un índice leído antes dejan de apuntar a sus textos
+        self.generation = 0
+
+    # Lectura
+
+    def read_index(self) -> Dict[str, Dict[str, IndexEntry]]:
+        """
+        Lee solo el índice de la cabecera y deja el archivo mapeado en memoria.
+
+        Returns:
+            Dict: Índice plataforma → tipo de mensaje → entrada.
+        """
+        with self._lock:
+            self._close_map()
+            if not os.path.exists(self.file_path):
+                return {}
+
+            self._file = open(self.file_path, "rb")
+            if self._file.read(len(MAGIC)) != MAGIC:
+                self._close_map()
+                raise ValueError(f"'{self.file_path}' no es un archivo de plantillas indexado")
+            (header_length,) = _HEADER_LENGTH.unpack(self._file.read(_HEADER_LENGTH.size))
+            header = json.loads(self._file.read(header_length).decode("utf-8"))
+            self._body_start = len(MAGIC) + _HEADER_LENGTH.size + header_length
+
+            if os.fstat(self._file.fileno()).st_size > self._body_start:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return {
+            platform: {
+                message_type: None if entry is None else (entry[0], entry[1], tuple(entry[2]))
+                for message_type, entry in message_types.items()
+            }
+            for platform, message_types in header.items()
+        }
+
+    @timed("storage.read_body")
+    def read_body(self, entry: IndexEntry) -> str:
+        """Lee el texto de una plantilla del archivo mapeado en memoria."""
+        offset, length, _ = entry
+        return self.read_raw(offset, length).decode("utf-8")
+
+    def read_raw(self, offset: int, length: int) -> bytes:
+        """Lee los bytes de un texto sin decodificarlo."""
+        if length == 0:
+            return b""
+        with self._lock:
+            start = self._body_start + offset
+            return self._map[start:start + length]
+
+    @timed("storage.load_templates")
+    def load_templates(self) -> Dict[str, Any]:
+        """
+        Carga toda la biblioteca como diccionario (compatible con el formato JSON).
+
+        Returns:
+            Dict: Datos de las plantillas cargados.
+        """
+        try:
+            index = self.read_index()
+        except Exception as e:
+            print(f"Error al cargar las plantillas: {e}")
+            return {}
+        return {
+            platform: {
+                message_type: {} if entry is None else {
+                    "template": self.read_body(entry),
+                    "fields": list(entry[2])
+                }
+                for message_type, entry in message_types.items()
+            }
+            for platform, message_types in index.items()
+        }
+
+    def load_builder(self) -> "LazyTemplateBuilder":
+        """
+        Crea un builder que solo carga el índice y lee los textos bajo demanda.
+
+        Returns:
+            LazyTemplateBuilder: Fachada compatible con TemplateBuilder.
+        """
+        # La firma se toma antes de leer, como en el repositorio
+        signature = self.get_signature()
+        with self._lock:
+            try:
+                index = self.read_index()
+            except Exception as e:
+                print(f"Error al cargar las plantillas: {e}")
+                index = {}
+            return LazyTemplateBuilder(self, index, signature)
+
+    # Escritura
+
+    @timed("storage.save_templates")
+    def save_templates(self, templates_data: Dict[str, Any]) -> bool:
+        """
+        Escribe la biblioteca completa en formato indexado.
+
+        Args:
+            templates_data: Datos de las plantillas a guardar.
+
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        entries = {
+            platform: {
+                message_type: (template_data["template"], template_data["fields"]) if template_data else None
+                for message_type, template_data in message_types.items()
+            }
+            for platform, message_types in templates_data.items()
+        }
+        return self.write_library(entries)
+
+    def write_library(self, entries: Dict[str, Dict[str, Any]]) -> bool:
+        """
+        Escribe el archivo indexado de forma atómica.
+
+        Cada entrada puede ser None (tipo sin plantilla), una tupla (texto, campos)
+        o una entrada del índice actual, cuyos bytes se copian sin decodificar.
+
+        Args:
+            entries: Plataforma → tipo de mensaje → entrada.
+
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        try:
+            # El bloqueo entre procesos evita que dos instancias compartan el
+            # archivo temporal o reemplacen el archivo a la vez
+            with self.lock(), self._lock:
+                # Primera pasada: calcular el índice; solo los textos nuevos se
+                # codifican en memoria, los demás se copiarán del archivo actual
+                header: Dict[str, Dict[str, Any]] = {}
+                sources: List[Any] = []
+                offset = 0
+                for platform, message_types in entries.items():
+                    header[platform] = {}
+                    for message_type, entry in message_types.items():
+                        if entry is None:
+                            header[platform][message_type] = None
+                            continue
+                        if isinstance(entry[0], str):
+                            source = entry[0].encode("utf-8")
+                            length = len(source)
+                            fields = list(entry[1])
+                        else:
+                            source = (entry[0], entry[1])
+                            length = entry[1]
+                            fields = list(entry[2])
+                        header[platform][message_type] = [offset, length, fields]
+                        sources.append(source)
+                        offset += length
+
+                header_bytes = json.dumps(header, ensure_ascii=False,
+                                          separators=(",", ":")).encode("utf-8")
+                tmp_path = self.file_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(MAGIC)
+                    f.write(_HEADER_LENGTH.pack(len(header_bytes)))
+                    f.write(header_bytes)
+                    # Segunda pasada: escribir los textos uno a uno
+                    for source in sources:
+                        f.write(source if isinstance(source, bytes) else self.read_raw(*source))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                # En Windows no se puede reemplazar un archivo mapeado
+                self._close_map()
+                os.replace(tmp_path, self.file_path)
+                self.written_signature = self.get_signature()
+            return True
+        except Exception as e:
+            print(f"Error al guardar las plantillas: {e}")
+            return False
+
+    def close(self) -> None:
+        """Libera el archivo mapeado en memoria."""
+        with self._lock:
+            self._close_map()
+
+    def _close_map(self) -> None:
+        self.generation += 1
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class LazyTemplateBuilder(TemplateEventSource):
+    """Fachada compatible con TemplateBuilder que lee los textos bajo demanda."""
+
+    # Los cambios se escriben en el archivo indexado al hacerse
+    persists_changes = True
+
+    def __init__(self, storage: IndexedTemplateStorage,
+                 index: Dict[str, Dict[str, IndexEntry]],
+                 signature: Optional[Tuple] = None):
+        """
+        Inicializa la fachada.
+
+        Args:
+            storage: Almacenamiento indexado del que se leen los textos.
+            index: Índice cargado de la cabecera.
+            signature: Firma del archivo del que se leyó el índice.
+        """
+        self.storage = storage
+        self.index = index
+        self._signature = signature
+        # Mapeo del almacenamiento al que corresponden las entradas del índice
+        self._generation = storage.generation
+        self._lock = threading.RLock()
+        self._bodies: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        # Cambia con cada modificación hecha a través de esta fachada
+        self.version = next_version()
+        self._listeners = []
+
+    def snapshot(self) -> "LazyTemplateBuilder":
+        """
+        Los textos se leen bajo demanda del archivo, así que no hay una copia
+        inmutable de la biblioteca: la propia fachada hace de instantánea.
+        """
+        return self
+
+    def transaction(self) -> ContextManager:
+        """
+        Bloquea la fachada (y el archivo) para hacer varias operaciones como
+        una sola (ver ``TemplateBuilder.transaction``).
+        """
+        return self._editing()
+
+    @property
+    def platforms(self) -> Dict[str, Any]:
+        """Biblioteca completa como diccionario (lee todos los textos)."""
+        return self.to_dict()
+
+    def get_template(self, platform_name: str, message_type: str) -> Optional[MessageTemplate]:
+        """Obtiene una plantilla, leyendo su texto del archivo si no está en caché."""
+        with self._lock:
+            if self._generation != self.storage.generation:
+                # Otro builder volvió a mapear el archivo: este índice ya no sirve
+                self._reload()
+            if self.index.get(platform_name, {}).get(message_type) is None:
+                return None
+
+            key = (platform_name, message_type)
+            body = self._bodies.get(key)
+            if body is None:
+                # La entrada y la lectura deben corresponder al mismo mapeo
+                with self.storage._lock:
+                    if self._generation != self.storage.generation:
+                        self._reload()
+                    entry = self.index.get(platform_name, {}).get(message_type)
+                    if entry is None:
+                        return None
+                    body = self.storage.read_body(entry)
+                self._bodies[key] = body
+                if len(self._bodies) > self.storage.cache_size:
+                    self._bodies.popitem(last=False)
+            else:
+                self._bodies.move_to_end(key)
+            return MessageTemplate(body, self.index[platform_name][message_type][2])
+
+    def get_platforms(self) -> List[str]:
+        """Obtiene la lista de plataformas disponibles."""
+        return list(self.index.keys())
+
+    def get_message_types(self, platform_name: str) -> List[str]:
+        """Obtiene la lista de tipos de mensaje para una plataforma."""
+        return list(self.index.get(platform_name, {}).keys())
+
+    def add_platform(self, platform_name: str) -> None:
+        """Añade una nueva plataforma."""
+        with self._editing():
+            if platform_name in self.index:
+                return
+            index = dict(self.index)
+            index[platform_name] = {}
+            if self._write(index, {}):
+                self._emit(PLATFORM_ADDED, platform_name)
+
+    def add_message_type(self, platform_name: str, message_type: str) -> None:
+        """Añade un nuevo tipo de mensaje a una plataforma."""
+        with self._editing():
+            new_platform = platform_name not in self.index
+            if message_type in self.index.get(platform_name, {}):
+                return
+            index = dict(self.index)
+            index[platform_name] = {**index.get(platform_name, {}), message_type: None}
+            if not self._write(index, {}):
+                return
+            if new_platform:
+                self._emit(PLATFORM_ADDED, platform_name)
+            self._emit(TYPE_ADDED, platform_name, message_type)
+
+    def add_template(self, platform_name: str, message_type: str,
+                     template_text: str, fields: List[str]) -> bool:
+        """Añade una nueva plantilla a un tipo de mensaje; devuelve True si se guardó."""
+        with self._editing():
+            new_platform = platform_name not in self.index
+            new_type = message_type not in self.index.get(platform_name, {})
+            index = dict(self.index)
+            index[platform_name] = {**index.get(platform_name, {}), message_type: None}
+            if not self._write(index, {(platform_name, message_type): (template_text, tuple(fields))}):
+                return False
+            if new_platform:
+                self._emit(PLATFORM_ADDED, platform_name)
+            self._emit(TYPE_ADDED if new_type else TEMPLATE_CHANGED, platform_name, message_type)
+            return True
+
+    def remove_platform(self, platform_name: str) -> bool:
+        """Elimina una plataforma con todos sus tipos de mensaje."""
+        with self._editing():
+            if platform_name not in self.index:
+                return False
+            index = {platform: message_types for platform, message_types in self.index.items()
+                     if platform != platform_name}
+            if not self._write(index, {}):
+                return False
+            self._emit(PLATFORM_REMOVED, platform_name)
+            return True
+
+    def remove_message_type(self, platform_name: str, message_type: str) -> bool:
+        """Elimina un tipo de mensaje de una plataforma."""
+        with self._editing():
+            if message_type not in self.index.get(platform_name, {}):
+                return False
+            index = dict(self.index)
+            index[platform_name] = {name: entry for name, entry in index[platform_name].items()
+                                    if name != message_type}
+            if not self._write(index, {}):
+                return False
+            self._emit(TYPE_REMOVED, platform_name, message_type)
+            return True
+
+    def to_dict(self) -> Dict:
+        """Convierte la biblioteca a un diccionario para serialización."""
+        templates_data: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for platform, message_types in self.index.items():
+                templates_data[platform] = {}
+                for message_type in message_types:
+                    template = self.get_template(platform, message_type)
+                    templates_data[platform][message_type] = template.to_dict() if template else {}
+        return templates_data
+
+    @contextmanager
+    def _editing(self):
+        """
+        Bloquea el archivo para modificarlo, partiendo siempre de su versión
+        actual: otra instancia puede haberlo reescrito desde que se leyó, y
+        otro builder del proceso puede haberlo vuelto a mapear.
+        """
+        with self.storage.lock(), self._lock:
+            if (self.storage.get_signature() != self._signature
+                    or self._generation != self.storage.generation):
+                self._reload()
+            yield
+
+    def _reload(self) -> None:
+        """Vuelve a leer el índice del archivo actual y descarta los textos en caché."""
+        with self.storage._lock:
+            self._signature = self.storage.get_signature()
+            self.index = self.storage.read_index()
+            self._generation = self.storage.generation
+        self._bodies.clear()
+
+    def _write(self, index: Dict[str, Dict[str, IndexEntry]],
+               new_bodies: Dict[Tuple[str, str], Tuple[str, Tuple[str, ...]]]) -> bool:
+        """
+        Reescribe el archivo con el índice modificado, copiando los textos sin
+        cambios. El índice actual solo se sustituye si la escritura termina bien.
+        """
+        entries = {
+            platform: {
+                message_type: new_bodies.get((platform, message_type), entry)
+                for message_type, entry in message_types.items()
+            }
+            for platform, message_types in index.items()
+        }
+        if not self.storage.write_library(entries):
+            return False
+        self._reload()
+        self.version = next_version()
+        return True
+
+
+def migrate_json_to_indexed(json_path: str = "templates_data.json",
+                            index_path: str = "templates_data.idx") -> int:
+    """
+    Convierte el archivo JSON de plantillas al formato indexado.
+
+    Args:
+        json_path: Ruta del archivo JSON de origen.
+        index_path: Ruta del archivo indexado de destino.
+
+    Returns:
+        int: Número de tipos de mensaje convertidos.
+    """
+    templates_data = TemplateStorage(json_path).load_templates()
+    storage = IndexedTemplateStorage(index_path)
+    if not storage.save_templates(templates_data):
+        raise RuntimeError(f"No se pudo convertir '{json_path}' a '{index_path}'")
+    return sum(len(message_types) for message_types in templates_data.values())
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "templates_data.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else "templates_data.idx"
+    converted = migrate_json_to_indexed(source, target)
+    print(f"{converted} tipos de mensaje convertidos de '{source}' a '{target}'")
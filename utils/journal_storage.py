@@ -0,0 +1,237 @@
+"""
+Almacenamiento de plantillas con diario de cambios (journal) de solo anexado.
+
+Cada cambio (agregar plataforma, eliminar tipo de mensaje, guardar plantilla...)
+se anexa como un registro pequeño a ``<archivo>.journal`` en lugar de reescribir
+toda la biblioteca. Al cargar se lee la última instantánea (el JSON de siempre)
+y se reproducen los cambios del diario. Cuando el diario supera un umbral, un
+hilo en segundo plano lo compacta en una nueva instantánea.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metrics import timed
+from utils.persistence import TemplateStorage, apply_change, write_json_atomic
+
+# Número de registros del diario a partir del cual se compacta
+DEFAULT_COMPACT_THRESHOLD = 500
+
+
+class JournalTemplateStorage(TemplateStorage):
+    """Almacenamiento que registra cada cambio en un diario de solo anexado."""
+
+    saves_changes_only = True
+
+    def __init__(self, file_path: str = "templates_data.json",
+                 compact_threshold: int = DEFAULT_COMPACT_THRESHOLD):
+        """
+        Inicializa el almacenamiento con diario.
+
+        Args:
+            file_path: Ruta de la instantánea JSON de las plantillas.
+            compact_threshold: Registros del diario que disparan la compactación.
+        """
+        super().__init__(file_path)
+        self.journal_path = file_path + ".journal"
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._entries = 0
+        # Cambia con cada instantánea completa para descartar compactaciones obsoletas
+        self._generation = 0
+        self._compaction: Optional[threading.Thread] = None
+
+    @timed("storage.save_change")
+    def save_change(self, templates_data: Dict[str, Any], change: Tuple) -> bool:
+        """
+        Anexa un cambio al diario.
+
+        Args:
+            templates_data: Datos completos de las plantillas (no se escriben).
+            change: Cambio realizado (ver CHANGE_OPERATIONS).
+
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        operation, *args = change
+        record = json.dumps({"op": operation, "args": args}, ensure_ascii=False) + "\n"
+
+        try:
+            with self._lock:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write(record)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._entries += 1
+                self.written_signature = self.get_signature()
+                if self._entries >= self.compact_threshold:
+                    self._start_compaction()
+            return True
+        except Exception as e:
+            print(f"Error al guardar el cambio en el diario: {e}")
+            return False
+
+    @timed("storage.save_templates")
+    def save_templates(self, templates_data: Dict[str, Any]) -> bool:
+        """
+        Escribe una instantánea completa y vacía el diario.
+
+        Args:
+            templates_data: Datos de las plantillas a guardar.
+
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        try:
+            with self._lock:
+                self._write_snapshot(templates_data)
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                self._entries = 0
+                self._generation += 1
+                self.written_signature = self.get_signature()
+            return True
+        except Exception as e:
+            print(f"Error al guardar las plantillas: {e}")
+            return False
+
+    # La instantánea se mide aparte como storage.load_templates
+    @timed("storage.load_templates_with_journal")
+    def load_templates(self) -> Dict[str, Any]:
+        """
+        Carga la última instantánea y reproduce los cambios del diario.
+
+        Returns:
+            Dict: Datos de las plantillas cargados.
+        """
+        with self._lock:
+            templates_data = super().load_templates()
+            self._entries = self._replay(templates_data)
+            return templates_data
+
+    def watched_paths(self) -> List[str]:
+        """Archivos cuyo cambio indica que otra instancia modificó las plantillas."""
+        return [self.file_path, self.journal_path]
+
+    def get_signature(self) -> Optional[Tuple]:
+        """Obtiene la firma conjunta de la instantánea y del diario."""
+        try:
+            stat = os.stat(self.journal_path)
+            journal = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            journal = None
+        snapshot = super().get_signature()
+        if snapshot is None and journal is None:
+            return None
+        return snapshot, journal
+
+    @timed("storage.compact")
+    def compact(self) -> bool:
+        """
+        Compacta el diario en una nueva instantánea de forma síncrona.
+
+        Returns:
+            bool: True si se compactó correctamente, False en caso contrario.
+        """
+        try:
+            # Posición del diario hasta la que se compacta; los cambios que
+            # lleguen mientras tanto se conservan en el diario nuevo
+            with self._lock:
+                state = self._journal_state()
+                if state is None:
+                    return True
+                generation = self._generation
+
+            templates_data = super().load_templates()
+            self._replay(templates_data, limit=state[-1])
+
+            # Otras instancias no deben anexar al diario mientras se recorta
+            with self.lock(), self._lock:
+                if generation != self._generation:
+                    # Se escribió una instantánea completa mientras tanto
+                    return True
+                current = self._journal_state()
+                if current is None:
+                    return True
+                if current[:-1] != state[:-1] or current[-1] < state[-1]:
+                    # Otra instancia compactó o reescribió las plantillas
+                    # durante la lectura: volver a leer bajo el bloqueo
+                    state = current
+                    templates_data = super().load_templates()
+                    self._replay(templates_data, limit=state[-1])
+                offset = state[-1]
+                self._write_snapshot(templates_data)
+                # Si se interrumpe aquí, volver a aplicar el diario completo
+                # sobre la instantánea nueva da el mismo resultado
+                with open(self.journal_path, "rb") as f:
+                    f.seek(offset)
+                    tail = f.read()
+                tmp_path = self.journal_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.journal_path)
+                self._entries = tail.count(b"\n")
+                self.written_signature = self.get_signature()
+            return True
+        except Exception as e:
+            print(f"Error al compactar el diario de plantillas: {e}")
+            return False
+
+    def wait_for_compaction(self, timeout: Optional[float] = None) -> None:
+        """Espera a que termine la compactación en segundo plano, si hay una."""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join(timeout)
+
+    def _start_compaction(self) -> None:
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        self._compaction = threading.Thread(
+            target=self.compact, name="journal-compaction", daemon=True
+        )
+        self._compaction.start()
+
+    def _journal_state(self) -> Optional[Tuple]:
+        """
+        Firma de la instantánea, identidad del diario y su tamaño, o None si no
+        hay diario.
+        """
+        try:
+            stat = os.stat(self.journal_path)
+        except OSError:
+            return None
+        return super().get_signature(), stat.st_dev, stat.st_ino, stat.st_size
+
+    def _write_snapshot(self, templates_data: Dict[str, Any]) -> None:
+        write_json_atomic(self.file_path, templates_data)
+
+    def _replay(self, templates_data: Dict[str, Any], limit: Optional[int] = None) -> int:
+        """Aplica los registros del diario y devuelve cuántos se aplicaron."""
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        applied = 0
+        valid_end = 0
+        with open(self.journal_path, "rb") as f:
+            data = f.read() if limit is None else f.read(limit)
+
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                # Registro incompleto por una escritura interrumpida
+                break
+            try:
+                record = json.loads(line)
+                apply_change(templates_data, (record["op"], *record["args"]))
+            except Exception as e:
+                print(f"Registro del diario ignorado: {e}")
+            valid_end += len(line)
+            applied += 1
+
+        if limit is None and valid_end < len(data):
+            # Descartar el registro incompleto para no mezclarlo con el siguiente
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(valid_end)
+        return applied
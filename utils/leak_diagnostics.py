@@ -0,0 +1,230 @@
+"""
+Diagnóstico de fugas de memoria y de controles al cambiar de pantalla.
+
+Se activa con la variable de entorno ``MESSAGE_MANAGER_LEAK_DIAGNOSTICS=1``.
+En cada cambio de pantalla se cuentan los objetos vivos de las clases
+vigiladas (las pantallas, las listas paginadas y los controles de Flet), se
+leen los contadores adicionales (por ejemplo, los oyentes del builder) y se
+toma una instantánea de tracemalloc. El informe muestra cuánto creció cada
+contador y la memoria desde el punto anterior y desde el primero, junto con
+las líneas de código que más memoria nueva retienen.
+
+Cambiar de pantalla no debería crear objetos nuevos: las pantallas se
+conservan y sus controles se reutilizan. Un contador que crece en cada cambio
+indica una fuga (oyentes que no se dan de baja, filas o funciones que siguen
+referenciadas...).
+
+Exportación:
+    - Cada informe se imprime en la salida estándar.
+    - Con ``MESSAGE_MANAGER_LEAK_REPORT`` se anexa además como una línea JSON
+      al archivo indicado.
+
+Contar los objetos recorre todo el montón y tracemalloc hace más lenta cada
+asignación, así que este modo solo es para diagnosticar.
+"""
+import gc
+import json
+import os
+import threading
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+LEAK_DIAGNOSTICS_ENABLED = os.environ.get("MESSAGE_MANAGER_LEAK_DIAGNOSTICS", "0") == "1"
+
+LEAK_REPORT_FILE = os.environ.get("MESSAGE_MANAGER_LEAK_REPORT")
+
+# Marcos de la pila que se guardan por asignación
+DEFAULT_TRACE_FRAMES = 10
+
+# Líneas con más memoria nueva que se incluyen en cada informe
+DEFAULT_TOP_SITES = 10
+
+# Las asignaciones de tracemalloc y de este módulo no son de la aplicación
+_IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+)
+
+
+def count_live_objects(tracked: Dict[str, type]) -> Dict[str, int]:
+    """
+    Cuenta los objetos vivos que son instancia de cada clase vigilada.
+
+    Args:
+        tracked: Nombre con el que se informa → clase; las subclases también cuentan.
+
+    Returns:
+        Dict[str, int]: Nombre → número de instancias vivas.
+    """
+    counts = {name: 0 for name in tracked}
+    # Qué nombres corresponden a cada tipo concreto, calculado una vez por tipo
+    names_by_type: Dict[type, Tuple[str, ...]] = {}
+    for obj in gc.get_objects():
+        obj_type = type(obj)
+        names = names_by_type.get(obj_type)
+        if names is None:
+            names = names_by_type[obj_type] = tuple(
+                name for name, cls in tracked.items() if issubclass(obj_type, cls)
+            )
+        for name in names:
+            counts[name] += 1
+    return counts
+
+
+class LeakReport:
+    """Resultado de un punto de control."""
+
+    __slots__ = ("label", "counts", "deltas", "total_deltas",
+                 "traced_bytes", "traced_delta", "top_sites")
+
+    def __init__(self, label: str, counts: Dict[str, int], deltas: Dict[str, int],
+                 total_deltas: Dict[str, int], traced_bytes: int, traced_delta: int,
+                 top_sites: List[Tuple[str, int, int]]):
+        """
+        Inicializa el informe.
+
+        Args:
+            label: Nombre del punto de control (por ejemplo, ``switch_to_config``).
+            counts: Contador → valor actual.
+            deltas: Contador → crecimiento desde el punto anterior.
+            total_deltas: Contador → crecimiento desde el primer punto.
+            traced_bytes: Memoria que retiene la aplicación según tracemalloc.
+            traced_delta: Crecimiento de esa memoria desde el punto anterior.
+            top_sites: (línea, bytes nuevos, bloques nuevos) de las líneas que más crecieron.
+        """
+        self.label = label
+        self.counts = counts
+        self.deltas = deltas
+        self.total_deltas = total_deltas
+        self.traced_bytes = traced_bytes
+        self.traced_delta = traced_delta
+        self.top_sites = top_sites
+
+    def growing(self) -> Dict[str, int]:
+        """Contadores que crecieron desde el punto anterior."""
+        return {name: delta for name, delta in self.deltas.items() if delta > 0}
+
+    def to_dict(self) -> Dict:
+        """Convierte el informe a un diccionario serializable."""
+        return {
+            "label": self.label,
+            "counts": self.counts,
+            "deltas": self.deltas,
+            "total_deltas": self.total_deltas,
+            "traced_bytes": self.traced_bytes,
+            "traced_delta": self.traced_delta,
+            "top_sites": [
+                {"site": site, "size_diff": size_diff, "count_diff": count_diff}
+                for site, size_diff, count_diff in self.top_sites
+            ],
+        }
+
+    def format(self) -> str:
+        """Texto legible del informe."""
+        lines = [
+            f"[fugas] {self.label}: {self.traced_bytes / 1024:.1f} KiB retenidos "
+            f"({self.traced_delta / 1024:+.1f} KiB)"
+        ]
+        for name, count in self.counts.items():
+            lines.append(f"  {name}: {count} ({self.deltas[name]:+d}, "
+                         f"{self.total_deltas[name]:+d} desde el inicio)")
+        for site, size_diff, count_diff in self.top_sites:
+            lines.append(f"  {size_diff / 1024:+.1f} KiB, {count_diff:+d} bloques: {site}")
+        return "\n".join(lines)
+
+
+class LeakTracker:
+    """Puntos de control que comparan los objetos vivos y la memoria entre sí."""
+
+    def __init__(self, tracked: Dict[str, type],
+                 gauges: Optional[Dict[str, Callable[[], int]]] = None,
+                 frames: int = DEFAULT_TRACE_FRAMES, top: int = DEFAULT_TOP_SITES,
+                 report_file: Optional[str] = LEAK_REPORT_FILE, echo: bool = True):
+        """
+        Inicializa el diagnóstico y empieza a trazar las asignaciones.
+
+        Args:
+            tracked: Nombre → clase cuyas instancias vivas se cuentan.
+            gauges: Nombre → función que devuelve un contador adicional.
+            frames: Marcos de la pila que se guardan por asignación.
+            top: Líneas con más memoria nueva que se incluyen en cada informe.
+            report_file: Archivo al que anexar cada informe como línea JSON.
+            echo: Si es False, los informes no se imprimen.
+        """
+        self.tracked = dict(tracked)
+        self.gauges = dict(gauges or {})
+        self.top = top
+        self.report_file = report_file
+        self.echo = echo
+        # Último informe, para quien toma los puntos de control indirectamente
+        self.last_report: Optional[LeakReport] = None
+        self._lock = threading.Lock()
+        self._first: Optional[Dict[str, int]] = None
+        self._previous: Optional[Dict[str, int]] = None
+        self._previous_snapshot: Optional[tracemalloc.Snapshot] = None
+        # La traza es del proceso: si ya estaba activa se reutiliza
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def checkpoint(self, label: str) -> LeakReport:
+        """
+        Toma un punto de control y lo compara con el anterior.
+
+        Args:
+            label: Nombre del punto de control.
+
+        Returns:
+            LeakReport: Contadores, crecimiento y líneas que más memoria nueva retienen.
+        """
+        with self._lock:
+            # Solo cuentan los objetos que siguen alcanzables
+            gc.collect()
+            counts = count_live_objects(self.tracked)
+            for name, gauge in self.gauges.items():
+                counts[name] = gauge()
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_TRACES)
+            traced_bytes = sum(stat.size for stat in snapshot.statistics("filename"))
+
+            previous = counts if self._previous is None else self._previous
+            first = counts if self._first is None else self._first
+            deltas = {name: count - previous.get(name, 0) for name, count in counts.items()}
+            total_deltas = {name: count - first.get(name, 0) for name, count in counts.items()}
+
+            top_sites: List[Tuple[str, int, int]] = []
+            traced_delta = 0
+            if self._previous_snapshot is not None:
+                differences = snapshot.compare_to(self._previous_snapshot, "lineno")
+                traced_delta = sum(stat.size_diff for stat in differences)
+                for stat in differences:
+                    if len(top_sites) == self.top:
+                        break
+                    if stat.size_diff > 0:
+                        frame = stat.traceback[0]
+                        top_sites.append((f"{frame.filename}:{frame.lineno}",
+                                          stat.size_diff, stat.count_diff))
+
+            if self._first is None:
+                self._first = counts
+            self._previous = counts
+            self._previous_snapshot = snapshot
+
+        report = LeakReport(label, counts, deltas, total_deltas,
+                            traced_bytes, traced_delta, top_sites)
+        self.last_report = report
+        self._export(report)
+        return report
+
+    def _export(self, report: LeakReport) -> None:
+        if self.echo:
+            print(report.format())
+        if not self.report_file:
+            return
+        try:
+            with open(self.report_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(report.to_dict(), ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Error al guardar el informe de fugas: {e}")
+
+    def stop(self) -> None:
+        """Deja de trazar las asignaciones."""
+        tracemalloc.stop()
@@ -0,0 +1,90 @@
+"""
+Generación de mensajes a partir de la biblioteca de plantillas.
+
+Es la lógica que usan la pantalla del generador, la línea de comandos y el
+servicio HTTP; no depende de Flet.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from utils.template_engine import SegmentRenderer, TemplateEngine, template_engine
+
+
+def render_message(template_builder, platform_name: str, message_type: str,
+                   values: Dict[str, str], preview: bool = False,
+                   engine: TemplateEngine = template_engine) -> Optional[str]:
+    """
+    Genera un mensaje con los valores de sus campos.
+
+    Args:
+        template_builder: Builder con las plantillas.
+        platform_name: Nombre de la plataforma.
+        message_type: Tipo de mensaje.
+        values: Valores de los campos; los vacíos o ausentes se dejan en blanco.
+        preview: Si es True, los campos vacíos se muestran como {campo}.
+        engine: Motor con la caché de plantillas compiladas.
+
+    Returns:
+        Optional[str]: Mensaje generado o None si no existe la plantilla.
+
+    Raises:
+        KeyError: Si la plantilla usa un campo que no está en su lista de campos.
+    """
+    template_data = template_builder.get_template(platform_name, message_type)
+    if not template_data:
+        return None
+
+    template = template_data.template
+    # Si no hay campos (variables) en la plantilla, el mensaje es el texto tal cual
+    if not template_data.fields:
+        return template
+
+    field_values = _field_values(template_data.fields, values, preview)
+    return engine.compile(platform_name, message_type, template).render(field_values)
+
+
+def render_segments(renderer: Optional[SegmentRenderer], template_builder,
+                    platform_name: str, message_type: str, values: Dict[str, str],
+                    preview: bool = False, engine: TemplateEngine = template_engine
+                    ) -> Optional[Tuple[SegmentRenderer, List[int]]]:
+    """
+    Genera un mensaje por fragmentos, reutilizando la salida anterior.
+
+    Produce el mismo texto que ``render_message``, pero si ``renderer`` es de
+    la misma plantilla solo se recalculan los huecos cuyos campos cambiaron.
+
+    Args:
+        renderer: Fragmentos de la generación anterior, o None.
+        template_builder: Builder con las plantillas.
+        platform_name: Nombre de la plataforma.
+        message_type: Tipo de mensaje.
+        values: Valores de los campos; los vacíos o ausentes se dejan en blanco.
+        preview: Si es True, los campos vacíos se muestran como {campo}.
+        engine: Motor con la caché de plantillas compiladas.
+
+    Returns:
+        Optional[Tuple[SegmentRenderer, List[int]]]: Fragmentos (los mismos o
+        unos nuevos si cambió la plantilla) y posiciones que cambiaron, o None
+        si no existe la plantilla.
+
+    Raises:
+        KeyError: Si la plantilla usa un campo que no está en su lista de campos.
+    """
+    template_data = template_builder.get_template(platform_name, message_type)
+    if not template_data:
+        return None
+
+    compiled = engine.compile(platform_name, message_type, template_data.template)
+    if renderer is None or renderer.template is not compiled:
+        # Otra plantilla (o la misma editada): empezar de cero
+        renderer = SegmentRenderer(compiled, literal=not template_data.fields)
+        changed = list(range(len(renderer.segments)))
+        renderer.update(_field_values(template_data.fields, values, preview))
+        return renderer, changed
+    return renderer, renderer.update(_field_values(template_data.fields, values, preview))
+
+
+def _field_values(fields, values: Dict[str, str], preview: bool) -> Dict[str, str]:
+    return {
+        field: values.get(field) or (f"{{{field}}}" if preview else "")
+        for field in fields
+    }
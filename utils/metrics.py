@@ -0,0 +1,306 @@
+"""
+Métricas de tiempo de las rutas críticas del gestor de mensajes.
+
+Se activan con la variable de entorno ``MESSAGE_MANAGER_METRICS=1``. Cada
+operación medida acumula sus duraciones en un histograma de cubetas fijas y
+los eventos sueltos en contadores. Con las métricas desactivadas los
+decoradores devuelven la función original y los temporizadores no hacen nada,
+por lo que el coste es prácticamente nulo.
+
+Exportación:
+    - Al terminar el proceso, en el archivo de ``MESSAGE_MANAGER_METRICS_FILE``
+      (formato JSON si termina en ``.json``; si no, texto de Prometheus).
+    - En cualquier momento con ``export_metrics(ruta)`` o, en sistemas POSIX,
+      enviando la señal SIGUSR1 al proceso.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+METRICS_ENABLED = os.environ.get("MESSAGE_MANAGER_METRICS", "0") == "1"
+
+METRICS_FILE = os.environ.get("MESSAGE_MANAGER_METRICS_FILE", "message_manager_metrics.prom")
+
+# Límites superiores de las cubetas de los histogramas, en segundos
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefijo de los nombres de las métricas exportadas a Prometheus
+PROMETHEUS_PREFIX = "message_manager"
+
+_NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    """Histograma de duraciones con cubetas fijas."""
+
+    __slots__ = ("counts", "count", "total", "maximum")
+
+    def __init__(self):
+        """Inicializa el histograma vacío."""
+        # Una cubeta por límite más la cubeta +Inf
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Registra una duración."""
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def quantile(self, q: float) -> float:
+        """Estima un cuantil como el límite superior de la cubeta que lo contiene."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        accumulated = 0
+        for i, bucket_count in enumerate(self.counts):
+            accumulated += bucket_count
+            if accumulated >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else self.maximum
+        return self.maximum
+
+
+class MetricsRegistry:
+    """Registro de histogramas y contadores del proceso."""
+
+    def __init__(self):
+        """Inicializa el registro vacío."""
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Registra la duración de una operación."""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Incrementa un contador."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def reset(self) -> None:
+        """Descarta todas las métricas registradas."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Obtiene una copia de las métricas actuales.
+
+        Returns:
+            Dict: Histogramas (con percentiles estimados en milisegundos) y contadores.
+        """
+        with self._lock:
+            histograms = {
+                name: {
+                    "count": histogram.count,
+                    "sum_ms": histogram.total * 1000,
+                    "max_ms": histogram.maximum * 1000,
+                    "p50_ms": histogram.quantile(0.50) * 1000,
+                    "p95_ms": histogram.quantile(0.95) * 1000,
+                    "p99_ms": histogram.quantile(0.99) * 1000,
+                    "buckets": {
+                        _format_bound(bound): count
+                        for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts)
+                    },
+                }
+                for name, histogram in sorted(self._histograms.items())
+            }
+            counters = dict(sorted(self._counters.items()))
+        return {"timestamp": time.time(), "histograms": histograms, "counters": counters}
+
+    def to_prometheus(self) -> str:
+        """
+        Exporta las métricas en el formato de texto de Prometheus.
+
+        Returns:
+            str: Métricas en formato de exposición de Prometheus.
+        """
+        duration = f"{PROMETHEUS_PREFIX}_operation_duration_seconds"
+        events = f"{PROMETHEUS_PREFIX}_events_total"
+        lines = [
+            f"# HELP {duration} Duración de las operaciones medidas.",
+            f"# TYPE {duration} histogram",
+        ]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                label = _escape_label(name)
+                accumulated = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                    accumulated += count
+                    lines.append(f'{duration}_bucket{{operation="{label}",le="{_format_bound(bound)}"}} {accumulated}')
+                lines.append(f'{duration}_sum{{operation="{label}"}} {histogram.total}')
+                lines.append(f'{duration}_count{{operation="{label}"}} {histogram.count}')
+
+            lines.append(f"# HELP {events} Eventos contados.")
+            lines.append(f"# TYPE {events} counter")
+            for name, value in sorted(self._counters.items()):
+                lines.append(f'{events}{{event="{_escape_label(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, file_path: str) -> None:
+        """
+        Escribe las métricas en un archivo de forma atómica.
+
+        Args:
+            file_path: Ruta de destino; si termina en ``.json`` se escribe una
+                instantánea JSON y si no, texto de Prometheus.
+        """
+        if file_path.endswith(".json"):
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=4)
+        else:
+            content = self.to_prometheus()
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, file_path)
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Registro compartido por todo el proceso
+metrics = MetricsRegistry()
+
+# install_exporters solo registra la exportación una vez por proceso
+_exporters_installed = False
+
+
+class _Timer:
+    """Temporizador que registra la duración de un bloque ``with``."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+def timer(name: str):
+    """
+    Mide la duración de un bloque ``with``.
+
+    Args:
+        name: Nombre de la operación.
+
+    Returns:
+        Gestor de contexto que registra la duración (o que no hace nada si
+        las métricas están desactivadas).
+    """
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorador que mide cada llamada a una función.
+
+    Con las métricas desactivadas devuelve la función sin modificar.
+
+    Args:
+        name: Nombre de la operación.
+    """
+    def decorator(func: Callable) -> Callable:
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Incrementa un contador si las métricas están activadas."""
+    if METRICS_ENABLED:
+        metrics.increment(name, amount)
+
+
+def timed_handlers(cls: Optional[type] = None, *, extra: Iterable[str] = ()) -> Any:
+    """
+    Decorador de clase que mide los manejadores de eventos de una pantalla.
+
+    Se consideran manejadores los métodos públicos cuyo primer parámetro
+    (además de ``self``) se llama ``e``, como los que recibe Flet. Los que
+    se llaman desde una ``lambda`` con otros argumentos (por ejemplo, la fila
+    pulsada) se indican por nombre en ``extra``:
+    ``@timed_handlers(extra=("delete_platform",))``.
+    """
+    if cls is None:
+        return lambda cls: timed_handlers(cls, extra=extra)
+    if not METRICS_ENABLED:
+        return cls
+    import inspect
+    extra = set(extra)
+    for attribute, value in list(vars(cls).items()):
+        if attribute.startswith("_") or not inspect.isfunction(value):
+            continue
+        if attribute in extra or list(inspect.signature(value).parameters)[1:2] == ["e"]:
+            setattr(cls, attribute, timed(f"ui.{cls.__name__}.{attribute}")(value))
+    return cls
+
+
+def export_metrics(file_path: Optional[str] = None) -> None:
+    """
+    Exporta las métricas actuales.
+
+    Args:
+        file_path: Ruta de destino; por defecto la de MESSAGE_MANAGER_METRICS_FILE.
+    """
+    metrics.export(file_path or METRICS_FILE)
+
+
+def install_exporters() -> None:
+    """
+    Registra la exportación al terminar el proceso y, en POSIX, con SIGUSR1.
+
+    Debe llamarse desde el hilo principal (las señales solo se pueden
+    registrar ahí), antes de arrancar Flet. No hace nada si las métricas
+    están desactivadas o si ya se instalaron.
+    """
+    global _exporters_installed
+    if not METRICS_ENABLED or _exporters_installed:
+        return
+    _exporters_installed = True
+    atexit.register(export_metrics)
+    import signal
+    if hasattr(signal, "SIGUSR1"):
+        try:
+            signal.signal(signal.SIGUSR1, lambda signum, frame: export_metrics())
+        except ValueError:
+            # Solo el hilo principal puede registrar manejadores de señales
+            pass
@@ -1,27 +1,377 @@
 """
 Utilidades para la persistencia de datos en el gestor de mensajes.
 """
+import atexit
 import json
+import marshal
 import os
-from typing import Dict, Any
+import threading
+import time
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
+
+from models.template_models import TemplateBuilder
+from utils.file_lock import FileLock
+from utils.metrics import count, timed, timer
+
+# Operaciones de cambio que se pueden registrar sobre la biblioteca de plantillas.
+# Cada cambio es una tupla (operación, *argumentos):
+#   ("add_platform", plataforma)
+#   ("delete_platform", plataforma)
+#   ("delete_message_type", plataforma, tipo)
+#   ("save_template", plataforma, tipo, texto, campos)
+CHANGE_OPERATIONS = ("add_platform", "delete_platform", "delete_message_type", "save_template")
+
+
+def apply_change(templates_data: Dict[str, Any], change: Tuple) -> None:
+    """
+    Aplica un cambio sobre los datos de las plantillas.
+    
+    Cada operación fija o elimina una ruta concreta, por lo que volver a
+    aplicar una secuencia de cambios ya aplicada produce el mismo resultado.
+    
+    Args:
+        templates_data: Datos de las plantillas a modificar.
+        change: Cambio a aplicar.
+    
+    Raises:
+        ValueError: Si la operación no es conocida.
+    """
+    operation, *args = change
+    if operation == "add_platform":
+        templates_data.setdefault(args[0], {})
+    elif operation == "delete_platform":
+        templates_data.pop(args[0], None)
+    elif operation == "delete_message_type":
+        templates_data.get(args[0], {}).pop(args[1], None)
+    elif operation == "save_template":
+        platform_name, message_type, template_text, fields = args
+        templates_data.setdefault(platform_name, {})[message_type] = {
+            "template": template_text,
+            "fields": list(fields)
+        }
+    else:
+        raise ValueError(f"Operación de cambio desconocida: {operation}")
+
+
+def apply_builder_change(template_builder: TemplateBuilder, change: Tuple) -> None:
+    """
+    Aplica un cambio sobre un builder de plantillas.
+    
+    Equivale a ``apply_change`` pero usando los métodos del builder, que
+    guarda las plantillas como objetos en lugar de diccionarios.
+    
+    Args:
+        template_builder: Builder a modificar.
+        change: Cambio a aplicar.
+    
+    Raises:
+        ValueError: Si la operación no es conocida.
+    """
+    operation, *args = change
+    if operation == "add_platform":
+        template_builder.add_platform(args[0])
+    elif operation == "delete_platform":
+        template_builder.remove_platform(args[0])
+    elif operation == "delete_message_type":
+        template_builder.remove_message_type(args[0], args[1])
+    elif operation == "save_template":
+        template_builder.add_template(*args)
+    else:
+        raise ValueError(f"Operación de cambio desconocida: {operation}")
+
+
+# Tiempo que el hilo de escritura diferida espera para agrupar una ráfaga de cambios
+DEFAULT_WRITE_DELAY = 0.5
+
+# Espera máxima entre reintentos de una escritura diferida que falló
+MAX_RETRY_DELAY = 30.0
+
+# Con "0" no se usa la instantánea binaria que acelera la carga del archivo JSON
+SNAPSHOT_CACHE = os.environ.get("MESSAGE_MANAGER_SNAPSHOT", "1") == "1"
+
+# Versión del formato de la instantánea; cambiarla invalida las existentes
+SNAPSHOT_FORMAT = 1
+
+
+def write_json_atomic(file_path: str, data: Any) -> None:
+    """
+    Escribe un archivo JSON de forma atómica.
+    
+    Los datos se escriben en un archivo temporal que se sincroniza con el disco
+    y después reemplaza al original, así una caída a mitad de la escritura
+    nunca deja el archivo corrupto.
+    
+    Args:
+        file_path: Ruta del archivo de destino.
+        data: Datos a serializar.
+    """
+    with timer("storage.serialize_json"):
+        content = json.dumps(data, ensure_ascii=False, indent=4)
+    tmp_path = file_path + ".tmp"
+    with timer("storage.write_file"), open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class WriteBehindWriter:
+    """Hilo de escritura diferida que agrupa ráfagas de cambios en una sola escritura."""
+    
+    def __init__(self, storage: "TemplateStorage", delay: float = DEFAULT_WRITE_DELAY):
+        """
+        Inicializa el hilo de escritura.
+        
+        Args:
+            storage: Almacenamiento que realiza la escritura en disco.
+            delay: Segundos de espera para agrupar cambios antes de escribir.
+        """
+        self.storage = storage
+        self.delay = delay
+        self._condition = threading.Condition()
+        self._pending = None
+        self._requests = 0
+        # Cambios incluidos en los datos pendientes, o None si se guardaron
+        # datos completos sin cambio (entonces gana el estado en memoria)
+        self._changes: Optional[List[Tuple]] = []
+        self._writing = False
+        self._closed = False
+        # Escrituras fallidas seguidas; los datos siguen pendientes y se reintentan
+        self._failures = 0
+        
+        # Estadísticas
+        self._writes = 0
+        self._coalesced = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._last_latency = 0.0
+        
+        self._thread = threading.Thread(target=self._run, name="template-writer", daemon=True)
+        self._thread.start()
+        # Escribir lo pendiente al cerrar la aplicación
+        atexit.register(self.close)
+    
+    @property
+    def dirty(self) -> bool:
+        """Indica si hay datos pendientes o escribiéndose."""
+        with self._condition:
+            return self._pending is not None or self._writing
+    
+    @property
+    def failing(self) -> bool:
+        """Indica si la última escritura falló y los datos esperan un reintento."""
+        with self._condition:
+            return self._failures > 0
+    
+    def mark_dirty(self, templates_data: Dict[str, Any], change: Optional[Tuple] = None) -> bool:
+        """
+        Marca los datos como pendientes de escribir.
+        
+        Args:
+            templates_data: Datos completos de las plantillas.
+            change: Cambio que se acaba de aplicar a los datos, para poder
+                aplicarlo sobre la versión de otra instancia si escribió antes.
+        
+        Returns:
+            bool: False si la última escritura falló (los datos quedan
+            pendientes y se reintentan), True en caso contrario.
+        """
+        with self._condition:
+            self._pending = templates_data
+            self._requests += 1
+            if change is None or self._changes is None:
+                self._changes = None
+            else:
+                self._changes.append(change)
+            self._condition.notify_all()
+            return self._failures == 0
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Escribe de inmediato los datos pendientes y espera a que terminen.
+        
+        Returns:
+            bool: True si no quedan datos pendientes; False si la escritura
+            falló (siguen pendientes) o no terminó antes de ``timeout``.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._writing:
+                if not self._wait(deadline):
+                    return False
+            if self._pending is None:
+                return True
+            data, requests, changes = self._take_pending()
+        return self._write(data, requests, changes)
+    
+    def close(self) -> None:
+        """Escribe lo pendiente y detiene el hilo."""
+        if not self.flush():
+            print("No se pudieron guardar los cambios pendientes de las plantillas")
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+    
+    def stats(self) -> Dict[str, float]:
+        """Obtiene las estadísticas de escritura."""
+        with self._condition:
+            return {
+                "writes": self._writes,
+                "coalesced": self._coalesced,
+                "failures": self._failures,
+                "last_latency_ms": self._last_latency * 1000,
+                "avg_latency_ms": (self._total_latency / self._writes * 1000) if self._writes else 0.0,
+                "max_latency_ms": self._max_latency * 1000,
+            }
+    
+    def _wait(self, deadline: Optional[float]) -> bool:
+        if deadline is None:
+            self._condition.wait()
+            return True
+        remaining = deadline - time.monotonic()
+        return remaining > 0 and self._condition.wait(remaining)
+    
+    def _take_pending(self):
+        # Debe llamarse con el lock tomado
+        data, requests, changes = self._pending, self._requests, self._changes
+        self._pending = None
+        self._requests = 0
+        self._changes = []
+        self._writing = True
+        return data, requests, changes
+    
+    def _requeue(self, data, requests: int, changes: Optional[List[Tuple]]) -> None:
+        # Debe llamarse con el lock tomado. Lo encolado durante la escritura es
+        # más reciente: sus datos ganan y sus cambios van detrás de los fallidos
+        if self._pending is None:
+            self._pending = data
+        queued = self._changes
+        self._changes = None if changes is None or queued is None else changes + queued
+        self._requests += requests
+    
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                # Tras un fallo se reintenta cada vez más espaciado
+                delay = min(self.delay * 2 ** self._failures, MAX_RETRY_DELAY)
+            
+            # Esperar un poco para agrupar la ráfaga de cambios en una escritura
+            time.sleep(delay)
+            
+            with self._condition:
+                if self._pending is None or self._writing:
+                    continue
+                data, requests, changes = self._take_pending()
+            self._write(data, requests, changes)
+    
+    def _write(self, templates_data: Dict[str, Any], requests: int,
+               changes: Optional[List[Tuple]]) -> bool:
+        start = time.perf_counter()
+        saved = False
+        try:
+            with self.storage.lock():
+                if changes is not None and self.storage.modified_externally():
+                    # Otra instancia escribió desde nuestra última lectura o
+                    # escritura: partir de su versión con los cambios propios
+                    # aplicados, para no sobrescribir los suyos
+                    saved = self.storage.write_merged(changes)
+                else:
+                    # Copia de dos niveles: el hilo de la interfaz sigue
+                    # modificando los diccionarios mientras se serializan. Cada
+                    # copia es atómica; si se cuela un cambio a medias, ese cambio
+                    # vuelve a marcar los datos como pendientes y la siguiente
+                    # escritura lo corrige.
+                    snapshot = {
+                        platform: dict(message_types)
+                        for platform, message_types in list(templates_data.items())
+                    }
+                    saved = self.storage.write_templates(snapshot)
+        except Exception as e:
+            # Por ejemplo, si no se puede abrir el archivo de bloqueo; el hilo
+            # de escritura debe seguir vivo para reintentar
+            print(f"Error al guardar las plantillas: {e}")
+        finally:
+            latency = time.perf_counter() - start
+            with self._condition:
+                self._writing = False
+                if saved:
+                    self._failures = 0
+                    self._writes += 1
+                    self._coalesced += max(requests - 1, 0)
+                    self._total_latency += latency
+                    self._last_latency = latency
+                    self._max_latency = max(self._max_latency, latency)
+                else:
+                    # Los datos vuelven a quedar pendientes para el reintento
+                    self._requeue(templates_data, requests, changes)
+                    self._failures += 1
+                    count("storage.write_behind_failures")
+                self._condition.notify_all()
+        return saved
 
 
 class TemplateStorage:
     """Clase para gestionar la persistencia de las plantillas."""
     
-    def __init__(self, file_path: str = "templates_data.json"):
+    # Si es True, save_change solo usa el cambio y no necesita los datos completos
+    saves_changes_only = False
+    
+    def __init__(self, file_path: str = "templates_data.json", write_behind: bool = False,
+                 write_delay: float = DEFAULT_WRITE_DELAY, snapshot: bool = SNAPSHOT_CACHE):
         """
         Inicializa el almacenamiento de plantillas.
         
         Args:
             file_path: Ruta del archivo donde se guardarán las plantillas.
+            write_behind: Si es True, las escrituras se hacen en un hilo en
+                segundo plano que agrupa las ráfagas de cambios en una sola escritura.
+            write_delay: Segundos que el hilo de escritura espera para agrupar cambios.
+            snapshot: Si es True, se guarda junto al archivo JSON una instantánea
+                binaria que evita volver a analizar el JSON al arrancar.
         """
         self.file_path = file_path
+        # Copia derivada del JSON (que sigue siendo el original editable)
+        self.snapshot_path = file_path + ".snapshot" if snapshot else None
+        # Bloqueo compartido con otras instancias de la aplicación
+        self._file_lock = FileLock(file_path + ".lock")
+        # Firma del archivo tras la última escritura propia, para no confundirla
+        # con un cambio externo
+        self.written_signature = None
+        # Firma de la versión del archivo de la que parten los datos en memoria
+        # (la última leída o escrita por esta instancia)
+        self._base_signature = None
+        self._writer = WriteBehindWriter(self, write_delay) if write_behind else None
     
+    @timed("storage.save_templates")
     def save_templates(self, templates_data: Dict[str, Any]) -> bool:
         """
         Guarda los datos de las plantillas en un archivo JSON.
         
+        En modo de escritura diferida solo marca los datos como pendientes
+        y la escritura se hace en segundo plano.
+        
+        Args:
+            templates_data: Datos de las plantillas a guardar.
+            
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario. En
+            modo de escritura diferida, False si la última escritura en segundo
+            plano falló (los datos siguen pendientes y se reintentan).
+        """
+        if self._writer is not None:
+            return self._writer.mark_dirty(templates_data)
+        return self.write_templates(templates_data)
+    
+    @timed("storage.write_templates")
+    def write_templates(self, templates_data: Dict[str, Any]) -> bool:
+        """
+        Escribe los datos de las plantillas en disco de forma atómica.
+        
         Args:
             templates_data: Datos de las plantillas a guardar.
             
@@ -29,13 +379,133 @@ class TemplateStorage:
             bool: True si se guardó correctamente, False en caso contrario.
         """
         try:
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(templates_data, f, ensure_ascii=False, indent=4)
+            write_json_atomic(self.file_path, templates_data)
+            self.written_signature = self._base_signature = self.get_signature()
             return True
         except Exception as e:
             print(f"Error al guardar las plantillas: {e}")
             return False
     
+    def write_merged(self, changes: List[Tuple]) -> bool:
+        """
+        Aplica cambios sobre la versión del archivo en disco y la escribe.
+        
+        Se usa cuando otra instancia escribió desde la última lectura propia;
+        debe llamarse con ``lock()`` tomado.
+        
+        Args:
+            changes: Cambios propios que todavía no están en el archivo.
+            
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        templates_data = self.load_templates()
+        for change in changes:
+            apply_change(templates_data, change)
+        count("storage.write_behind_merges")
+        if not self.write_templates(templates_data):
+            return False
+        # Los datos en memoria no tienen los cambios de la otra instancia hasta
+        # que se vuelvan a cargar: la escritura no es propia (el repositorio
+        # recarga) y las siguientes también se aplican sobre el archivo
+        self.written_signature = self._base_signature = None
+        return True
+    
+    def modified_externally(self) -> bool:
+        """
+        Indica si otra instancia escribió el archivo desde la última lectura o
+        escritura propia.
+        
+        Debe llamarse con ``lock()`` tomado para que la respuesta siga siendo
+        válida hasta la escritura.
+        """
+        signature = self.get_signature()
+        return signature is not None and signature != self._base_signature
+    
+    @property
+    def has_pending_writes(self) -> bool:
+        """Indica si hay cambios pendientes de escribir en disco."""
+        return self._writer is not None and self._writer.dirty
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Escribe inmediatamente los cambios pendientes, si los hay.
+        
+        Returns:
+            bool: True si no quedan cambios pendientes.
+        """
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+    
+    def get_write_stats(self) -> Dict[str, float]:
+        """
+        Obtiene las estadísticas de escritura diferida.
+        
+        Returns:
+            Dict: Escrituras, peticiones agrupadas, fallos seguidos y latencias en milisegundos.
+        """
+        if self._writer is None:
+            return {}
+        return self._writer.stats()
+    
+    def save_change(self, templates_data: Dict[str, Any], change: Tuple) -> bool:
+        """
+        Guarda un cambio concreto de las plantillas.
+        
+        Este almacenamiento reescribe el archivo completo; otros almacenamientos
+        pueden registrar solo el cambio.
+        
+        Args:
+            templates_data: Datos completos de las plantillas, ya con el cambio aplicado.
+            change: Cambio realizado (ver CHANGE_OPERATIONS).
+            
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        if self._writer is not None:
+            return self._writer.mark_dirty(templates_data, change)
+        return self.save_templates(templates_data)
+    
+    def load_builder(self) -> TemplateBuilder:
+        """
+        Carga las plantillas en un builder.
+        
+        Returns:
+            TemplateBuilder: Builder con las plantillas guardadas (vacío si no hay ninguna).
+        """
+        return TemplateBuilder.from_dict(self.load_templates())
+    
+    def lock(self, shared: bool = False):
+        """
+        Bloqueo entre procesos sobre el archivo de plantillas.
+        
+        Se usa como ``with storage.lock():`` alrededor de una lectura,
+        modificación y escritura, para que otra instancia no escriba en medio.
+        
+        Args:
+            shared: Si es True, el bloqueo es compartido (solo lectura).
+        """
+        return self._file_lock(shared)
+    
+    def watched_paths(self) -> List[str]:
+        """Archivos cuyo cambio indica que otra instancia modificó las plantillas."""
+        return [self.file_path]
+    
+    def get_signature(self) -> Optional[Tuple[int, int]]:
+        """
+        Obtiene una firma del contenido persistido (fecha de modificación y tamaño).
+        
+        Returns:
+            Optional[Tuple[int, int]]: Firma del archivo o None si no existe.
+        """
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    @timed("storage.load_templates")
     def load_templates(self) -> Dict[str, Any]:
         """
         Carga los datos de las plantillas desde un archivo JSON.
@@ -47,8 +517,57 @@ class TemplateStorage:
             return {}
         
         try:
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with timer("storage.read_file"), open(self.file_path, 'rb') as f:
+                content = f.read()
+                stat = os.fstat(f.fileno())
+            self._base_signature = (stat.st_mtime_ns, stat.st_size)
+            
+            # La instantánea solo vale para este contenido exacto del JSON
+            key = None
+            if self.snapshot_path is not None:
+                key = (SNAPSHOT_FORMAT, stat.st_size, stat.st_mtime_ns, zlib.crc32(content))
+                templates_data = self._load_snapshot_cache(key)
+                if templates_data is not None:
+                    return templates_data
+            
+            with timer("storage.parse_json"):
+                templates_data = json.loads(content.decode('utf-8'))
+            if key is not None:
+                self._write_snapshot_cache(key, templates_data)
+            return templates_data
         except Exception as e:
             print(f"Error al cargar las plantillas: {e}")
             return {}
+    
+    @timed("storage.load_snapshot")
+    def _load_snapshot_cache(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        # Una instantánea obsoleta, corrupta o ilegible se ignora y se regenera.
+        # El archivo empieza por la clave serializada, así que basta comparar bytes
+        header = marshal.dumps(key)
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                content = f.read()
+            if not content.startswith(header):
+                count("storage.snapshot_stale")
+                return None
+            templates_data = marshal.loads(memoryview(content)[len(header):])
+        except (OSError, EOFError, ValueError, TypeError):
+            count("storage.snapshot_invalid")
+            return None
+        if not isinstance(templates_data, dict):
+            count("storage.snapshot_invalid")
+            return None
+        count("storage.snapshot_hits")
+        return templates_data
+    
+    def _write_snapshot_cache(self, key: Tuple, templates_data: Dict[str, Any]) -> None:
+        tmp_path = self.snapshot_path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(marshal.dumps(key))
+                f.write(marshal.dumps(templates_data))
+            os.replace(tmp_path, self.snapshot_path)
+        except (OSError, ValueError):
+            # La instantánea es solo una caché: si no se puede escribir se sigue
+            # sin ella y se vuelve a intentar en la próxima carga
+            count("storage.snapshot_write_failed")
@@ -0,0 +1,130 @@
+"""
+Planificador de la vista previa en tiempo real.
+
+Agrupa las pulsaciones rápidas en una sola actualización después de una ventana
+de espera (debounce) y evita renderizar o enviar cambios a la interfaz cuando
+ni los valores de entrada ni el resultado han cambiado.
+"""
+import math
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Iterator, Optional
+
+
+def _debounce_from_env(default_ms: float = 150) -> float:
+    # Un valor que no es un número no debe impedir que arranque la aplicación
+    try:
+        value = float(os.environ.get("MESSAGE_MANAGER_PREVIEW_DEBOUNCE_MS", default_ms))
+    except ValueError:
+        return default_ms / 1000
+    return value / 1000 if math.isfinite(value) else default_ms / 1000
+
+
+# Ventana de espera por defecto, configurable con una variable de entorno
+DEFAULT_DEBOUNCE_SECONDS = _debounce_from_env()
+
+_UNSET = object()
+
+
+class PreviewScheduler:
+    """Agrupa las peticiones de vista previa y aplica solo los cambios reales."""
+
+    def __init__(self, collect: Callable[[], Hashable],
+                 render: Callable[[Hashable], Any],
+                 apply: Callable[[Any], Any],
+                 delay: float = DEFAULT_DEBOUNCE_SECONDS):
+        """
+        Inicializa el planificador.
+
+        Args:
+            collect: Devuelve los valores de entrada actuales (deben ser comparables).
+            render: Genera la vista previa (o cualquier resultado comparable) a
+                partir de los valores de entrada; si devuelve None no se aplica nada.
+            apply: Muestra la vista previa en la interfaz.
+            delay: Ventana de espera en segundos; con 0 se renderiza de inmediato.
+        """
+        self.collect = collect
+        self.render = render
+        self.apply = apply
+        self.delay = delay
+        # También se mantiene mientras se aplica el resultado: dos ejecuciones
+        # (el temporizador y el hilo de la interfaz) no pueden mostrar sus
+        # resultados en desorden
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        # Aumenta con cada petición o cancelación: un temporizador que ya saltó
+        # pero quedó superado no debe aplicar su resultado
+        self._generation = 0
+        self._last_inputs = _UNSET
+        self._last_output = _UNSET
+
+    def schedule(self) -> None:
+        """Solicita una actualización; las peticiones dentro de la ventana se agrupan."""
+        if self.delay <= 0:
+            self.run_now()
+            return
+
+        with self._lock:
+            self._cancel()
+            self._timer = threading.Timer(self.delay, self._run_scheduled, args=(self._generation,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def run_now(self) -> None:
+        """Actualiza la vista previa inmediatamente, cancelando la pendiente."""
+        with self._lock:
+            self._cancel()
+            self._run()
+
+    def reset(self) -> None:
+        """
+        Cancela la actualización pendiente y olvida el último resultado.
+
+        Si hay una actualización en curso, espera a que termine.
+        """
+        with self._lock:
+            self._cancel()
+            self._last_inputs = _UNSET
+            self._last_output = _UNSET
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        """
+        Bloque en el que ninguna actualización puede ejecutarse.
+
+        Sirve para modificar desde fuera lo mismo que modifica ``apply`` (por
+        ejemplo, mostrar el mensaje final en la salida de la vista previa). Al
+        entrar se cancela la actualización pendiente, se espera a la que esté
+        en curso y se olvida el último resultado, como con ``reset``.
+        """
+        with self._lock:
+            self.reset()
+            yield
+
+    def _cancel(self) -> None:
+        # Debe llamarse con el lock tomado
+        self._generation += 1
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _run_scheduled(self, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._timer = None
+            self._run()
+
+    def _run(self) -> None:
+        # Debe llamarse con el lock tomado
+        inputs = self.collect()
+        if inputs == self._last_inputs:
+            return
+        self._last_inputs = inputs
+
+        output = self.render(inputs)
+        if output is None or output == self._last_output:
+            return
+        self._last_output = output
+        self.apply(output)
@@ -0,0 +1,318 @@
+"""
+Servicio HTTP local para generar mensajes con la biblioteca de plantillas.
+
+Servidor asyncio de la biblioteca estándar (sin Flet) que carga las plantillas
+una sola vez y atiende conexiones persistentes (keep-alive):
+
+    GET  /platforms                  → {"platforms": [...]}
+    GET  /platforms/{plataforma}/types → {"platform": ..., "types": [...]}
+    POST /render                     → {"message": ...}
+        cuerpo: {"platform": ..., "type": ..., "values": {...}}
+        o una lista de esos objetos para renderizar en lote:
+        → {"results": [{"message": ...} | {"error": ..., "missing": [...]}]}
+
+Las plantillas compiladas se guardan en caché y la biblioteca se vuelve a
+cargar cuando cambia el archivo de persistencia.
+
+Uso:
+    python -m utils.render_service --host 127.0.0.1 --port 8765
+"""
+import argparse
+import asyncio
+import json
+import sys
+from http import HTTPStatus
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from utils.batch_renderer import render_record
+from utils.metrics import count
+from utils.template_engine import TemplateEngine
+from utils.template_repository import STORAGE_BACKEND, TemplateRepository, create_storage
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Segundos entre comprobaciones de cambios en el archivo de persistencia
+RELOAD_INTERVAL = 1.0
+
+# Tamaño máximo del cuerpo de una petición
+MAX_BODY_SIZE = 8 * 1024 * 1024
+
+# Segundos que se mantiene abierta una conexión inactiva
+KEEP_ALIVE_TIMEOUT = 30.0
+
+
+class HTTPError(Exception):
+    """Error que se devuelve al cliente con un código de estado HTTP."""
+
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.payload = {"error": message}
+
+
+class RenderService:
+    """Servicio de renderizado respaldado por el repositorio de plantillas."""
+
+    def __init__(self, repository: TemplateRepository,
+                 reload_interval: float = RELOAD_INTERVAL):
+        """
+        Inicializa el servicio y carga la biblioteca.
+
+        Args:
+            repository: Repositorio con las plantillas.
+            reload_interval: Segundos entre comprobaciones de cambios en disco.
+        """
+        self.repository = repository
+        self.reload_interval = reload_interval
+        self.engine = TemplateEngine()
+        self.builder = repository.get_builder()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    # Lógica de las rutas, independiente del transporte
+
+    def list_platforms(self) -> Dict[str, Any]:
+        """Lista las plataformas de la biblioteca."""
+        return {"platforms": self.builder.get_platforms()}
+
+    def list_message_types(self, platform_name: str) -> Dict[str, Any]:
+        """Lista los tipos de mensaje de una plataforma."""
+        if platform_name not in self.builder.get_platforms():
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Plataforma desconocida: {platform_name}")
+        return {"platform": platform_name, "types": self.builder.get_message_types(platform_name)}
+
+    def render(self, request: Any) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        """
+        Renderiza una petición individual o un lote.
+
+        Args:
+            request: Objeto con "platform", "type" y "values", o una lista de ellos.
+
+        Returns:
+            Tuple: Código de estado y respuesta.
+        """
+        # Todo el lote se renderiza con la misma versión de la biblioteca,
+        # aunque el vigilante la recargue mientras tanto
+        library = self.builder.snapshot()
+        if isinstance(request, list):
+            # En un lote cada elemento informa de su propio error
+            results = [self._render_one(item, row, library)[1]
+                       for row, item in enumerate(request, start=1)]
+            return HTTPStatus.OK, {"results": results}
+        return self._render_one(request, 1, library)
+
+    def _render_one(self, request: Any, row: int, library) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        if not isinstance(request, dict):
+            return HTTPStatus.BAD_REQUEST, {"error": "Cada petición debe ser un objeto JSON"}
+        platform_name = request.get("platform")
+        message_type = request.get("type")
+        values = request.get("values", {})
+        if not isinstance(platform_name, str) or not isinstance(message_type, str):
+            return HTTPStatus.BAD_REQUEST, {"error": "Faltan 'platform' o 'type'"}
+        if not isinstance(values, dict):
+            return HTTPStatus.BAD_REQUEST, {"error": "'values' debe ser un objeto JSON"}
+
+        template_data = library.get_template(platform_name, message_type)
+        if not template_data:
+            return HTTPStatus.NOT_FOUND, {
+                "error": f"No hay plantilla para {platform_name} / {message_type}"
+            }
+
+        try:
+            compiled = self.engine.compile(platform_name, message_type, template_data.template)
+        except ValueError as e:
+            # Plantilla guardada con llaves desbalanceadas: solo falla este elemento
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {"error": f"Plantilla inválida: {e}"}
+        result = render_record(compiled, row, values)
+        count("service.renders")
+        if result.error is not None:
+            response: Dict[str, Any] = {"error": result.error}
+            if result.missing:
+                response["missing"] = list(result.missing)
+            return HTTPStatus.UNPROCESSABLE_ENTITY, response
+        return HTTPStatus.OK, {"message": result.message}
+
+    def dispatch(self, method: str, path: str, body: bytes) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        """
+        Atiende una petición HTTP ya leída.
+
+        Returns:
+            Tuple: Código de estado y respuesta JSON.
+        """
+        parts = [unquote(part) for part in urlsplit(path).path.strip("/").split("/")]
+
+        if parts == ["platforms"]:
+            self._require(method, "GET")
+            return HTTPStatus.OK, self.list_platforms()
+        if len(parts) == 3 and parts[0] == "platforms" and parts[2] == "types":
+            self._require(method, "GET")
+            return HTTPStatus.OK, self.list_message_types(parts[1])
+        if parts == ["render"]:
+            self._require(method, "POST")
+            try:
+                request = json.loads(body.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError) as e:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"JSON inválido: {e}")
+            return self.render(request)
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"Ruta desconocida: {path}")
+
+    @staticmethod
+    def _require(method: str, expected: str) -> None:
+        if method != expected:
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"Método no permitido: {method}")
+
+    # Transporte HTTP
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """Empieza a aceptar conexiones y a vigilar los cambios de la biblioteca."""
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        self._watcher = asyncio.create_task(self._watch_library())
+        return self._server
+
+    async def stop(self) -> None:
+        """Deja de aceptar conexiones."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _watch_library(self) -> None:
+        # Comprobar el archivo en un intervalo y no en cada petición; la lectura
+        # se hace fuera del bucle de eventos para no bloquear las conexiones
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                self.builder = await loop.run_in_executor(None, self.repository.get_builder)
+            except Exception as e:
+                print(f"Error al recargar las plantillas: {e}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        """Atiende las peticiones de una conexión hasta que se cierre."""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    break
+
+                method, path, version, headers, body, error = request
+                if error is not None:
+                    status, payload = error.status, error.payload
+                    keep_alive = False
+                else:
+                    try:
+                        status, payload = self.dispatch(method, path, body)
+                    except HTTPError as e:
+                        status, payload = e.status, e.payload
+                    except Exception as e:
+                        status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = (connection != "close" if version == "HTTP/1.1"
+                                  else connection == "keep-alive")
+
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        """
+        Lee una petición HTTP/1.x.
+
+        Returns:
+            Tupla (método, ruta, versión, cabeceras, cuerpo, error) o None si
+            el cliente cerró la conexión.
+        """
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                return None, None, None, {}, b"", HTTPError(HTTPStatus.BAD_REQUEST, "Petición incompleta")
+            return None
+        except asyncio.LimitOverrunError:
+            return None, None, None, {}, b"", HTTPError(
+                HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Cabeceras demasiado grandes")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, version = lines[0].split(" ", 2)
+        except ValueError:
+            return None, None, None, {}, b"", HTTPError(HTTPStatus.BAD_REQUEST, "Línea de petición inválida")
+
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            length = -1
+        if length < 0:
+            return method, path, version, headers, b"", HTTPError(
+                HTTPStatus.BAD_REQUEST, "Content-Length inválido")
+        if length > MAX_BODY_SIZE:
+            return method, path, version, headers, b"", HTTPError(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Cuerpo demasiado grande")
+
+        body = await reader.readexactly(length) if length else b""
+        return method, path, version, headers, body, None
+
+
+def _response(status: HTTPStatus, payload: Dict[str, Any], keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+async def serve(host: str, port: int, repository: TemplateRepository) -> None:
+    """Ejecuta el servicio hasta que se interrumpa."""
+    service = RenderService(repository)
+    server = await service.start(host, port)
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    print(f"Servicio de renderizado escuchando en {addresses}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Servicio HTTP de generación de mensajes")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Dirección en la que escuchar")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Puerto en el que escuchar")
+    parser.add_argument("--data", default="templates_data.json",
+                        help="Archivo de persistencia de las plantillas")
+    parser.add_argument("--storage", default=STORAGE_BACKEND,
+                        help="Tipo de almacenamiento (json, journal, sqlite o indexed)")
+    args = parser.parse_args(argv)
+
+    repository = TemplateRepository(create_storage(args.storage, args.data, write_behind=False))
+    try:
+        asyncio.run(serve(args.host, args.port, repository))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Búsqueda de texto completo sobre la biblioteca de plantillas.
+
+Mantiene un índice invertido de términos normalizados (minúsculas y sin tildes)
+a los tipos de mensaje (plataforma, tipo) que los contienen, construido a partir
+del texto de las plantillas, de los nombres y de los campos. El índice se
+actualiza de forma incremental con los mismos cambios que se guardan en el
+almacenamiento (ver ``CHANGE_OPERATIONS``).
+"""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from models.template_models import MessageTemplate
+
+DocumentKey = Tuple[str, str]
+
+# Peso de cada origen del término en la puntuación
+NAME_WEIGHT = 5.0
+PLATFORM_WEIGHT = 2.0
+FIELD_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+
+# Términos del vocabulario que puede expandir la última palabra buscada por prefijo
+MAX_PREFIX_EXPANSIONS = 64
+
+# Candidatos por resultado pedido que se puntúan antes de cortar la búsqueda
+CANDIDATE_FACTOR = 4
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Normaliza un texto a minúsculas y sin tildes ni diacríticos."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Divide un texto en términos normalizados.
+
+    Los nombres con guion bajo (como ``nombre_persona``) se indexan completos
+    y también por partes.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(fold(text)):
+        tokens.append(token)
+        if "_" in token:
+            tokens.extend(part for part in token.split("_") if part)
+    return tokens
+
+
+class TemplateSearchIndex:
+    """Índice invertido de términos a tipos de mensaje."""
+
+    def __init__(self):
+        """Inicializa el índice vacío."""
+        self._lock = threading.RLock()
+        # término → {(plataforma, tipo): peso}
+        self._postings: Dict[str, Dict[DocumentKey, float]] = defaultdict(dict)
+        # (plataforma, tipo) → {término: peso}, para poder eliminar documentos
+        self._documents: Dict[DocumentKey, Dict[str, float]] = {}
+        self._platform_documents: Dict[str, set] = defaultdict(set)
+        # término → documentos ordenados por peso, calculado al buscar
+        self._ranked_cache: Dict[str, List[Tuple[float, DocumentKey]]] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        # Versión de la biblioteca que refleja el índice (ver TemplateBuilder.version)
+        self.version: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @classmethod
+    def from_builder(cls, template_builder) -> "TemplateSearchIndex":
+        """
+        Construye el índice con todas las plantillas de un builder.
+
+        Returns:
+            TemplateSearchIndex: Índice con la biblioteca completa.
+        """
+        index = cls()
+        # Una sola instantánea: el índice corresponde a una versión concreta
+        library = template_builder.snapshot()
+        for platform in library.get_platforms():
+            for message_type in library.get_message_types(platform):
+                index.add_template(platform, message_type,
+                                   library.get_template(platform, message_type))
+        index.version = library.version
+        return index
+
+    def add_template(self, platform_name: str, message_type: str,
+                     template_data: Optional[MessageTemplate]) -> None:
+        """
+        Indexa (o vuelve a indexar) un tipo de mensaje.
+
+        Args:
+            platform_name: Nombre de la plataforma.
+            message_type: Tipo de mensaje.
+            template_data: Plantilla, o None si el tipo no tiene.
+        """
+        weights: Dict[str, float] = defaultdict(float)
+        for token in tokenize(message_type):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(platform_name):
+            weights[token] += PLATFORM_WEIGHT
+        if template_data:
+            for field in template_data.fields:
+                for token in tokenize(field):
+                    weights[token] += FIELD_WEIGHT
+            for token in tokenize(template_data.template):
+                weights[token] += BODY_WEIGHT
+
+        key = (platform_name, message_type)
+        with self._lock:
+            self._remove_document(key)
+            for token, weight in weights.items():
+                if token not in self._postings:
+                    self._vocabulary_dirty = True
+                self._ranked_cache.pop(token, None)
+                # Saturar la frecuencia evita que los textos largos dominen
+                self._postings[token][key] = 1.0 + math.log(weight)
+            self._documents[key] = dict(weights)
+            self._platform_documents[platform_name].add(key)
+
+    def remove_message_type(self, platform_name: str, message_type: str) -> None:
+        """Elimina un tipo de mensaje del índice."""
+        with self._lock:
+            self._remove_document((platform_name, message_type))
+
+    def remove_platform(self, platform_name: str) -> None:
+        """Elimina todos los tipos de mensaje de una plataforma del índice."""
+        with self._lock:
+            for key in list(self._platform_documents.get(platform_name, ())):
+                self._remove_document(key)
+            self._platform_documents.pop(platform_name, None)
+
+    def apply_change(self, change: Tuple) -> None:
+        """
+        Actualiza el índice con un cambio de la biblioteca.
+
+        Args:
+            change: Cambio realizado (ver CHANGE_OPERATIONS).
+        """
+        operation, *args = change
+        if operation == "delete_platform":
+            self.remove_platform(args[0])
+        elif operation == "delete_message_type":
+            self.remove_message_type(args[0], args[1])
+        elif operation == "save_template":
+            platform_name, message_type, template_text, fields = args
+            self.add_template(platform_name, message_type,
+                              MessageTemplate(template_text, fields))
+        # Agregar una plataforma vacía no añade nada que buscar
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, str, float]]:
+        """
+        Busca los tipos de mensaje que contienen todos los términos de la consulta.
+
+        La última palabra se interpreta también como prefijo, para poder buscar
+        mientras se escribe. Los candidatos se recorren en orden de relevancia
+        del término más selectivo y la búsqueda se corta al reunir suficientes
+        resultados, por lo que en consultas muy generales el orden es aproximado.
+
+        Args:
+            query: Texto a buscar.
+            limit: Número máximo de resultados.
+
+        Returns:
+            List: Tuplas (plataforma, tipo, puntuación) ordenadas por relevancia.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        with self._lock:
+            groups = [[token] for token in tokens[:-1]]
+            groups.append(self._expand_prefix(tokens[-1]))
+            groups = [[term for term in group if term in self._postings] for group in groups]
+            if not all(groups):
+                return []
+
+            total = len(self._documents)
+            idf = {
+                term: math.log(1.0 + total / len(self._postings[term]))
+                for group in groups for term in group
+            }
+
+            # Se recorren los documentos del grupo más selectivo en orden de
+            # relevancia y solo se consultan los demás grupos para esos candidatos
+            groups.sort(key=lambda group: sum(len(self._postings[term]) for term in group))
+            driver, others = groups[0], groups[1:]
+            candidates = heapq.merge(*[
+                ((-weight * idf[term], key) for weight, key in self._ranked(term))
+                for term in driver
+            ])
+
+            wanted = limit * CANDIDATE_FACTOR
+            seen = set()
+            results = []
+            for negative_score, key in candidates:
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                score = -negative_score
+                for group in others:
+                    best = max(self._postings[term].get(key, 0.0) * idf[term] for term in group)
+                    if not best:
+                        break
+                    score += best
+                else:
+                    results.append((score, key))
+                    if len(results) >= wanted:
+                        break
+
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return [(platform, message_type, score) for score, (platform, message_type) in results[:limit]]
+
+    def _ranked(self, term: str) -> List[Tuple[float, DocumentKey]]:
+        """Obtiene los documentos de un término ordenados por peso descendente."""
+        ranked = self._ranked_cache.get(term)
+        if ranked is None:
+            ranked = sorted(
+                ((weight, key) for key, weight in self._postings[term].items()),
+                key=lambda item: (-item[0], item[1])
+            )
+            self._ranked_cache[term] = ranked
+        return ranked
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        """Obtiene los términos del vocabulario que empiezan por el prefijo."""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+
+        terms = [prefix] if prefix in self._postings else []
+        position = bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and len(terms) < MAX_PREFIX_EXPANSIONS:
+            term = self._vocabulary[position]
+            if not term.startswith(prefix):
+                break
+            if term != prefix:
+                terms.append(term)
+            position += 1
+        return terms
+
+    def _remove_document(self, key: DocumentKey) -> None:
+        weights = self._documents.pop(key, None)
+        if weights is None:
+            return
+        for token in weights:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            self._ranked_cache.pop(token, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+        platform_documents = self._platform_documents.get(key[0])
+        if platform_documents is not None:
+            platform_documents.discard(key)
+
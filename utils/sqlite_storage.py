@@ -0,0 +1,393 @@
+"""
+Almacenamiento de plantillas en SQLite con consultas indexadas.
+
+Las plataformas, los tipos de mensaje y las plantillas se guardan en tablas
+separadas con un índice sobre (plataforma, tipo), de modo que las consultas del
+generador no necesitan cargar toda la biblioteca en memoria. La base de datos
+usa el modo WAL y cada modificación se ejecuta dentro de una transacción.
+
+Migración desde el archivo JSON:
+    python -m utils.sqlite_storage templates_data.json templates_data.db
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, List, Optional, Tuple
+
+from models.template_models import (
+    PLATFORM_ADDED, PLATFORM_REMOVED, TEMPLATE_CHANGED, TYPE_ADDED, TYPE_REMOVED,
+    MessageTemplate, TemplateEventSource, next_version
+)
+from utils.metrics import timed
+from utils.persistence import TemplateStorage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS platforms (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS message_types (
+    id INTEGER PRIMARY KEY,
+    platform_id INTEGER NOT NULL REFERENCES platforms(id) ON DELETE CASCADE,
+    name TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_message_types_platform_name
+    ON message_types(platform_id, name);
+CREATE TABLE IF NOT EXISTS templates (
+    message_type_id INTEGER PRIMARY KEY REFERENCES message_types(id) ON DELETE CASCADE,
+    template TEXT NOT NULL,
+    fields TEXT NOT NULL
+);
+"""
+
+
+class SQLiteTemplateStorage(TemplateStorage):
+    """Almacenamiento de plantillas en una base de datos SQLite."""
+
+    saves_changes_only = True
+
+    def __init__(self, file_path: str = "templates_data.db"):
+        """
+        Inicializa el almacenamiento y crea el esquema si no existe.
+
+        Args:
+            file_path: Ruta de la base de datos SQLite.
+        """
+        super().__init__(file_path)
+        self._lock = threading.RLock()
+        # Flet ejecuta los manejadores en varios hilos; el acceso se serializa con el lock
+        self._connection = sqlite3.connect(file_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Cierra la conexión con la base de datos."""
+        with self._lock:
+            self._connection.close()
+
+    # Escritura
+
+    @timed("storage.save_templates")
+    def save_templates(self, templates_data: Dict[str, Any]) -> bool:
+        """
+        Reemplaza todas las plantillas en una sola transacción.
+
+        Args:
+            templates_data: Datos de las plantillas a guardar.
+
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        try:
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM platforms")
+                for platform_name, message_types in templates_data.items():
+                    self._insert_platform(platform_name)
+                    for message_type, template_data in message_types.items():
+                        self._upsert_message_type(platform_name, message_type, template_data)
+            self.written_signature = self.get_signature()
+            return True
+        except Exception as e:
+            print(f"Error al guardar las plantillas: {e}")
+            return False
+
+    @timed("storage.save_change")
+    def save_change(self, templates_data: Dict[str, Any], change: Tuple) -> bool:
+        """
+        Aplica un único cambio en la base de datos dentro de una transacción.
+
+        Args:
+            templates_data: Datos completos de las plantillas (no se usan).
+            change: Cambio realizado (ver CHANGE_OPERATIONS).
+
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        operation, *args = change
+        try:
+            with self._lock, self._connection:
+                if operation == "add_platform":
+                    self._insert_platform(args[0])
+                elif operation == "delete_platform":
+                    self._connection.execute("DELETE FROM platforms WHERE name = ?", (args[0],))
+                elif operation == "delete_message_type":
+                    self._connection.execute(
+                        "DELETE FROM message_types WHERE platform_id = "
+                        "(SELECT id FROM platforms WHERE name = ?) AND name = ?",
+                        (args[0], args[1])
+                    )
+                elif operation == "save_template":
+                    platform_name, message_type, template_text, fields = args
+                    self._insert_platform(platform_name)
+                    self._upsert_message_type(platform_name, message_type, {
+                        "template": template_text,
+                        "fields": list(fields)
+                    })
+                else:
+                    raise ValueError(f"Operación de cambio desconocida: {operation}")
+            self.written_signature = self.get_signature()
+            return True
+        except Exception as e:
+            print(f"Error al guardar el cambio de plantillas: {e}")
+            return False
+
+    def _insert_platform(self, platform_name: str) -> None:
+        self._connection.execute(
+            "INSERT OR IGNORE INTO platforms (name) VALUES (?)", (platform_name,)
+        )
+
+    def _upsert_message_type(self, platform_name: str, message_type: str,
+                             template_data: Optional[Dict[str, Any]]) -> None:
+        self._connection.execute(
+            "INSERT OR IGNORE INTO message_types (platform_id, name) "
+            "SELECT id, ? FROM platforms WHERE name = ?",
+            (message_type, platform_name)
+        )
+        if not template_data:
+            # Tipo de mensaje todavía sin plantilla
+            return
+        self._connection.execute(
+            "INSERT OR REPLACE INTO templates (message_type_id, template, fields) "
+            "SELECT mt.id, ?, ? FROM message_types mt "
+            "JOIN platforms p ON p.id = mt.platform_id "
+            "WHERE p.name = ? AND mt.name = ?",
+            (template_data["template"], json.dumps(list(template_data["fields"]), ensure_ascii=False),
+             platform_name, message_type)
+        )
+
+    # Lectura
+
+    @timed("storage.load_templates")
+    def load_templates(self) -> Dict[str, Any]:
+        """
+        Carga toda la biblioteca como diccionario (compatible con el formato JSON).
+
+        Returns:
+            Dict: Datos de las plantillas cargados.
+        """
+        templates_data: Dict[str, Any] = {}
+        with self._lock:
+            for (platform_name,) in self._connection.execute(
+                    "SELECT name FROM platforms ORDER BY id"):
+                templates_data[platform_name] = {}
+            rows = self._connection.execute(
+                "SELECT p.name, mt.name, t.template, t.fields FROM message_types mt "
+                "JOIN platforms p ON p.id = mt.platform_id "
+                "LEFT JOIN templates t ON t.message_type_id = mt.id "
+                "ORDER BY mt.id"
+            ).fetchall()
+
+        for platform_name, message_type, template_text, fields in rows:
+            templates_data[platform_name][message_type] = _template_dict(template_text, fields)
+        return templates_data
+
+    def load_builder(self) -> "SQLiteTemplateBuilder":
+        """
+        Crea un builder que consulta la base de datos bajo demanda.
+
+        Returns:
+            SQLiteTemplateBuilder: Fachada compatible con TemplateBuilder.
+        """
+        return SQLiteTemplateBuilder(self)
+
+    def lock(self, shared: bool = False):
+        """SQLite ya coordina las escrituras de varios procesos con sus transacciones."""
+        return nullcontext()
+
+    def watched_paths(self) -> List[str]:
+        """Archivos cuyo cambio indica que otra instancia modificó las plantillas."""
+        return [self.file_path, self.file_path + "-wal"]
+
+    def get_signature(self) -> Optional[Tuple]:
+        """Obtiene la firma conjunta de la base de datos y de su archivo WAL."""
+        signatures = []
+        for path in (self.file_path, self.file_path + "-wal"):
+            try:
+                stat = os.stat(path)
+                signatures.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signatures.append(None)
+        return tuple(signatures)
+
+    def get_platforms(self) -> List[str]:
+        """Obtiene la lista de plataformas."""
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                "SELECT name FROM platforms ORDER BY id")]
+
+    def get_message_types(self, platform_name: str) -> List[str]:
+        """Obtiene los tipos de mensaje de una plataforma usando el índice."""
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                "SELECT mt.name FROM message_types mt "
+                "JOIN platforms p ON p.id = mt.platform_id "
+                "WHERE p.name = ? ORDER BY mt.id", (platform_name,))]
+
+    def get_template(self, platform_name: str, message_type: str) -> Optional[MessageTemplate]:
+        """Obtiene una plantilla por plataforma y tipo usando el índice."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT t.template, t.fields FROM message_types mt "
+                "JOIN platforms p ON p.id = mt.platform_id "
+                "LEFT JOIN templates t ON t.message_type_id = mt.id "
+                "WHERE p.name = ? AND mt.name = ?", (platform_name, message_type)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return MessageTemplate(row[0], json.loads(row[1]))
+
+
+def _template_dict(template_text: Optional[str], fields: Optional[str]) -> Dict:
+    if template_text is None:
+        return {}
+    return {"template": template_text, "fields": json.loads(fields)}
+
+
+class SQLiteTemplateBuilder(TemplateEventSource):
+    """Fachada compatible con TemplateBuilder respaldada por SQLite."""
+
+    # Los cambios se escriben en la base de datos al hacerse
+    persists_changes = True
+
+    def __init__(self, storage: SQLiteTemplateStorage):
+        """
+        Inicializa la fachada.
+
+        Args:
+            storage: Almacenamiento SQLite con las plantillas.
+        """
+        self.storage = storage
+        # Cambia con cada modificación hecha a través de esta fachada
+        self.version = next_version()
+        self._listeners = []
+
+    def snapshot(self) -> "SQLiteTemplateBuilder":
+        """
+        Cada consulta lee un estado confirmado de la base de datos, por lo que
+        la propia fachada hace de instantánea.
+        """
+        return self
+
+    def transaction(self) -> ContextManager:
+        """
+        Bloquea la fachada para hacer varias operaciones como una sola
+        (ver ``TemplateBuilder.transaction``).
+        """
+        return self.storage._lock
+
+    @property
+    def platforms(self) -> Dict[str, Any]:
+        """Biblioteca completa como diccionario (carga todas las plantillas)."""
+        return self.storage.load_templates()
+
+    def add_platform(self, platform_name: str) -> None:
+        """Añade una nueva plataforma."""
+        with self.storage._lock:
+            if platform_name in self.get_platforms():
+                return
+            if not self.storage.save_change({}, ("add_platform", platform_name)):
+                return
+            self.version = next_version()
+            self._emit(PLATFORM_ADDED, platform_name)
+
+    def add_message_type(self, platform_name: str, message_type: str) -> None:
+        """Añade un nuevo tipo de mensaje a una plataforma."""
+        with self.storage._lock:
+            new_platform = platform_name not in self.get_platforms()
+            if not new_platform and message_type in self.get_message_types(platform_name):
+                return
+            with self.storage._connection:
+                self.storage._insert_platform(platform_name)
+                self.storage._upsert_message_type(platform_name, message_type, None)
+            self.version = next_version()
+            if new_platform:
+                self._emit(PLATFORM_ADDED, platform_name)
+            self._emit(TYPE_ADDED, platform_name, message_type)
+
+    def add_template(self, platform_name: str, message_type: str,
+                     template_text: str, fields: List[str]) -> bool:
+        """Añade una nueva plantilla a un tipo de mensaje; devuelve True si se guardó."""
+        with self.storage._lock:
+            new_platform = platform_name not in self.get_platforms()
+            new_type = new_platform or message_type not in self.get_message_types(platform_name)
+            if not self.storage.save_change(
+                {}, ("save_template", platform_name, message_type, template_text, fields)
+            ):
+                return False
+            self.version = next_version()
+            if new_platform:
+                self._emit(PLATFORM_ADDED, platform_name)
+            self._emit(TYPE_ADDED if new_type else TEMPLATE_CHANGED, platform_name, message_type)
+            return True
+
+    def remove_platform(self, platform_name: str) -> bool:
+        """Elimina una plataforma con todos sus tipos de mensaje."""
+        with self.storage._lock:
+            if platform_name not in self.get_platforms():
+                return False
+            if not self.storage.save_change({}, ("delete_platform", platform_name)):
+                return False
+            self.version = next_version()
+            self._emit(PLATFORM_REMOVED, platform_name)
+            return True
+
+    def remove_message_type(self, platform_name: str, message_type: str) -> bool:
+        """Elimina un tipo de mensaje de una plataforma."""
+        with self.storage._lock:
+            if message_type not in self.get_message_types(platform_name):
+                return False
+            if not self.storage.save_change({}, ("delete_message_type", platform_name, message_type)):
+                return False
+            self.version = next_version()
+            self._emit(TYPE_REMOVED, platform_name, message_type)
+            return True
+
+    def get_template(self, platform_name: str, message_type: str) -> Optional[MessageTemplate]:
+        """Obtiene una plantilla por su plataforma y tipo de mensaje."""
+        return self.storage.get_template(platform_name, message_type)
+
+    def get_platforms(self) -> List[str]:
+        """Obtiene la lista de plataformas disponibles."""
+        return self.storage.get_platforms()
+
+    def get_message_types(self, platform_name: str) -> List[str]:
+        """Obtiene la lista de tipos de mensaje para una plataforma."""
+        return self.storage.get_message_types(platform_name)
+
+    def to_dict(self) -> Dict:
+        """Convierte la biblioteca a un diccionario para serialización."""
+        return self.storage.load_templates()
+
+
+def migrate_json_to_sqlite(json_path: str = "templates_data.json",
+                           db_path: str = "templates_data.db") -> int:
+    """
+    Migra las plantillas del archivo JSON a una base de datos SQLite.
+
+    Args:
+        json_path: Ruta del archivo JSON de origen.
+        db_path: Ruta de la base de datos de destino.
+
+    Returns:
+        int: Número de tipos de mensaje migrados.
+    """
+    templates_data = TemplateStorage(json_path).load_templates()
+    storage = SQLiteTemplateStorage(db_path)
+    try:
+        if not storage.save_templates(templates_data):
+            raise RuntimeError(f"No se pudo migrar '{json_path}' a '{db_path}'")
+    finally:
+        storage.close()
+    return sum(len(message_types) for message_types in templates_data.values())
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "templates_data.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else "templates_data.db"
+    migrated = migrate_json_to_sqlite(source, target)
+    print(f"{migrated} tipos de mensaje migrados de '{source}' a '{target}'")
@@ -0,0 +1,273 @@
+"""
+Motor de plantillas compiladas para el gestor de mensajes.
+
+Cada plantilla se analiza una sola vez con ``string.Formatter().parse`` y se
+convierte en un plan de renderizado (fragmentos literales y huecos de campo).
+Los planes se guardan en caché por plataforma, tipo de mensaje y hash del
+contenido, de modo que escribir en un campo no vuelve a analizar el texto.
+
+``SegmentRenderer`` conserva además la salida anterior como fragmentos, uno por
+literal o hueco del plan, y al cambiar un valor solo recalcula los huecos de
+ese campo: en plantillas de cientos de KB una pulsación cuesta lo que el campo,
+no lo que el documento. El texto completo solo se une cuando se pide.
+"""
+import hashlib
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import count, timed, timer
+
+_formatter = Formatter()
+
+
+class CompiledTemplate:
+    """Plan de renderizado de una plantilla: literales y huecos de campo."""
+
+    __slots__ = ("text", "parts", "slots", "fields")
+
+    def __init__(self, text: str):
+        """
+        Compila el texto de la plantilla.
+
+        Args:
+            text: Texto de la plantilla con variables en formato {variable}.
+
+        Raises:
+            ValueError: Si la plantilla tiene llaves mal formadas.
+        """
+        self.text = text
+        # Lista de fragmentos: los literales son str y los huecos se guardan
+        # como tuplas (nombre_campo, plantilla_compleja_o_None)
+        self.parts: List = []
+        # Posiciones de los huecos dentro de ``parts``
+        self.slots: List[int] = []
+        fields: List[str] = []
+
+        for literal, field_name, format_spec, conversion in _formatter.parse(text):
+            if literal:
+                self._append_literal(literal)
+            if field_name is None:
+                continue
+
+            name = field_base_name(field_name)
+            if name not in fields:
+                fields.append(name)
+
+            # Los huecos simples se sustituyen directamente; los que llevan
+            # conversión, especificación de formato o acceso a atributos
+            # se delegan en str.format con una mini-plantilla
+            if format_spec or conversion or name != field_name:
+                spec = "{" + field_name
+                if conversion:
+                    spec += "!" + conversion
+                if format_spec:
+                    spec += ":" + format_spec
+                spec += "}"
+                slot = (name, spec)
+            else:
+                slot = (name, None)
+
+            self.slots.append(len(self.parts))
+            self.parts.append(slot)
+
+        self.fields: Tuple[str, ...] = tuple(fields)
+
+    def _append_literal(self, literal: str) -> None:
+        # Une literales consecutivos (p. ej. al escapar llaves con {{ }})
+        if self.parts and isinstance(self.parts[-1], str):
+            self.parts[-1] += literal
+        else:
+            self.parts.append(literal)
+
+    @timed("template.render")
+    def render(self, values: Dict[str, str]) -> str:
+        """
+        Genera el mensaje con los valores indicados.
+
+        Args:
+            values: Valores de los campos de la plantilla.
+
+        Returns:
+            str: Mensaje generado.
+
+        Raises:
+            KeyError: Si falta un campo de la plantilla, igual que str.format.
+        """
+        if not self.slots:
+            return self.text
+
+        output = []
+        for part in self.parts:
+            if isinstance(part, str):
+                output.append(part)
+                continue
+
+            name, spec = part
+            if spec is None:
+                output.append(str(values[name]))
+            else:
+                output.append(spec.format(**values))
+        return "".join(output)
+
+
+class SegmentRenderer:
+    """Salida de una plantilla por fragmentos que se actualiza por campo."""
+
+    __slots__ = ("template", "segments", "revision", "_slots_by_field", "_values", "_text")
+
+    def __init__(self, template: CompiledTemplate, literal: bool = False):
+        """
+        Prepara los fragmentos de la plantilla con los huecos vacíos.
+
+        Args:
+            template: Plantilla compilada.
+            literal: Si es True el texto se muestra tal cual, sin huecos
+                (como ``render_message`` con las plantillas sin campos).
+        """
+        self.template = template
+        # Fragmentos de la salida en el mismo orden que ``template.parts``
+        self.segments: List[str] = (
+            [template.text] if literal
+            else [part if isinstance(part, str) else "" for part in template.parts]
+        )
+        # Aumenta cada vez que cambia algún fragmento
+        self.revision = 0
+        # Campo → posiciones de sus huecos (un campo puede aparecer varias veces)
+        self._slots_by_field: Dict[str, List[int]] = {}
+        if not literal:
+            for position in template.slots:
+                self._slots_by_field.setdefault(template.parts[position][0], []).append(position)
+        self._values: Dict[str, object] = {}
+        self._text: Optional[str] = template.text if literal else None
+
+    def update(self, values: Dict[str, str]) -> List[int]:
+        """
+        Recalcula solo los huecos de los campos cuyo valor cambió.
+
+        Args:
+            values: Valores de los campos de la plantilla.
+
+        Returns:
+            List[int]: Posiciones de los fragmentos que cambiaron.
+
+        Raises:
+            KeyError: Si falta un campo de la plantilla, igual que ``render``.
+        """
+        parts = self.template.parts
+        # Todo se calcula antes de tocar el estado: si falta un campo o falla
+        # un formato, el renderizador queda como estaba
+        new_values = {}
+        new_segments = {}
+        for name, positions in self._slots_by_field.items():
+            value = values[name]
+            if name in self._values and self._values[name] == value:
+                continue
+            new_values[name] = value
+            for position in positions:
+                spec = parts[position][1]
+                segment = str(value) if spec is None else spec.format(**values)
+                if segment != self.segments[position]:
+                    new_segments[position] = segment
+        self._values.update(new_values)
+        for position, segment in new_segments.items():
+            self.segments[position] = segment
+        changed = list(new_segments)
+        if changed:
+            self.revision += 1
+            self._text = None
+        return changed
+
+    @property
+    def text(self) -> str:
+        """Salida completa; se une una sola vez por revisión."""
+        if self._text is None:
+            self._text = "".join(self.segments)
+        return self._text
+
+
+def field_base_name(field_name: str) -> str:
+    """Obtiene el nombre del campo sin accesos a atributos ni índices."""
+    for i, char in enumerate(field_name):
+        if char in ".[":
+            return field_name[:i]
+    return field_name
+
+
+def template_hash(text: str) -> str:
+    """Calcula el hash del contenido de una plantilla."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class TemplateEngine:
+    """Caché de plantillas compiladas por plataforma, tipo y contenido."""
+
+    def __init__(self):
+        """Inicializa el motor con la caché vacía."""
+        self._cache: Dict[Tuple[str, str], Tuple[str, CompiledTemplate]] = {}
+
+    def compile(self, platform_name: str, message_type: str,
+                template_text: str) -> CompiledTemplate:
+        """
+        Obtiene el plan de renderizado de una plantilla, compilándolo si es necesario.
+
+        Args:
+            platform_name: Nombre de la plataforma.
+            message_type: Tipo de mensaje.
+            template_text: Texto actual de la plantilla.
+
+        Returns:
+            CompiledTemplate: Plantilla compilada.
+        """
+        key = (platform_name, message_type)
+        cached = self._cache.get(key)
+
+        # Comparar primero el texto evita calcular el hash en cada pulsación
+        if cached is not None and cached[1].text is template_text:
+            count("template_cache.hits")
+            return cached[1]
+
+        digest = template_hash(template_text)
+        if cached is not None and cached[0] == digest:
+            count("template_cache.hits")
+            return cached[1]
+
+        count("template_cache.misses")
+        with timer("template.compile"):
+            compiled = CompiledTemplate(template_text)
+        self._cache[key] = (digest, compiled)
+        return compiled
+
+    def get(self, template_builder, platform_name: str,
+            message_type: str) -> Optional[CompiledTemplate]:
+        """
+        Obtiene la plantilla compilada de un tipo de mensaje del builder.
+
+        Returns:
+            Optional[CompiledTemplate]: Plantilla compilada o None si no existe.
+        """
+        template_data = template_builder.get_template(platform_name, message_type)
+        if not template_data:
+            return None
+        return self.compile(platform_name, message_type, template_data.template)
+
+    def invalidate(self, platform_name: Optional[str] = None,
+                   message_type: Optional[str] = None) -> None:
+        """
+        Descarta planes de la caché.
+
+        Args:
+            platform_name: Plataforma a descartar; si es None se vacía toda la caché.
+            message_type: Tipo de mensaje a descartar; si es None se descartan
+                todos los tipos de la plataforma.
+        """
+        if platform_name is None:
+            self._cache.clear()
+        elif message_type is not None:
+            self._cache.pop((platform_name, message_type), None)
+        else:
+            for key in [k for k in self._cache if k[0] == platform_name]:
+                del self._cache[key]
+
+
+# Motor compartido por todas las pantallas de la aplicación
+template_engine = TemplateEngine()
@@ -1,30 +1,36 @@
 """
 Inicializador de plantillas predeterminadas para el gestor de mensajes.
 """
+from typing import Optional
+
 from models.template_models import TemplateBuilder
+from utils.metrics import timed
 from utils.persistence import TemplateStorage
 from templates import templates as default_templates
 
 
-def initialize_templates() -> TemplateBuilder:
+@timed("initialize_templates")
+def initialize_templates(storage: Optional[TemplateStorage] = None) -> TemplateBuilder:
     """
     Inicializa el builder de plantillas con las plantillas predeterminadas
     o las cargadas desde el archivo de persistencia.
     
+    Args:
+        storage: Almacenamiento de las plantillas; por defecto el archivo JSON.
+    
     Returns:
         TemplateBuilder: Builder con las plantillas inicializadas.
     """
     # Intentar cargar plantillas guardadas
-    storage = TemplateStorage()
-    saved_templates = storage.load_templates()
+    if storage is None:
+        storage = TemplateStorage()
+    builder = storage.load_builder()
     
-    if saved_templates:
+    if builder.get_platforms():
         # Si hay plantillas guardadas, usarlas
-        return TemplateBuilder.from_dict(saved_templates)
+        return builder
     else:
         # Si no hay plantillas guardadas, usar las predeterminadas
-        builder = TemplateBuilder()
-        
         # Convertir las plantillas predeterminadas al nuevo formato
         for platform, message_types in default_templates.items():
             builder.add_platform(platform)
@@ -37,7 +43,9 @@ def initialize_templates() -> TemplateBuilder:
                     fields=template_data["fields"]
                 )
         
-        # Guardar las plantillas predeterminadas
-        storage.save_templates(builder.to_dict())
+        # Guardar las plantillas predeterminadas (los builders que escriben
+        # directamente en el almacenamiento ya las guardaron)
+        if not getattr(builder, "persists_changes", False):
+            storage.save_templates(builder.to_dict())
         
         return builder
@@ -0,0 +1,380 @@
+"""
+Repositorio de plantillas compartido por todo el proceso.
+
+Mantiene un único ``TemplateBuilder`` en memoria para todas las pantallas y
+solo vuelve a leer el archivo de persistencia cuando cambia su fecha de
+modificación o su tamaño. Varias instancias de la aplicación pueden compartir
+el mismo archivo: las escrituras se hacen bajo un bloqueo entre procesos y,
+si otra instancia escribió antes, sus cambios se incorporan antes de guardar.
+"""
+import os
+import threading
+from typing import TYPE_CHECKING, Callable, List, Optional, Set, Tuple
+
+from models.template_models import TemplateBuilder
+from utils.metrics import timed
+from utils.persistence import TemplateStorage, apply_builder_change
+from utils.template_initializer import initialize_templates
+
+if TYPE_CHECKING:
+    from utils.file_watcher import FileWatcher
+    from utils.search_index import TemplateSearchIndex
+
+# Función a la que se avisa cuando las plantillas cambian en disco; recibe las
+# plataformas afectadas o None si no se sabe cuáles (hay que refrescar todo)
+ChangeListener = Callable[[Optional[Set[str]]], None]
+
+# Resultado de una carga de solo lectura que tiene que escribir las plantillas
+# predeterminadas y debe repetirse con el bloqueo exclusivo
+_NEEDS_DEFAULTS = object()
+
+# Tipo de almacenamiento: "json" reescribe el archivo completo en cada cambio,
+# "journal" anexa cada cambio a un diario que se compacta en segundo plano,
+# "sqlite" guarda las plantillas en una base de datos con consultas indexadas e
+# "indexed" carga solo un índice al arrancar y lee cada texto bajo demanda
+STORAGE_BACKEND = os.environ.get("MESSAGE_MANAGER_STORAGE", "json")
+
+# Con "1" el almacenamiento JSON escribe en segundo plano, agrupando ráfagas de cambios
+WRITE_BEHIND = os.environ.get("MESSAGE_MANAGER_WRITE_BEHIND", "0") == "1"
+
+
+def create_storage(backend: str = STORAGE_BACKEND,
+                   file_path: str = "templates_data.json",
+                   write_behind: bool = WRITE_BEHIND) -> TemplateStorage:
+    """
+    Crea el almacenamiento de plantillas indicado.
+
+    Args:
+        backend: Tipo de almacenamiento ("json", "journal", "sqlite" o "indexed").
+        file_path: Ruta del archivo de persistencia.
+        write_behind: Activa la escritura diferida del almacenamiento JSON.
+
+    Returns:
+        TemplateStorage: Almacenamiento de plantillas.
+
+    Raises:
+        ValueError: Si el tipo de almacenamiento no es conocido.
+    """
+    # Los demás almacenamientos se importan solo si se usan, para que el
+    # arranque con JSON no cargue sqlite3 ni mmap
+    if backend == "json":
+        return TemplateStorage(file_path, write_behind=write_behind)
+    if backend == "journal":
+        from utils.journal_storage import JournalTemplateStorage
+        return JournalTemplateStorage(file_path)
+    if backend == "sqlite":
+        from utils.sqlite_storage import SQLiteTemplateStorage, migrate_json_to_sqlite
+        db_path = os.path.splitext(file_path)[0] + ".db"
+        if not os.path.exists(db_path) and os.path.exists(file_path):
+            # Primera ejecución con SQLite: migrar la biblioteca JSON existente
+            migrate_json_to_sqlite(file_path, db_path)
+        return SQLiteTemplateStorage(db_path)
+    if backend == "indexed":
+        from utils.indexed_storage import IndexedTemplateStorage, migrate_json_to_indexed
+        index_path = os.path.splitext(file_path)[0] + ".idx"
+        if not os.path.exists(index_path) and os.path.exists(file_path):
+            # Primera ejecución con el formato indexado: convertir el archivo JSON
+            migrate_json_to_indexed(file_path, index_path)
+        return IndexedTemplateStorage(index_path)
+    raise ValueError(f"Tipo de almacenamiento desconocido: {backend}")
+
+
+class TemplateRepository:
+    """Repositorio en memoria que posee el builder de plantillas."""
+
+    def __init__(self, storage: Optional[TemplateStorage] = None):
+        """
+        Inicializa el repositorio sin cargar todavía las plantillas.
+
+        Args:
+            storage: Almacenamiento de las plantillas; por defecto el indicado
+                en la variable de entorno MESSAGE_MANAGER_STORAGE.
+        """
+        self.storage = storage or create_storage()
+        self._lock = threading.RLock()
+        self._builder: Optional[TemplateBuilder] = None
+        self._signature: Optional[Tuple] = None
+        self._search_index: Optional["TemplateSearchIndex"] = None
+        self._listeners: List[ChangeListener] = []
+        self._watcher: Optional["FileWatcher"] = None
+
+    def get_builder(self) -> TemplateBuilder:
+        """
+        Obtiene el builder compartido, recargándolo si el archivo cambió.
+
+        Returns:
+            TemplateBuilder: Builder con las plantillas actuales.
+        """
+        with self._lock:
+            if self._builder is None:
+                self.reload()
+            elif not self._is_current():
+                self.reload()
+            return self._builder
+
+    def _is_current(self) -> bool:
+        """Indica si el builder en memoria refleja el archivo de persistencia."""
+        if self.storage.has_pending_writes:
+            # Los cambios en memoria todavía no están en disco y son más recientes
+            return True
+        signature = self.storage.get_signature()
+        if signature == self._signature:
+            return True
+        if signature == self.storage.written_signature:
+            # El archivo cambió por una escritura propia (por ejemplo, en segundo plano)
+            self._signature = signature
+            return True
+        return False
+
+    @timed("repository.reload")
+    def reload(self) -> TemplateBuilder:
+        """
+        Vuelve a cargar las plantillas desde el almacenamiento.
+
+        El builder se actualiza en el mismo objeto para que quien ya lo tenga
+        vea los datos nuevos.
+
+        Returns:
+            TemplateBuilder: Builder con las plantillas recargadas.
+        """
+        with self._lock:
+            self._load_shared()
+            return self._builder
+
+    def _load_shared(self) -> Optional[Set[str]]:
+        """
+        Carga las plantillas con el bloqueo compartido.
+
+        Si el almacenamiento está vacío, el inicializador escribe las plantillas
+        predeterminadas, y eso solo puede hacerse con el bloqueo exclusivo (un
+        bloqueo compartido no se puede ampliar): se vuelve a cargar con él.
+
+        Returns:
+            Optional[Set[str]]: Igual que ``_load``.
+        """
+        with self.storage.lock(shared=True):
+            changed = self._load(read_only=True)
+        if changed is _NEEDS_DEFAULTS:
+            with self.storage.lock():
+                changed = self._load()
+        return changed
+
+    def _load(self, change: Optional[Tuple] = None, read_only: bool = False) -> Optional[Set[str]]:
+        """
+        Carga las plantillas del almacenamiento en el builder compartido.
+
+        Args:
+            change: Cambio propio que se vuelve a aplicar sobre lo cargado antes
+                de compararlo con el builder, para que no se emita como un cambio.
+            read_only: Si es True (con el bloqueo compartido) no se escribe nada:
+                si hay que crear las plantillas predeterminadas no se carga y se
+                devuelve ``_NEEDS_DEFAULTS``.
+
+        Returns:
+            Optional[Set[str]]: Plataformas que cambiaron respecto al builder
+            anterior, o None si se reemplazó el builder completo.
+        """
+        # La firma se toma antes de leer: si el archivo cambia durante la
+        # lectura, la siguiente consulta lo volverá a cargar
+        signature = self.storage.get_signature()
+        if read_only:
+            loaded = self.storage.load_builder()
+            if not loaded.get_platforms():
+                return _NEEDS_DEFAULTS
+        else:
+            loaded = initialize_templates(self.storage)
+        if change is not None:
+            apply_builder_change(loaded, change)
+        if signature is None:
+            # El inicializador acaba de crear el archivo con las predeterminadas
+            signature = self.storage.get_signature()
+        self._signature = signature
+
+        if (self._builder is None or type(self._builder) is not type(loaded)
+                or getattr(loaded, "persists_changes", False)):
+            self._builder = loaded
+            # El índice de búsqueda se reconstruye cuando se vuelva a usar
+            self._search_index = None
+            return None
+
+        # El builder emite a sus oyentes solo lo que cambió
+        new_platforms = loaded.platforms
+        changed = self._builder.replace_platforms(new_platforms)
+        if self._search_index is not None:
+            # Solo se vuelven a indexar las plataformas que cambiaron
+            for platform_name in changed:
+                self._search_index.remove_platform(platform_name)
+                for message_type, template_data in new_platforms.get(platform_name, {}).items():
+                    self._search_index.add_template(platform_name, message_type, template_data)
+            self._search_index.version = self._builder.version
+        return changed
+
+    def check_for_changes(self) -> bool:
+        """
+        Recarga las plantillas si otra instancia modificó el almacenamiento.
+
+        Los oyentes registrados con ``add_listener`` reciben las plataformas
+        afectadas, fuera de los bloqueos del repositorio.
+
+        Returns:
+            bool: True si había cambios y se recargaron.
+        """
+        with self._lock:
+            if self._builder is None or self._is_current():
+                return False
+            changed = self._load_shared()
+        if changed is not None and not changed:
+            # El archivo se reescribió con el mismo contenido
+            return False
+        self._notify(changed)
+        return True
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        """Registra una función a la que avisar cuando las plantillas cambian en disco."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: ChangeListener) -> None:
+        """Deja de avisar a una función registrada con ``add_listener``."""
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    @property
+    def listener_count(self) -> int:
+        """Número de funciones registradas con ``add_listener``."""
+        with self._lock:
+            return len(self._listeners)
+
+    def _notify(self, changed: Optional[Set[str]]) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(changed)
+            except Exception as e:
+                print(f"Error al notificar el cambio de las plantillas: {e}")
+
+    def start_watching(self) -> None:
+        """Vigila el almacenamiento y recarga cuando otra instancia lo modifica."""
+        with self._lock:
+            if self._watcher is None:
+                from utils.file_watcher import FileWatcher
+                self._watcher = FileWatcher(self.storage.watched_paths(), self.check_for_changes)
+                self._watcher.start()
+
+    def stop_watching(self) -> None:
+        """Detiene la vigilancia iniciada con ``start_watching``."""
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            watcher.stop()
+
+    @timed("repository.save")
+    def save(self, change: Optional[Tuple] = None) -> bool:
+        """
+        Guarda el estado actual del builder en el almacenamiento.
+
+        La escritura se hace bajo el bloqueo entre procesos del almacenamiento.
+        Si otra instancia modificó el archivo desde la última lectura, se
+        cargan sus cambios y se vuelve a aplicar ``change`` sobre ellos, para
+        no sobrescribirlos. Sin ``change`` gana el estado en memoria. Con la
+        escritura diferida la misma comprobación la hace el hilo de escritura,
+        bajo el bloqueo, justo antes de escribir los cambios agrupados.
+
+        Args:
+            change: Cambio que se acaba de aplicar al builder (ver
+                ``CHANGE_OPERATIONS``); permite a los almacenamientos que lo
+                soportan guardar solo ese cambio.
+
+        Returns:
+            bool: True si se guardó correctamente, False en caso contrario.
+        """
+        changed: Optional[Set[str]] = set()
+        with self._lock:
+            if self._builder is None:
+                return False
+            if getattr(self._builder, "persists_changes", False):
+                # El builder ya escribió el cambio en el almacenamiento
+                saved = True
+            else:
+                with self.storage.lock():
+                    if change is not None and not self._is_current():
+                        # Otra instancia escribió antes: partir de su versión
+                        # con el cambio propio aplicado (solo se avisa de los
+                        # cambios de la otra instancia)
+                        changed = self._load(change)
+                    if change is None:
+                        saved = self.storage.save_templates(self._builder.to_dict())
+                    else:
+                        # Convertir toda la biblioteca solo si el almacenamiento la usa
+                        templates_data = {} if self.storage.saves_changes_only else self._builder.to_dict()
+                        saved = self.storage.save_change(templates_data, change)
+                    if saved:
+                        # Nuestra propia escritura no debe provocar una recarga
+                        self._signature = self.storage.get_signature()
+            if self._search_index is not None:
+                if change is None:
+                    self._search_index = None
+                else:
+                    self._search_index.apply_change(change)
+                    self._search_index.version = self._builder.version
+        if changed is None or changed:
+            self._notify(changed)
+        return saved
+
+    def get_search_index(self) -> "TemplateSearchIndex":
+        """
+        Obtiene el índice de búsqueda de la biblioteca, construyéndolo la primera vez.
+
+        El índice se reconstruye si el builder tiene cambios que no pasaron por
+        ``save`` (su versión ya no coincide con la del índice). La construcción
+        se hace sobre una instantánea y fuera del bloqueo del repositorio, para
+        no detener las cargas ni los guardados mientras tanto.
+
+        Returns:
+            TemplateSearchIndex: Índice actualizado con los cambios guardados.
+        """
+        with self._lock:
+            builder = self.get_builder()
+            if self._search_index is not None and self._search_index.version == builder.version:
+                return self._search_index
+            library = builder.snapshot()
+
+        # Solo la búsqueda del generador necesita el índice
+        from utils.search_index import TemplateSearchIndex
+        index = TemplateSearchIndex.from_builder(library)
+
+        with self._lock:
+            # Si la biblioteca cambió mientras tanto, el índice sirve para esta
+            # búsqueda pero no se guarda: la siguiente lo vuelve a construir
+            if self._builder is builder and builder.version == index.version:
+                self._search_index = index
+        return index
+
+    def flush(self) -> bool:
+        """
+        Escribe en disco los cambios pendientes del almacenamiento.
+
+        Returns:
+            bool: True si no quedan cambios pendientes.
+        """
+        return self.storage.flush()
+
+
+_repository: Optional[TemplateRepository] = None
+_repository_lock = threading.Lock()
+
+
+def get_repository() -> TemplateRepository:
+    """
+    Obtiene el repositorio de plantillas compartido por el proceso.
+
+    Returns:
+        TemplateRepository: Repositorio único de la aplicación.
+    """
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = TemplateRepository()
+        return _repository